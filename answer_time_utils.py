@@ -0,0 +1,102 @@
+import atexit
+import queue
+import threading
+import time
+
+from cache_utils import TTLCache
+from config import ANSWER_TIME_BATCH_SIZE, ANSWER_TIME_FLUSH_INTERVAL, ANSWER_TIME_TTL, SPEED_BONUS_MAX, \
+    SPEED_BONUS_WINDOW
+from db_utils import add_answer_times
+
+# the time each question was served, kept in memory so that checking an answer doesn't need a db request for it.
+# Room questions are served to all the players at once, so they are kept under (None, question_id)
+_served_at = TTLCache(max_size=100000, ttl=ANSWER_TIME_TTL)
+
+
+def question_served(game_id, question_id):
+    """remembers when the question was served to the player"""
+    _served_at.set((game_id, question_id), time.time())
+
+
+def time_taken(game_id, question_id):
+    """returns (served_at, seconds) the player took to answer the question, served_at and seconds are None
+    if the question wasn't served by this app process, or too long ago"""
+    served_at = _served_at.get((game_id, question_id))
+    if served_at is None:
+        served_at = _served_at.get((None, question_id))
+    if served_at is None:
+        return None, None
+    return served_at, max(0.0, time.time() - served_at)
+
+
+def speed_points(seconds):
+    """returns the bonus points for a correct answer given after `seconds`, SPEED_BONUS_MAX for an instant answer,
+    going down to 0 for an answer that took SPEED_BONUS_WINDOW seconds or more"""
+    if seconds is None or seconds >= SPEED_BONUS_WINDOW:
+        return 0
+    return round(SPEED_BONUS_MAX * (1 - seconds / SPEED_BONUS_WINDOW))
+
+
+class AnswerTimeWriter:
+    """Writes answer times to the db in a background thread, in batches of up to `batch_size` rows at least
+    every `flush_interval` seconds, so that checking an answer never waits for this write"""
+
+    def __init__(self, batch_size=ANSWER_TIME_BATCH_SIZE, flush_interval=ANSWER_TIME_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def add(self, row):
+        """queues one (game_id, question_id, served_at, answered_at, is_correct) row"""
+        self.rows.put(row)
+        if self.thread is None:
+            self._start()
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _take_batch(self, timeout):
+        """waits up to `timeout` seconds for the first row, then takes whatever else is queued up to batch_size"""
+        batch = []
+        try:
+            batch.append(self.rows.get(timeout=timeout))
+            while len(batch) < self.batch_size:
+                batch.append(self.rows.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        try:
+            add_answer_times(batch)
+        except Exception as e:
+            # the times are only for analytics, so a failed batch is dropped rather than retried forever
+            print(f"Failed to write {len(batch)} answer times. Error: {e}")
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(self.flush_interval)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """writes everything that is queued straight away"""
+        batch = self._take_batch(0)
+        while batch:
+            self._write(batch)
+            batch = self._take_batch(0)
+
+
+_writer = AnswerTimeWriter()
+# the rows still queued when the app stops are written before it exits
+atexit.register(_writer.flush)
+
+
+def answer_received(game_id, question_id, served_at, is_correct):
+    """queues the answer time of the question to be written to the db in the background"""
+    _writer.add((game_id, question_id, served_at, time.time(), is_correct))
@@ -0,0 +1,78 @@
+import html
+import re
+import unicodedata
+
+from config import ANSWER_MAX_TYPOS, ANSWER_TYPO_MIN_LENGTH
+
+# words that don't change the answer when they start it, "The Beatles" is the same answer as "Beatles"
+_ARTICLES = ("the", "a", "an")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_DIGIT = re.compile(r"\d")
+
+
+def normalize_answer(answer):
+    """returns the form of an answer that is compared when answers are checked: HTML entities decoded, accents
+    removed, case folded, punctuation removed, a leading article removed and the spaces collapsed,
+    e.g. "The  Beyoncé!" and "beyonce" give the same normalized answer"""
+    text = unicodedata.normalize("NFKD", html.unescape(answer))
+    # NFKD splits an accented letter into the letter and the accent, which is dropped
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    words = _WHITESPACE.split(text.strip())
+    if len(words) > 1 and words[0] in _ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+def within_edit_distance(first, second, max_distance):
+    """checks if the Levenshtein distance between the two strings is at most max_distance, only the cells of the
+    distance table near the diagonal are worked out and it stops as soon as a row is over max_distance,
+    so it is O(len * max_distance) instead of O(len * len)"""
+    if abs(len(first) - len(second)) > max_distance:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    too_far = max_distance + 1
+    previous = [column if column <= max_distance else too_far for column in range(len(second) + 1)]
+    for row in range(1, len(first) + 1):
+        current = [too_far] * (len(second) + 1)
+        if row <= max_distance:
+            current[0] = row
+        start, end = max(1, row - max_distance), min(len(second), row + max_distance)
+        for column in range(start, end + 1):
+            cost = 0 if first[row - 1] == second[column - 1] else 1
+            current[column] = min(previous[column] + 1, current[column - 1] + 1, previous[column - 1] + cost,
+                                  too_far)
+        if min(current) > max_distance:
+            return False
+        previous = current
+    return previous[len(second)] <= max_distance
+
+
+def _exact_form(answer):
+    """returns the answer with only HTML entities decoded, case folded and spaces collapsed, for answers
+    whose options can't be told apart once the punctuation is removed"""
+    return " ".join(html.unescape(answer).casefold().split())
+
+
+def answers_match(user_answer, normalized_answer, max_typos=ANSWER_MAX_TYPOS, incorrect_answers=(),
+                  correct_answer=None):
+    """checks the player's answer against the normalized correct answer, which is worked out once when the question
+    is added. Longer answers may have up to max_typos typos, but answers with numbers have to be exact,
+    as 1945 and 1946 are different answers. An answer that is one of the incorrect_answers of the question once
+    normalized is always wrong, even if it is only a typo away from the correct one, e.g. "Russia" when the answer
+    is "Prussia". When an incorrect answer normalizes to the same as the correct one, e.g. "C#" and "C++" or "1"
+    and "-1", punctuation matters, so only the correct_answer itself (but for case and spaces) is right
+    """
+    normalized_user_answer = normalize_answer(user_answer)
+    normalized_incorrect = {normalize_answer(answer) for answer in incorrect_answers}
+    if normalized_answer in normalized_incorrect:
+        return correct_answer is not None and _exact_form(user_answer) == _exact_form(correct_answer)
+    if normalized_user_answer in normalized_incorrect:
+        return False
+    if normalized_user_answer == normalized_answer:
+        return True
+    if max_typos <= 0 or len(normalized_answer) < ANSWER_TYPO_MIN_LENGTH or _DIGIT.search(normalized_answer):
+        return False
+    return within_edit_distance(normalized_user_answer, normalized_answer, max_typos)
@@ -1,6 +1,336 @@
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limit_utils import TokenBucket
+from config import API_CONNECT_TIMEOUT, API_READ_TIMEOUT, API_MAX_RETRIES, API_BACKOFF_FACTOR, API_POOL_SIZE, \
+    API_RATE_LIMIT, API_RATE_LIMIT_MAX_WAIT, API_BREAKER_FAILURE_THRESHOLD, API_BREAKER_RESET_TIMEOUT, \
+    API_FALLBACK_CACHE_SIZE, API_BATCH_SIZE, API_POOL_LOW_WATER
+
+API_URL = "https://opentdb.com/api.php"
+API_TOKEN_URL = "https://opentdb.com/api_token.php"
+
+# values of the "response_code" field returned by Open Trivia DB
+RESPONSE_SUCCESS = 0
+RESPONSE_NO_RESULTS = 1
+RESPONSE_INVALID_PARAMETER = 2
+RESPONSE_TOKEN_NOT_FOUND = 3
+RESPONSE_TOKEN_EMPTY = 4
+RESPONSE_RATE_LIMIT = 5
+
+
+# category ids used by Open Trivia DB
+CATEGORIES = range(9, 33)
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, response_code=None):
+        super().__init__(message)
+        self.response_code = response_code
+
+
+class CircuitBreaker:
+    """Stops calling the API after `failure_threshold` failures in a row,
+    and lets one trial request through once `reset_timeout` seconds have passed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # let a single trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def _create_session():
+    """creates a requests session with a pool of keep-alive connections,
+    connection errors and 5xx responses are retried with exponential backoff"""
+    retry = Retry(
+        total=API_MAX_RETRIES,
+        backoff_factor=API_BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session = _create_session()
+_rate_limiter = TokenBucket(API_RATE_LIMIT)
+_circuit_breaker = CircuitBreaker(API_BREAKER_FAILURE_THRESHOLD, API_BREAKER_RESET_TIMEOUT)
+# (category, question) of the questions of earlier successful responses, used when the API can't be reached.
+# The API gives the category of a question as its name, so the category id asked for in the url is kept with it,
+# None if the questions were of any category
+_fallback_questions = deque(maxlen=API_FALLBACK_CACHE_SIZE)
+# questions fetched from the API but not given to a game yet, one pool per (category, difficulty) bucket
+_question_pools = {}
+_pool_locks = {}
+_pools_lock = threading.Lock()
+# the thread that fills the pools the app starts with, started once per process
+_prefill_thread = None
+_prefill_lock = threading.Lock()
+# session token shared by all games, so the API doesn't send us the same question twice
+_session_token = None
+_token_lock = threading.Lock()
+
+
+def _request_token(params):
+    """makes a request to the token endpoint of the API and returns the token"""
+    response = _session.get(API_TOKEN_URL, params=params, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+    response.raise_for_status()
+    data = response.json()
+    if data.get("response_code") != RESPONSE_SUCCESS:
+        raise ApiError(f"Token request returned response code {data.get('response_code')}")
+    return data["token"]
+
+
+def get_session_token():
+    """returns the current session token, requests a new one from the API if there is none,
+    returns None if the API can't give us a token (questions are then fetched without one)"""
+    global _session_token
+    with _token_lock:
+        if _session_token is None:
+            try:
+                _session_token = _request_token({"command": "request"})
+                print("New API session token acquired")
+            except (requests.RequestException, ValueError, ApiError) as exc:
+                print(f"Failed to get session token from API. Error: {exc}")
+        return _session_token
+
+
+def reset_session_token(token):
+    """resets the token once all the questions for it were used, so the API starts handing out questions again,
+    returns the token to use from now on"""
+    global _session_token
+    with _token_lock:
+        # another thread may have already replaced the token
+        if token is not None and _session_token == token:
+            try:
+                _session_token = _request_token({"command": "reset", "token": token})
+                print("API session token reset")
+            except (requests.RequestException, ValueError, ApiError) as exc:
+                print(f"Failed to reset session token. Error: {exc}")
+                _session_token = None
+        return _session_token
+
+
+def _forget_session_token(token):
+    """drops a token the API doesn't know anymore (tokens expire after 6 hours of inactivity)"""
+    global _session_token
+    with _token_lock:
+        if _session_token == token:
+            _session_token = None
+
+
+def _fetch(url, use_token=True):
+    """makes the request to the API, waiting for the rate limiter and retrying when the API says we are rate
+    limited or the session token has to be replaced, returns the json data"""
+    token = get_session_token() if use_token else None
+    for attempt in range(API_MAX_RETRIES + 1):
+        if not _rate_limiter.acquire(timeout=API_RATE_LIMIT_MAX_WAIT):
+            raise ApiError("Rate limit reached, request was not sent")
+
+        params = {"token": token} if token else None
+        response = _session.get(url, params=params, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+        if response.status_code == 429:
+            print(f"API rate limit reached, attempt {attempt + 1}")
+            continue
+        response.raise_for_status()
+
+        data = response.json()
+        response_code = data.get("response_code", RESPONSE_SUCCESS)
+        if response_code == RESPONSE_RATE_LIMIT:
+            print(f"API rate limit reached, attempt {attempt + 1}")
+            continue
+        if response_code == RESPONSE_TOKEN_NOT_FOUND:
+            _forget_session_token(token)
+            token = get_session_token()
+            continue
+        if response_code == RESPONSE_TOKEN_EMPTY:
+            token = reset_session_token(token)
+            continue
+        if response_code != RESPONSE_SUCCESS:
+            raise ApiError(f"API returned response code {response_code}", response_code)
+        return data
+
+    raise ApiError("Failed to get questions from API, no retries left")
+
+
+def _get_amount(url):
+    """returns the number of questions asked for in the url"""
+    query = parse_qs(urlparse(url).query)
+    return int(query.get("amount", ["10"])[0])
+
+
+def _get_difficulty(url):
+    """returns the difficulty asked for in the url, or None"""
+    query = parse_qs(urlparse(url).query)
+    return query.get("difficulty", [None])[0]
+
+
+def _get_category(url):
+    """returns the category id asked for in the url, or None"""
+    query = parse_qs(urlparse(url).query)
+    category = query.get("category", [None])[0]
+    return None if category is None else int(category)
+
+
+def _get_fallback_questions(amount, category=None, difficulty=None):
+    """returns up to `amount` questions of the category and difficulty from the local cache in the same format
+    as the API response, raises ApiError if there are none, rather than giving a game questions of another category"""
+    cached_questions = [question for question_category, question in _fallback_questions
+                        if (category is None or question_category == category)
+                        and (difficulty is None or question.get("difficulty") == difficulty)]
+    if not cached_questions:
+        raise ApiError("API is unavailable and there are no cached questions")
+    amount = min(amount, len(cached_questions))
+    return {"response_code": RESPONSE_SUCCESS, "results": random.sample(cached_questions, amount)}
+
+
+def get_questions_from_api(url, use_token=True):
+    """makes a request to the trivia API and returns the json data,
+    if the API is down or keeps failing, returns locally cached questions instead"""
+    if not _circuit_breaker.allow_request():
+        print("Trivia API is unavailable, using cached questions")
+        return _get_fallback_questions(_get_amount(url), _get_category(url), _get_difficulty(url))
+
+    try:
+        data = _fetch(url, use_token)
+    except ApiError as exc:
+        if exc.response_code in (RESPONSE_NO_RESULTS, RESPONSE_INVALID_PARAMETER):
+            # the API is up, it just doesn't have what was asked for
+            _circuit_breaker.record_success()
+            raise
+        print(f"Failed to get questions from API. Error: {exc}")
+        _circuit_breaker.record_failure()
+        return _get_fallback_questions(_get_amount(url), _get_category(url), _get_difficulty(url))
+    except (requests.RequestException, ValueError) as exc:
+        print(f"Failed to get questions from API. Error: {exc}")
+        _circuit_breaker.record_failure()
+        return _get_fallback_questions(_get_amount(url), _get_category(url), _get_difficulty(url))
+
+    _circuit_breaker.record_success()
+    category = _get_category(url)
+    _fallback_questions.extend((category, question) for question in data["results"])
+    return data
+
+
+def _build_url(amount, category=None, difficulty=None):
+    """returns the API url for `amount` multiple choice questions of the given category and difficulty"""
+    url = f"{API_URL}?amount={amount}&type=multiple"
+    if category is not None:
+        url += f"&category={category}"
+    if difficulty is not None:
+        url += f"&difficulty={difficulty}"
+    return url
+
+
+def _get_pool(bucket):
+    """returns the question pool and its lock for a (category, difficulty) bucket, creates them if needed"""
+    with _pools_lock:
+        if bucket not in _question_pools:
+            _question_pools[bucket] = deque()
+            _pool_locks[bucket] = threading.Lock()
+        return _question_pools[bucket], _pool_locks[bucket]
+
+
+def _fill_pool(pool, bucket, needed):
+    """fetches a batch of questions for the bucket from the API, the pool's lock must be held by the caller"""
+    category, difficulty = bucket
+    try:
+        data = get_questions_from_api(_build_url(max(needed, API_BATCH_SIZE), category, difficulty))
+    except ApiError as exc:
+        if exc.response_code != RESPONSE_NO_RESULTS or needed >= API_BATCH_SIZE:
+            raise
+        # small categories don't have a full batch of questions, so only ask for what is needed
+        data = get_questions_from_api(_build_url(needed, category, difficulty))
+    pool.extend(data["results"])
+
+
+def _refill_pools(buckets):
+    """tops up the pools of the given buckets that are running low"""
+    for bucket in buckets:
+        pool, lock = _get_pool(bucket)
+        with lock:
+            if len(pool) >= API_POOL_LOW_WATER:
+                continue
+            try:
+                _fill_pool(pool, bucket, API_BATCH_SIZE)
+            except Exception as exc:
+                print(f"Failed to fill question pool {bucket}. Error: {exc}")
+
+
+def prefill_question_pools(buckets):
+    """fills the pools of the given (category, difficulty) buckets in a background thread,
+    so the first games of those buckets don't have to wait for the API"""
+    thread = threading.Thread(target=_refill_pools, args=(list(buckets),), daemon=True)
+    thread.start()
+    return thread
+
+
+def prefill_question_pools_once(buckets):
+    """fills the pools of the given buckets in the background the first time it is called in the process,
+    later calls do nothing. The app calls it on its first request rather than when it is imported, as a server
+    that forks its worker processes after importing the app (e.g. gunicorn --preload) doesn't keep the threads"""
+    global _prefill_thread
+    if _prefill_thread is None:
+        with _prefill_lock:
+            if _prefill_thread is None:
+                _prefill_thread = prefill_question_pools(buckets)
+    return _prefill_thread
+
+
+def get_questions(amount, category=None, difficulty=None):
+    """returns `amount` questions of the given category and difficulty for a game,
+    questions are fetched from the API in batches of API_BATCH_SIZE into a pool per (category, difficulty) and
+    the ones left over are kept for the next games, so most games don't call the API at all"""
+    bucket = (category, difficulty)
+    pool, lock = _get_pool(bucket)
+    with lock:
+        if len(pool) < amount:
+            _fill_pool(pool, bucket, amount - len(pool))
 
+        if len(pool) < amount:
+            raise ApiError(f"Not enough questions available, {amount} needed")
+        questions = [pool.popleft() for _ in range(amount)]
+        running_low = len(pool) < API_POOL_LOW_WATER
 
-def get_questions_from_api(url):
-    response = requests.get(url)
-    return response.json()
+    if running_low:
+        # refill in the background, so the next game of this bucket doesn't wait for the API
+        prefill_question_pools([bucket])
+    return questions
@@ -1,9 +1,19 @@
+import json
+
 from flask import Flask, jsonify, request  # imports specific objects and functions from the Flask web framework
+from flask_sock import Sock  # adds WebSocket support to Flask
 
-from classes.lifeline import FiftyFifty
-from classes.lifeline import AskAudience
+from classes.lifeline import Lifeline
 from classes.user import User
-from classes.game import Game
+from classes.game import Game, LEADERBOARD_WINDOWS
+from classes.room import Room
+from game_socket import GameSocketSession
+from http_utils import cache_response, use_fast_responses, idempotent
+from rate_limit_utils import RateLimiter, RedisBucketStore
+from api_utils import prefill_question_pools_once
+from db_utils import set_read_consistency, start_unit_of_work, end_unit_of_work
+from config import PREFILL_BUCKETS, GAME_LENGTH, LEADERBOARD_MAX_AGE, ROOM_CACHE_TTL, \
+    RATE_LIMIT_ENABLED, RATE_LIMITS, RATE_LIMIT_REDIS_URL
 
 # We need CORS when we connect frontend and backend
 from flask_cors import CORS
@@ -12,6 +22,59 @@ from flask_cors import CORS
 app = Flask(__name__)
 
 CORS(app)
+# orjson/MessagePack responses and gzip/brotli compression of the bigger ones
+use_fast_responses(app)
+
+# per client limits, so one script can't fill the db or use up our trivia API quota
+rate_limiter = RateLimiter(RATE_LIMITS, RedisBucketStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else None,
+                           RATE_LIMIT_ENABLED)
+rate_limiter.init_app(app)
+
+sock = Sock(app)
+
+
+@app.before_request
+def start_question_prefill():
+    """fills the question pools in the background on the first request of the process, however the app is run,
+    so the first games don't wait for the trivia API"""
+    prefill_question_pools_once(PREFILL_BUCKETS)
+
+
+@app.before_request
+def start_read_consistency():
+    """reads of a request go to the read replicas unless the client sends X-Read-Consistency: strong,
+    e.g. right after a write made in another request, or the request writes first"""
+    set_read_consistency(request.headers.get("X-Read-Consistency") == "strong")
+
+
+@app.before_request
+def start_request_transaction():
+    """the db writes of a request are made in one transaction on a pooled connection, committed when it ends.
+    A WebSocket stays open for a whole game, so its writes are committed one by one as before"""
+    if request.endpoint != "game_socket":
+        start_unit_of_work()
+
+
+@app.after_request
+def commit_request_transaction(response):
+    """commits the writes of the request, unless it failed. If the commit fails the client gets a 500"""
+    end_unit_of_work(commit=response.status_code < 500)
+    return response
+
+
+@app.teardown_request
+def rollback_request_transaction(exc):
+    """rolls back what is left of the unit of work when the request raised an exception"""
+    end_unit_of_work(commit=False)
+
+
+def _validate_game_settings(data):
+    """checks the optional category, difficulty and num_questions of a new game or room,
+    returns an error response, or None if they are all valid"""
+    error = Game.settings_error(data)
+    if error:
+        return {"message": error}, 400
+    return None
 
 
 @app.route("/add_new_game", methods=["POST"])
@@ -21,12 +84,17 @@ def add_game():
 
             Expected JSON input:
             {
-                "user_name": "string"
+                "user_name": "string",
+                "category": int (optional, Open Trivia DB category id),
+                "difficulty": "easy" | "medium" | "hard" | "ramp" (optional),
+                "num_questions": int (optional, 15 by default)
             }
 
             Returns:
             - {"player_id": int, "game_id": int, "question": string} if successful.
             - {"message": "Username must be between 1 and 40 characters"}, 400 if input is invalid.
+            - {"message": "Invalid category"} or {"message": "Invalid difficulty"}, 400 if they are not supported.
+            - {"message": "Invalid number of questions"}, 400 if num_questions is not between 1 and MAX_GAME_LENGTH.
             - {"message": "Internal server error"}, 500 if there's a server error.
             """
     if not request.is_json:
@@ -39,15 +107,27 @@ def add_game():
     if "user_name" not in user_data or not (1 <= len(user_data["user_name"]) <= 40):
         return {"message": "User name must be between 1 and 40 characters"}, 400
 
+    # category, difficulty and game length are optional, by default questions can be of any category and difficulty
+    # and the game has 15 questions, 5 for quick play or hundreds for a marathon can be chosen too
+    error = _validate_game_settings(user_data)
+    if error:
+        return error
+    category = user_data.get("category")
+    difficulty = user_data.get("difficulty")
+    num_questions = user_data.get("num_questions", GAME_LENGTH)
+
     try:
+        # the first questions come from the pool or the API before anything is written, so the request's
+        # transaction isn't kept open while the API is waited for
+        questions = Game.first_questions(category, difficulty, num_questions)
         # creates a new instance of user
         user = User(user_data["user_name"])
         # calls method on this user to create a new game, returns user id
         user_id = user.get_or_create()
         # creates a new instance of the game
-        game = Game(user_id)
-        # start_game method gets questions from API, sets to db, and returns the first question and four answers
-        game_id = game.start_game()
+        game = Game(user_id, category, difficulty, num_questions)
+        # start_game method sets the game and its questions to db
+        game_id = game.start_game(questions)
         question = Game.provide_question(game_id)
         response = {
             "player_id": user_id,
@@ -62,6 +142,7 @@ def add_game():
 
 
 @app.route("/check_answer", methods=["PUT"])
+@idempotent
 def check_answer():
     """
         Endpoint to check whether the user-provided answer is correct for a specific game and question.
@@ -69,14 +150,23 @@ def check_answer():
         Expected JSON input:
         {
             "game_id": int,
-            "answer": "string",
+            "option_id": int,
             "question_id": int
         }
+        option_id is the position (0 to 3) of the chosen answer in the answers of the question. Instead of it,
+        the answer text can be sent as "answer": "string", which is compared ignoring case, accents and punctuation.
+
+        Each question is scored once, sending the same answer again (e.g. after a timeout) returns the result
+        of the first answer without changing the score. An optional Idempotency-Key header makes a retry
+        return the first response straight away.
 
         Returns:
-        - {"result": True} if the answer is correct.
-        - {"result": False} if the answer is incorrect.
+        - {"score": int, "correct_answer": "string", "correct_option": int, "result": "correct" | "wrong",
+          "speed_points": int, "speed_score": int}. speed_points are the points of this answer for answering
+          quickly (0 if it is wrong), speed_score is the total of the game.
         - {"message": "Missing required fields"}, 400 if required fields are missing.
+        - {"message": "Invalid option"}, 400 if option_id is not between 0 and 3.
+        - {"message": "Question not available"}, 409 if the question isn't one the game has been shown.
         - {"message": "Internal server error"}, 500 if there's a server error.
         """
     if not request.is_json:
@@ -85,16 +175,22 @@ def check_answer():
     answer = request.get_json()
 
     # Validate required fields
-    required_fields = ["game_id", "answer", "question_id"]
-    if not all(field in answer for field in required_fields):
+    required_fields = ["game_id", "question_id"]
+    if not all(field in answer for field in required_fields) or ("answer" not in answer and "option_id" not in answer):
         return {"message": "Missing required fields"}, 400
+    if "option_id" in answer and not Game.is_valid_option(answer["option_id"]):
+        return {"message": "Invalid option"}, 400
 
     game_id = answer["game_id"]
-    user_answer = answer["answer"]
     question_id = answer["question_id"]
 
     try:
-        answer_was_correct = Game.check_answer(game_id, question_id, user_answer)
+        if "option_id" in answer:
+            answer_was_correct = Game.check_answer(game_id, question_id, option_id=answer["option_id"])
+        else:
+            answer_was_correct = Game.check_answer(game_id, question_id, answer["answer"])
+        if "message" in answer_was_correct:
+            return answer_was_correct, 409
         # return {"result": answer_was_correct}
         return answer_was_correct
     except Exception as e:
@@ -104,6 +200,7 @@ def check_answer():
 
 
 @app.route("/next_question/<game_id>")
+@cache_response(no_store=True)  # every request moves the game on, so the response must never be reused
 def next_question(game_id):
     """
         Endpoint to retrieve the next question for a specific game.
@@ -114,6 +211,8 @@ def next_question(game_id):
         Returns:
         - JSON response with the next question if the game is ongoing.
         - JSON response with an error message and a 404 status code if the game is over.
+        - {"message": "Game is in a room"}, 409 if the game is played in a room, its questions come from
+          /rooms/<room_id>/question instead.
         - {"message": "Internal server error"}, 500 if there's a server error.
         """
     try:
@@ -122,6 +221,8 @@ def next_question(game_id):
         if next_quest is None:
             # Game is over, return a proper JSON response with a 404 status code
             return jsonify({"error": "End of game"}), 404
+        elif next_quest == {"message": "Game is in a room"}:
+            return next_quest, 409
         else:
             # Game is ongoing, return the next question
             return next_quest
@@ -131,59 +232,140 @@ def next_question(game_id):
         return {"message": "Internal server error"}, 500
 
 
-@app.route("/fifty_fifty/<question_id>")
-def updated_question(question_id):
+@app.route("/finish_game/<int:game_id>", methods=["PUT"])
+def end_game(game_id):
     """
-        Endpoint to retrieve an updated question with the "Fifty-Fifty" lifeline applied.
+        Endpoint to finish a game, its score goes into the daily and weekly leaderboards.
+        A game also finishes by itself when /next_question runs out of questions.
 
         Parameters:
-        - question_id (int): The unique identifier for the question.
+        - game_id (int): The unique identifier for the game.
 
         Returns:
-        - JSON response with the updated question.
+        - {"finished": True} if the game is finished now.
+        - {"finished": False} if it had already finished.
         - {"message": "Internal server error"}, 500 if there's a server error.
         """
     try:
-        updated_quest = FiftyFifty.provide_lifeline(question_id)
-        return updated_quest
+        return {"finished": Game.end_game(game_id)}
     except Exception as e:
         # Log the exception details for debugging
         print(f"An error occurred: {str(e)}")
         return {"message": "Internal server error"}, 500
 
 
-@app.route("/ask_audience/<question_id>")
-def get_audience_choice(question_id):
-    """
-        Endpoint to retrieve the audience's choice for a specific question using the "Ask the Audience" lifeline.
+def _lifeline_game_id():
+    """returns the game_id in the query string of a lifeline request, None if it isn't there"""
+    return request.args.get("game_id", type=int)
 
-        Parameters:
-        - question_id (int): The unique identifier for the question.
 
-        Returns:
-        - JSON response with the audience's choice.
-        - {"message": "Internal server error"}, 500 if there's a server error.
+def _lifeline_response(result):
+    """turns the result of Lifeline.use into a response, 409 if the lifeline can't be used"""
+    if isinstance(result, dict) and "message" in result:
+        return result, 409
+    return result
+
+
+def _lifeline_route(lifeline):
+    """makes the view of the /<name>/<question_id> route of a lifeline, a cacheable lifeline's result never changes
+    for a question, so the game and question ids are enough for the ETag"""
+
+    def use_lifeline(question_id):
         """
+            Endpoint to use a lifeline (fifty_fifty, ask_audience, phone_a_friend, switch_question) on a question.
+
+            Parameters:
+            - question_id (int): The unique identifier for the question.
+            - game_id (int, query string): the game using the lifeline, only needed for the questions of a room.
+
+            Using the lifeline again on the same question doesn't use another one of the game's lifelines.
+
+            Returns:
+            - JSON response with the result of the lifeline, see provide_lifeline of the lifeline's class.
+            - {"message": "Lifeline not available"}, 409 if the question isn't the one the game is answering.
+            - {"message": "No lifelines left"}, 409 if the game has used all its lifelines of this kind.
+            - {"message": "Internal server error"}, 500 if there's a server error.
+            """
+        try:
+            result = lifeline.use(question_id, _lifeline_game_id())
+            return _lifeline_response(result)
+        except Exception as e:
+            # Log the exception details for debugging
+            print(f"An error occurred: {str(e)}")
+            return {"message": "Internal server error"}, 500
+
+    use_lifeline.__name__ = lifeline.name
+    if lifeline.cacheable:
+        return cache_response(max_age=lifeline.cache_ttl,
+                              etag=lambda question_id: (f"{lifeline.name}-{_lifeline_game_id()}-{question_id}",
+                                                        None))(use_lifeline)
+    # a result that can change has to come from the server every time
+    return cache_response(no_store=True)(use_lifeline)
+
+
+# one route per registered lifeline, e.g. /fifty_fifty/<question_id>, the endpoint is the name of the lifeline
+for _name, _lifeline in Lifeline.registry.items():
+    app.add_url_rule(f"/{_name}/<question_id>", endpoint=_name, view_func=_lifeline_route(_lifeline))
+
+
+def _leaderboard_window():
+    """returns the leaderboard window asked for in the query string, None for the all-time leaderboard"""
+    window = request.args.get("window", "all")
+    return None if window == "all" else window
+
+
+def _best_per_player():
+    """returns True if the query string asks for the best score of each player instead of every game"""
+    return request.args.get("mode") == "best"
+
+
+def _by_speed():
+    """returns True if the query string asks for the games with the most speed points instead of the best scores"""
+    return request.args.get("mode") == "speed"
+
+
+def _leaderboard_etag():
+    """returns the ETag and last modified time of the leaderboard asked for, or (None, None) if the leaderboard
+    version can't be read, then the ETag is a hash of the leaderboard instead"""
     try:
-        audience_choice = AskAudience.provide_lifeline(question_id)
-        return audience_choice
+        return Game.leaderboard_version(_leaderboard_window(), _best_per_player(), _by_speed())
     except Exception as e:
         # Log the exception details for debugging
         print(f"An error occurred: {str(e)}")
-        return {"message": "Internal server error"}, 500
+        return None, None
 
 
+# the leaderboard ETag comes from a version number that goes up with every score change,
+# so browsers and CDNs can revalidate their copy without the leaderboard being read from the db
 @app.route("/leaderboard/")
+@cache_response(max_age=LEADERBOARD_MAX_AGE, public=True, etag=_leaderboard_etag)
 def show_leaderboard():
     """
         Endpoint to retrieve and display the current leaderboard.
 
+        Query parameters:
+        - window (optional): "all" (default), "daily" or "weekly". The daily and weekly leaderboards
+          have the games finished today or this week.
+        - mode (optional): "games" (default) lists the best games, "best" lists the best finished game
+          of each player, so one player can't fill the whole top 10, "speed" lists the games with the most
+          speed points (for quick correct answers) with their speed score. "best" and "speed" are only
+          for the all-time leaderboard.
+
         Returns:
         - JSON response with the current leaderboard.
+        - {"message": "Invalid window"}, 400 if the window is not one of the above.
+        - {"message": "Invalid mode"}, 400 if the mode is not one of the above, or "best" or "speed" with a window.
         - {"message": "Internal server error"}, 500 if there's a server error.
         """
+    window = _leaderboard_window()
+    if window is not None and window not in LEADERBOARD_WINDOWS:
+        return {"message": "Invalid window"}, 400
+    mode = request.args.get("mode", "games")
+    if mode not in ("games", "best", "speed") or (window is not None and mode != "games"):
+        return {"message": "Invalid mode"}, 400
+
     try:
-        leaderboard = Game.show_leaderboard()
+        leaderboard = Game.show_leaderboard(window, _best_per_player(), _by_speed())
         return leaderboard
     except Exception as e:
         # Log the exception details for debugging
@@ -191,5 +373,187 @@ def show_leaderboard():
         return {"message": "Internal server error"}, 500
 
 
+@app.route("/rank/<int:game_id>")
+@cache_response(max_age=LEADERBOARD_MAX_AGE)
+def show_rank(game_id):
+    """
+        Endpoint to retrieve the rank of a game among all the games, e.g. "you are #4,213 of 1.2M".
+
+        Parameters:
+        - game_id (int): The unique identifier for the game.
+
+        Returns:
+        - {"game_id": int, "score": int, "rank": int, "total": int, "percentile": float} if successful,
+          games with the same score share a rank and percentile is the percentage of games with a lower score.
+        - {"message": "Internal server error"}, 500 if there's a server error.
+        """
+    try:
+        return Game.rank(game_id)
+    except Exception as e:
+        # Log the exception details for debugging
+        print(f"An error occurred: {str(e)}")
+        return {"message": "Internal server error"}, 500
+
+
+@app.route("/rooms", methods=["POST"])
+def add_room():
+    """
+        Endpoint to create a multiplayer room, all the players in a room answer the same questions.
+
+        Expected JSON input (all fields optional):
+        {
+            "category": int,
+            "difficulty": "easy" | "medium" | "hard" | "ramp",
+            "num_questions": int
+        }
+
+        Returns:
+        - {"room_id": int, "host_token": "string"} if successful, the host sends the host_token in the
+          X-Host-Token header to move the room on.
+        - {"message": "..."}, 400 if the category, difficulty or num_questions is invalid.
+        - {"message": "Internal server error"}, 500 if there's a server error.
+        """
+    room_data = request.get_json(silent=True) or {}
+
+    error = _validate_game_settings(room_data)
+    if error:
+        return error
+
+    try:
+        room = Room(room_data.get("category"), room_data.get("difficulty"),
+                    room_data.get("num_questions", GAME_LENGTH))
+        room_id = room.create_room()
+        return jsonify({"room_id": room_id, "host_token": room.host_token})
+    except Exception as e:
+        # Log the exception details for debugging
+        print(f"An error occurred: {str(e)}")
+        return {"message": "Internal server error"}, 500
+
+
+@app.route("/rooms/<int:room_id>/join", methods=["POST"])
+def join_room(room_id):
+    """
+        Endpoint for a player to join a room.
+
+        Expected JSON input:
+        {
+            "user_name": "string"
+        }
+
+        Returns:
+        - {"player_id": int, "game_id": int, "room_id": int, "question": current question or None} if successful.
+        - {"message": "User name must be between 1 and 40 characters"}, 400 if input is invalid.
+        - {"error": "Room not found"}, 404 if there is no such room.
+        - {"message": "Internal server error"}, 500 if there's a server error.
+        """
+    if not request.is_json:
+        return {"message": "Invalid content type. Expected JSON"}, 400
+
+    user_data = request.get_json()
+
+    # Check if "user_name" is missing, empty, or longer than 40 characters
+    if "user_name" not in user_data or not (1 <= len(user_data["user_name"]) <= 40):
+        return {"message": "User name must be between 1 and 40 characters"}, 400
+
+    try:
+        user_id = User(user_data["user_name"]).get_or_create()
+        game_id = Room.join(room_id, user_id)
+        if game_id is None:
+            return jsonify({"error": "Room not found"}), 404
+        response = {
+            "player_id": user_id,
+            "game_id": game_id,
+            "room_id": room_id,
+            "question": Room.current_question(room_id)
+        }
+        return jsonify(response)
+    except Exception as e:
+        # Log the exception details for debugging
+        print(f"An error occurred: {str(e)}")
+        return {"message": "Internal server error"}, 500
+
+
+@app.route("/rooms/<int:room_id>/next_question", methods=["PUT"])
+def next_room_question(room_id):
+    """
+        Endpoint for the host to move the room on to its next question.
+
+        Headers:
+        - X-Host-Token: the host_token POST /rooms returned for the room.
+
+        Returns:
+        - JSON response with the next question, which every player in the room gets.
+        - {"message": "Only the host can move the room on"}, 403 if the host token is missing or wrong.
+        - {"error": "End of game"}, 404 if the room has no more questions.
+        - {"message": "Internal server error"}, 500 if there's a server error.
+        """
+    try:
+        if not Room.is_host(room_id, request.headers.get("X-Host-Token")):
+            return {"message": "Only the host can move the room on"}, 403
+        question = Room.next_question(room_id)
+        if question is None:
+            return jsonify({"error": "End of game"}), 404
+        return question
+    except Exception as e:
+        # Log the exception details for debugging
+        print(f"An error occurred: {str(e)}")
+        return {"message": "Internal server error"}, 500
+
+
+@app.route("/rooms/<int:room_id>/question")
+@cache_response(max_age=ROOM_CACHE_TTL, public=True)
+def room_question(room_id):
+    """
+        Endpoint for the players to get the question the room is on.
+
+        Returns:
+        - JSON response with the current question of the room.
+        - {"error": "Room has not started yet"}, 404 if the host hasn't shown the first question yet.
+        - {"message": "Internal server error"}, 500 if there's a server error.
+        """
+    try:
+        question = Room.current_question(room_id)
+        if question is None:
+            return jsonify({"error": "Room has not started yet"}), 404
+        return question
+    except Exception as e:
+        # Log the exception details for debugging
+        print(f"An error occurred: {str(e)}")
+        return {"message": "Internal server error"}, 500
+
+
+@app.route("/rooms/<int:room_id>/leaderboard")
+@cache_response(max_age=ROOM_CACHE_TTL, public=True)
+def room_leaderboard(room_id):
+    """
+        Endpoint to retrieve the live leaderboard of a room.
+
+        Returns:
+        - JSON response with the usernames and scores of the players in the room.
+        - {"message": "Internal server error"}, 500 if there's a server error.
+        """
+    try:
+        leaderboard = Room.show_leaderboard(room_id)
+        return jsonify(leaderboard)
+    except Exception as e:
+        # Log the exception details for debugging
+        print(f"An error occurred: {str(e)}")
+        return {"message": "Internal server error"}, 500
+
+
+@sock.route("/ws/game")
+def game_socket(ws):
+    """
+        WebSocket endpoint that carries a whole game over one connection: start, questions, answers, lifelines
+        and score. The messages are described in GameSocketSession, they follow the same rules as the
+        HTTP endpoints above, and the next question is pushed as soon as an answer is checked.
+        """
+    session = GameSocketSession()
+    while not session.finished:
+        message = ws.receive()
+        for reply in session.handle(message):
+            ws.send(json.dumps(reply))
+
+
 if __name__ == '__main__':
     app.run(debug=True)
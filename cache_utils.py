@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+
+# marks a cache miss, so that None can be cached too
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe in-memory cache. Entries expire after `ttl` seconds (never if ttl is None),
+    and the least recently used entries are dropped once there are more than `max_size` of them"""
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.key_locks = {}  # key -> lock held while the value for the key is being loaded
+
+    def get(self, key, default=None):
+        """returns the cached value for the key, or default if it is not cached or has expired"""
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        """caches the value for the key, ttl overrides the cache's ttl for this entry"""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_or_set(self, key, load):
+        """returns the cached value for the key, or calls load() and caches what it returns.
+        When many threads miss the same key at once only one of them calls load(), the others wait for it"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # another thread may have loaded the value while this one was waiting
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                value = load()
+                self.set(key, value)
+        with self.lock:
+            self.key_locks.pop(key, None)
+        return value
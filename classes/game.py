@@ -1,66 +1,275 @@
-from api_utils import get_questions_from_api
+from answer_time_utils import question_served, time_taken, speed_points, answer_received
+from api_utils import get_questions, CATEGORIES
+from cache_utils import TTLCache
+from config import GAME_LENGTH, MAX_GAME_LENGTH, QUESTION_CHUNK_SIZE, CORRECT_ANSWER_CACHE_SIZE, RANK_RELOAD_INTERVAL
+from rank_utils import ScoreRanking
+from .models import Question, LeaderboardEntry
 
-from db_utils import add_new_game, add_new_questions, display_question_to_player, get_correct_answer, update_game_score, \
-    get_user_score, get_leaderboard
+from db_utils import add_new_game, add_new_questions, display_question_to_player, get_question, record_answer, \
+    get_answer, get_user_score, get_leaderboard, get_game_progress, get_leaderboard_version, finish_game, \
+    get_window_leaderboard, get_score_counts, get_best_leaderboard, get_game_scores, get_speed_leaderboard
+
+DIFFICULTIES = ("easy", "medium", "hard")
+# "ramp" mode goes from easy to hard questions, like the real show
+RAMP = "ramp"
+# every question has the correct answer and three incorrect ones, the player answers with the option id (0 to 3)
+ANSWER_OPTIONS = 4
+# leaderboards of the games finished today and this week, besides the all-time one
+LEADERBOARD_WINDOWS = ("daily", "weekly")
+
+# questions never change, so the ones that are answered are kept in memory, which also means that when hundreds
+# of players in a room answer the same question at once, the correct answer is fetched from the db only once
+_questions = TTLCache(max_size=CORRECT_ANSWER_CACHE_SIZE)
+
+# number of games with each score, so a player's rank is found without counting the games with a higher score
+score_ranking = ScoreRanking(MAX_GAME_LENGTH, get_score_counts, RANK_RELOAD_INTERVAL)
+
+
+def _load_question(question_id):
+    """returns the question as it was shown, or None if it hasn't been shown yet. The answers of a question are
+    shuffled when it is shown (to the game or to the room) and the order is stored, so until then there is no
+    answer order to check option ids with"""
+    row = get_question(question_id)
+    if not row[9] or row[7] is None:
+        return None
+    return Question.from_row(row)
+
+
+def _difficulty_at(position, num_questions, difficulty):
+    """returns the difficulty of the question at `position` (counting from 0) in a game of num_questions,
+    in ramp mode the first third of the game is easy, the second medium and the last third hard"""
+    if difficulty != RAMP:
+        return difficulty
+    return DIFFICULTIES[position * len(DIFFICULTIES) // num_questions]
 
 
 class Game:
 
-    def __init__(self, user_id):
+    def __init__(self, user_id, category=None, difficulty=None, num_questions=GAME_LENGTH):
         self.user_id = user_id
+        self.category = category
+        self.difficulty = difficulty
+        self.num_questions = num_questions
 
-    def start_game(self):
-        """""method sets the new game to the db, returns the game_id"""
+    @staticmethod
+    def is_valid_category(category):
+        """checks that the category is None (any category) or one of the API category ids"""
+        return category is None or (isinstance(category, int) and category in CATEGORIES)
 
-        # to write a new game to a database
-        game_id = add_new_game(self.user_id)
+    @staticmethod
+    def is_valid_difficulty(difficulty):
+        """checks that the difficulty is None (any difficulty), easy, medium, hard or ramp"""
+        return difficulty is None or difficulty in DIFFICULTIES or difficulty == RAMP
 
-        # to get question from the API
-        self.set_questions(game_id)
+    @staticmethod
+    def is_valid_length(num_questions):
+        """checks that the number of questions is a whole number between 1 and MAX_GAME_LENGTH"""
+        return isinstance(num_questions, int) and not isinstance(num_questions, bool) \
+            and 1 <= num_questions <= MAX_GAME_LENGTH
+
+    @staticmethod
+    def is_valid_option(option_id):
+        """checks that the option id is the position of one of the four answers of a question"""
+        return isinstance(option_id, int) and not isinstance(option_id, bool) and 0 <= option_id < ANSWER_OPTIONS
+
+    @staticmethod
+    def settings_error(data):
+        """checks the optional category, difficulty and num_questions of a new game,
+        returns the error message, or None if they are all valid"""
+        if not Game.is_valid_category(data.get("category")):
+            return "Invalid category"
+        if not Game.is_valid_difficulty(data.get("difficulty")):
+            return "Invalid difficulty"
+        if not Game.is_valid_length(data.get("num_questions", GAME_LENGTH)):
+            return "Invalid number of questions"
+        return None
+
+    @staticmethod
+    def first_questions(category=None, difficulty=None, num_questions=GAME_LENGTH):
+        """method gets the first chunk of questions of a new game from the pool or the third-party API.
+        A request calls it before it writes anything, so its transaction isn't kept open (on SQLite, with the
+        database locked) while the API is waited for"""
+        return Game.fetch_questions(category, difficulty, 0, min(num_questions, QUESTION_CHUNK_SIZE), num_questions)
+
+    def start_game(self, questions=None):
+        """""method sets the new game to the db, returns the game_id.
+        Only the first chunk of questions is set to the db, the rest are added as the player advances.
+        questions is the first chunk if the caller already got it with first_questions"""
+
+        # to get question from the API, before anything is written
+        if questions is None:
+            questions = Game.first_questions(self.category, self.difficulty, self.num_questions)
+
+        # to write a new game to a database
+        game_id = add_new_game(self.user_id, self.num_questions, self.category, self.difficulty)
+        score_ranking.game_added()
+        Game.add_questions(game_id, questions)
 
         return game_id
 
     @staticmethod
-    def set_questions(game_id):
-        """method takes game_id and makes request to the third-party API to get 15 questions, which later sets to the
-        db"""
+    def set_questions(game_id, category=None, difficulty=None, start=0, amount=GAME_LENGTH, num_questions=GAME_LENGTH):
+        """method takes game_id, category and difficulty and gets `amount` questions from the third-party API, which
+        later sets to the db, `start` is the position in the game of the first of these questions"""
+        questions = Game.fetch_questions(category, difficulty, start, amount, num_questions)
+        Game.add_questions(game_id, questions)
+
+    @staticmethod
+    def add_questions(game_id, questions):
+        """method sets the questions got from the API to the db, as the next questions of the game"""
+        # setting questions one by one to the db
+        for question in questions:
+            add_new_questions(game_id, question["question"], question["correct_answer"], question["incorrect_answers"],
+                              question.get("category"), question.get("difficulty"))
+
+    @staticmethod
+    def fetch_questions(category=None, difficulty=None, start=0, amount=GAME_LENGTH, num_questions=GAME_LENGTH):
+        """method gets `amount` questions of the given category and difficulty from the third-party API.
+        Questions come from a pool per category and difficulty, which is filled from the API in bigger batches
+        with a session token, so the same question is not given twice and most games don't need an API call.
+        In ramp mode the game gets easy, then medium, then hard questions"""
         try:
-            questions = get_questions_from_api('https://opentdb.com/api.php?amount=15&type=multiple')["results"]
+            questions = []
+            position = start
+            while position < start + amount:
+                level = _difficulty_at(position, num_questions, difficulty)
+                # take all the following questions of the same difficulty at once
+                run_end = position + 1
+                while run_end < start + amount and _difficulty_at(run_end, num_questions, difficulty) == level:
+                    run_end += 1
+                questions += get_questions(run_end - position, category, level)
+                position = run_end
         except Exception:
             raise ConnectionError("Failed to get questions from API")
-        # setting questions one by one to the db
-        for question in questions:
-            add_new_questions(game_id, question["question"], question["correct_answer"], question["incorrect_answers"])
+        return questions
 
     @staticmethod
-    def check_answer(game_id, question_id, user_answer):
-        """method takes game_id, question_id, user_answer as parameters,
-        gets the correct answer from the db and checks it with the player's answer,
-        updates player's score and returns score, correct answer and string wrong/correct"""
+    def check_answer(game_id, question_id, user_answer=None, option_id=None):
+        """method takes game_id, question_id and either the user_answer text or the option_id (position of the answer
+        in the answers of the question) as parameters, gets the correct answer from the db and checks it with the
+        player's answer, updates player's score and returns score, correct answer, its option id, string
+        wrong/correct, the speed points of the answer and the speed score of the game.
+        A question is scored only once, if it was already answered (e.g. the client retried after a timeout),
+        the result of the first answer is returned and the score is not changed.
+        Returns {"message": "Question not available"} if the question isn't one the game has been shown"""
 
-        # request is sent to db to get the right answer for this question and question's value
-        correct_answer = get_correct_answer(question_id)
-        # the right answer is compared with the player's answer, using .lower() to ensure they are compared properly
-        # and avoid case-sensitivity issues
-        if user_answer.lower() == correct_answer.lower():
-            # if it is correct the score is increased and returned
-            update_game_score(game_id)
-            user_score = get_user_score(game_id)
+        # request is sent to db to get the question with its right answer, unless it is already cached
+        question = _questions.get_or_set(str(question_id), lambda: _load_question(question_id))
+        if question is None:
+            # only questions that have been shown are kept, the order of their answers is known by then
+            _questions.delete(str(question_id))
+            return {"message": "Question not available"}
+        correct_answer = question.correct_answer
+        if option_id is not None:
+            # the option ids come from the order the answers were shown in, so it is an integer compare
+            is_correct = question.is_correct_option(option_id)
+            user_answer = question.answers[option_id]
+        else:
+            # the right answer is compared with the player's answer ignoring case, accents, punctuation and small
+            # typos, the normalized right answer is worked out when the question is added to the db
+            is_correct = question.is_correct(user_answer)
+        # quick correct answers get speed points, the time the question was served is kept in memory
+        served_at, seconds = time_taken(game_id, question_id)
+        points = speed_points(seconds) if is_correct else 0
 
-            return {"score": user_score, "correct_answer": correct_answer, "result": "correct"}
+        # the answer is saved and, if it is correct, the score is increased
+        first_answer = record_answer(game_id, question_id, user_answer, is_correct, points)
+        if first_answer is None:
+            return {"message": "Question not available"}
+        if first_answer:
+            # the answer time is written to the db later in the background, not while the player waits
+            answer_received(game_id, question_id, served_at, is_correct)
         else:
-            # user's score is got
-            previous_score = get_user_score(game_id)
-            return {"score": previous_score, "correct_answer": correct_answer, "result": "wrong"}
+            # the question was answered before, so the first answer counts
+            previous_answer = get_answer(game_id, question_id)
+            if previous_answer is not None:
+                is_correct, points = bool(previous_answer[1]), previous_answer[2]
+
+        user_score, speed_score = get_game_scores(game_id)
+        if first_answer and is_correct:
+            score_ranking.score_changed(user_score - 1, user_score)
+        return {"score": user_score, "correct_answer": correct_answer, "correct_option": question.correct_option,
+                "result": "correct" if is_correct else "wrong", "speed_points": points, "speed_score": speed_score}
+
+    @staticmethod
+    def add_next_chunk(game_id, progress=None):
+        """method sets the next chunk of questions of a long game to the db, returns False if all the questions
+        of the game are already in the db, or if it is a room game, whose questions are the room's.
+        progress is the get_game_progress of the game, if it was already fetched"""
+        progress = progress or get_game_progress(game_id)
+        if progress is None:
+            return False
+        num_questions, category, difficulty, questions_added, room_id = progress
+        if room_id is not None:
+            return False
+        remaining = num_questions - questions_added
+        if remaining <= 0:
+            return False
+        Game.set_questions(game_id, category, difficulty, questions_added, min(remaining, QUESTION_CHUNK_SIZE),
+                           num_questions)
+        return True
 
     @staticmethod
     def provide_question(game_id):
-        """"method takes one parameter game_id and returns the question from the database"""
+        """"method takes one parameter game_id and returns the question from the database,
+        when the questions in the db run out, the next chunk of the game is added first.
+        A room game has no questions of its own, the host moves the room on, so it gets
+        {"message": "Game is in a room"} instead"""
         result = display_question_to_player(game_id)
+        if result == {"message": "No more questions"}:
+            progress = get_game_progress(game_id)
+            if progress is not None and progress[4] is not None:
+                return {"message": "Game is in a room"}
+            if Game.add_next_chunk(game_id, progress):
+                result = display_question_to_player(game_id)
+            else:
+                # all the questions were answered, so the game goes into the daily and weekly leaderboards
+                Game.end_game(game_id)
+        if "question_id" in result:
+            question_served(result["game_id"], result["question_id"])
         return result
 
     @staticmethod
-    def show_leaderboard():
-        """method shows returns ten top results of players and their usernames"""
-        result = get_leaderboard()
-        return result
+    def end_game(game_id):
+        """method marks the game as finished and adds it to the daily and weekly leaderboards,
+        and to the best per player leaderboard if it is the player's best game, returns False if it had already
+        finished"""
+        return finish_game(game_id)
+
+    @staticmethod
+    def show_leaderboard(window=None, best_per_player=False, by_speed=False):
+        """method shows returns ten top results of players and their usernames,
+        of all time, or of the games finished today or this week if window is daily or weekly.
+        With best_per_player, each player is listed once with the best score of their finished games.
+        With by_speed, the games with the most speed points are listed, with their speed score"""
+        if by_speed:
+            result = get_speed_leaderboard()
+        elif best_per_player:
+            result = get_best_leaderboard()
+        elif window is None:
+            result = get_leaderboard()
+        else:
+            result = get_window_leaderboard(window)
+        return LeaderboardEntry.from_rows(result)
+
+    @staticmethod
+    def rank(game_id):
+        """method returns the rank of the game among all the games, the number of games,
+        and the percentage of games with a lower score"""
+        score = get_user_score(game_id)
+        rank, total, percentile = score_ranking.rank(score)
+        return {"game_id": game_id, "score": score, "rank": rank, "total": total, "percentile": percentile}
+
+    @staticmethod
+    def leaderboard_version(window=None, best_per_player=False, by_speed=False):
+        """method returns the leaderboard version, which changes whenever a score changes,
+        and the time it last changed. The daily and weekly versions also change when a new window starts,
+        the day comes from the db, so it changes at midnight of the db's time zone like the windows do"""
+        version, last_modified, window_start = get_leaderboard_version(window)
+        if by_speed:
+            return f"{version}-speed", last_modified
+        if best_per_player:
+            return f"{version}-best", last_modified
+        if window is None:
+            return version, last_modified
+        return f"{version}-{window}-{window_start}", last_modified
@@ -1,22 +1,104 @@
-from db_utils import display_question_to_player_fifty_fifty, get_all_answers
-from .lifeline_utils import random_partition, move_answers
+from answer_time_utils import question_served
+from api_utils import get_questions
+from cache_utils import TTLCache
+from config import LIFELINE_CACHE_SIZE, LIFELINE_CACHE_TTL, FIFTY_FIFTY_MAX_AGE
+from db_utils import after_commit, display_question_to_player_fifty_fifty, get_all_answers, use_lifeline, get_question, \
+    get_question_pool, switch_question
+from rng_utils import rng_for
+from .lifeline_utils import random_partition, move_answers, friend_suggestion
+from .models import Question
+
+
+def _is_error(result):
+    return isinstance(result, dict) and ("message" in result or "error" in result)
 
 
 class Lifeline:
-    """Base class for lifeline functionality."""
+    """Base class for lifeline functionality. A game has a few of each lifeline (see db_utils.LIFELINE_COLUMNS),
+    `use` takes one of them and provides the lifeline, subclasses set `name` and work out the result
+    in `provide_lifeline`. Every subclass with a name is added to `registry`, the app makes the
+    /<name>/<question_id> route and the socket message of each lifeline in it.
+
+    A subclass whose result never changes for a question sets `cacheable`, its results are then kept in memory for
+    `cache_ttl` seconds and browsers may cache its responses as long. `in_rooms` is False for lifelines that can't be
+    used on the questions of a room, which are shared by all its players, and `replaces_question` is True when the
+    result is a question the player answers instead. A lifeline that needs something from outside the db (e.g. a new
+    question from the trivia API) gets it in `prepare`, before the lifeline is taken in the db, so the request
+    doesn't keep its transaction open while it waits"""
+
+    name = None
+    cacheable = False
+    cache_ttl = LIFELINE_CACHE_TTL
+    in_rooms = True
+    replaces_question = False
+    # name -> Lifeline subclass, filled in as the subclasses are defined
+    registry = {}
+    # results of the lifeline per (game_id, question_id) it was used on, a lifeline used again on the same question
+    # gets the same result, so it is served from memory without going to the db
+    _results = None
+    # lifelines of each kind each game has left, kept in memory like a session of the game, so a game that has used
+    # them all is turned down without going to the db. Counts only go down, so a cached 0 is never out of date.
+    # Both caches are only updated once the lifeline is committed, a rolled back request leaves them as they were
+    _lifelines_left = TTLCache(max_size=LIFELINE_CACHE_SIZE, ttl=LIFELINE_CACHE_TTL)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.name is not None:
+            Lifeline.registry[cls.name] = cls
+            cls._results = TTLCache(max_size=LIFELINE_CACHE_SIZE, ttl=cls.cache_ttl) if cls.cacheable else None
+
+    @staticmethod
+    def prepare(question_id):
+        """gets what the lifeline needs before anything is written, returns the keyword arguments
+        of provide_lifeline"""
+        return {}
 
     @staticmethod
     def provide_lifeline(question_id):
         """Provide a lifeline for the given question."""
         pass
 
+    @classmethod
+    def use(cls, question_id, game_id=None):
+        """uses one of the game's lifelines on the question and returns the result of the lifeline,
+        or {"message": "Lifeline not available"} if the question isn't the one the game is answering,
+        or {"message": "No lifelines left"} if the game has used all of them. game_id can be left out
+        for the questions of a single player game"""
+        key = (str(game_id), str(question_id))
+        if cls._results is not None:
+            result = cls._results.get(key)
+            if result is not None:
+                return result
+        if game_id is not None and Lifeline._lifelines_left.get((str(game_id), cls.name)) == 0:
+            return {"message": "No lifelines left"}
+
+        prepared = cls.prepare(question_id)
+        # takes one lifeline of the game in the db, unless it was already used on this question
+        used = use_lifeline(question_id, cls.name, game_id, cls.in_rooms)
+        if "message" in used:
+            if used["message"] == "No lifelines left" and game_id is not None:
+                after_commit(lambda: Lifeline._lifelines_left.set((str(game_id), cls.name), 0))
+            return used
+        after_commit(lambda: Lifeline._lifelines_left.set((str(used["game_id"]), cls.name), used["left"]))
+
+        result = cls.provide_lifeline(question_id, **prepared)
+        if cls._results is not None and not _is_error(result):
+            after_commit(lambda: cls._results.set(key, result))
+        return result
+
 
 class FiftyFifty(Lifeline):
     """Type of LifeLine class."""
 
+    name = "fifty_fifty"
+    # the two answers left by the fifty-fifty never change once they are picked, so repeat calls
+    # (e.g. from a client that reconnected) are served from memory
+    cacheable = True
+    cache_ttl = FIFTY_FIFTY_MAX_AGE
+
     @staticmethod
     def provide_lifeline(question_id):
-        """Method that takes question_id and returns two options instead of four."""
+        """Method that takes question_id and returns two options instead of four, with their option ids"""
         result = display_question_to_player_fifty_fifty(question_id)
         return result
 
@@ -24,15 +106,80 @@ class FiftyFifty(Lifeline):
 class AskAudience(Lifeline):
     """Type of LifeLine class."""
 
+    name = "ask_audience"
+    # the votes come from the RNG of the question, so they are the same every time
+    cacheable = True
+
     @staticmethod
     def provide_lifeline(question_id):
-        """Method that takes question_id and returns the array of what percent of audience votes for what option"""
+        """Method that takes question_id and returns the array of what percent of audience votes for what option.
+        A question belongs to one game, so the votes come from the RNG of the question, and asking again
+        gives the same votes"""
         answers = get_all_answers(question_id)
-        percentages = random_partition(100)
+        rng = rng_for(None, "ask_audience", question_id)
+        percentages = random_partition(100, rng)
         percentages.sort(reverse=True)
-        answers_in_new_order = move_answers(answers)
+        answers_in_new_order = move_answers(answers, rng)
 
         # Create a list of tuples with percentages and answers
         data = list(zip(percentages, answers_in_new_order))
 
         return data
+
+
+class PhoneAFriend(Lifeline):
+    """Type of LifeLine class."""
+
+    name = "phone_a_friend"
+    # the friend's suggestion comes from the RNG of the question, so it is the same every time
+    cacheable = True
+
+    @staticmethod
+    def provide_lifeline(question_id):
+        """Method that takes question_id and returns the one answer the friend suggests, with its option id and how
+        sure (percent) the friend is. The surer the friend, the more likely the suggestion is the correct answer"""
+        question = Question.from_row(get_question(question_id))
+        rng = rng_for(None, "phone_a_friend", question_id)
+        option_id, confidence = friend_suggestion(len(question.answers), question.correct_option, rng)
+        return {
+            "question_id": question.question_id,
+            "option_id": option_id,
+            "answer": question.answers[option_id],
+            "confidence": confidence
+        }
+
+
+class SwitchQuestion(Lifeline):
+    """Type of LifeLine class."""
+
+    name = "switch_question"
+    # a switched question can't be switched again, so a repeat call (e.g. a retry after a timeout) has to get
+    # the question it was switched for from memory
+    cacheable = True
+    # everybody in a room answers the same question, one player can't switch it
+    in_rooms = False
+    replaces_question = True
+
+    @staticmethod
+    def prepare(question_id):
+        """gets the new question from the pool of the same category and difficulty (or the API) before the lifeline
+        is taken, as waiting for the API with the request's transaction open would hold up the other requests"""
+        pool = get_question_pool(question_id)
+        if pool is None:
+            return {"new_question": None}
+        game_id, category, difficulty = pool
+        return {"new_question": get_questions(1, category, difficulty)[0]}
+
+    @staticmethod
+    def provide_lifeline(question_id, new_question=None):
+        """Method that takes question_id and the new question from prepare, and shows the new question instead,
+        which the player answers, or returns {"message": "Lifeline not available"}"""
+        if new_question is None:
+            return {"message": "Lifeline not available"}
+        result = switch_question(question_id, new_question["question"], new_question["correct_answer"],
+                                 new_question["incorrect_answers"], new_question.get("category"),
+                                 new_question.get("difficulty"))
+        if "question_id" in result:
+            # speed points count from when the new question is shown
+            question_served(result["game_id"], result["question_id"])
+        return result
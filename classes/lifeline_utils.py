@@ -2,25 +2,28 @@ from collections import deque
 import random
 
 
-def random_partition(target):
-    """function takes the percent(usually 100) and distributes into 4 random percents, returns array of them"""
-    a = random.randint(1, target - 3)
-    b = random.randint(1, target - a - 2)
-    c = random.randint(1, target - a - b - 1)
+def random_partition(target, rng=None):
+    """function takes the percent(usually 100) and distributes into 4 random percents, returns array of them,
+    the numbers come from rng (a random.Random), so the same seeded rng gives the same percents"""
+    rng = rng or random.Random()
+    a = rng.randint(1, target - 3)
+    b = rng.randint(1, target - a - 2)
+    c = rng.randint(1, target - a - b - 1)
     d = target - a - b - c
     return [a, b, c, d]
 
 
-def move_answers(answers):
+def move_answers(answers, rng=None):
     """takes answers and returns  the list like [[56, 'Bro'], [26, 'Becquerel'], [17, 'Doc Scratch'], [1, 'Halley']],
      which represents what percent of audience chooses what option. It has its algorythm.
     In 60 % of the cases the audience will be clever, most of it will vote correcty, so Bro will be the correct option.
      In 20 percent of the cases the audience will be slightly less clever and the correct answer will be second chosen,
       in 15 % of the cases - even less clever and the correct will be the third most voted option,
-       in 5 - it will be not clever and the least chosen option will be correct. """
+       in 5 - it will be not clever and the least chosen option will be correct.
+       The random number comes from rng (a random.Random), like in random_partition"""
     dequed_answers = deque(answers)
     # Generate a random number between 0 and 1
-    rand_num = random.random()
+    rand_num = (rng or random.Random()).random()
 
     # Determine the correct answer position based on the random number
     if rand_num <= 0.6:
@@ -35,3 +38,16 @@ def move_answers(answers):
         dequed_answers.rotate(3)
         print("1", dequed_answers)
     return dequed_answers
+
+
+def friend_suggestion(num_options, correct_option, rng=None):
+    """takes the number of options and the option id of the correct answer and returns the (option_id, confidence)
+    the friend on the phone suggests. The friend is between 30 and 100 percent sure and, the surer they are,
+    the more likely they are right: the suggestion is the correct option with a probability of the confidence,
+    otherwise one of the wrong options. The numbers come from rng, like in random_partition"""
+    rng = rng or random.Random()
+    confidence = rng.randint(30, 100)
+    if rng.random() * 100 < confidence:
+        return correct_option, confidence
+    wrong_options = [option_id for option_id in range(num_options) if option_id != correct_option]
+    return rng.choice(wrong_options), confidence
@@ -0,0 +1,120 @@
+import sys
+
+from answer_utils import normalize_answer, answers_match
+from rng_utils import answer_order_for
+
+
+class Question:
+    """A question as it is kept in memory, e.g. in the question caches. With __slots__ a question has no __dict__,
+    so hundreds of thousands of them fit in RAM. The order the answers are shown in is worked out once, when the
+    question is made, and the normalized correct answer is stored in the db or worked out once, not on every answer
+    that is checked"""
+
+    __slots__ = ("question_id", "text", "correct_answer", "normalized_answer", "answer_order", "answers")
+
+    def __init__(self, question_id, text, correct_answer, incorrect_answers, answer_order, normalized_answer=None):
+        self.question_id = question_id
+        self.text = text
+        self.correct_answer = correct_answer
+        self.normalized_answer = normalized_answer if normalized_answer is not None \
+            else normalize_answer(correct_answer)
+        # the index in (correct_answer, *incorrect_answers) of each answer as it is shown
+        self.answer_order = tuple(answer_order)
+        answers = (correct_answer, *incorrect_answers)
+        self.answers = tuple(answers[index] for index in self.answer_order)
+
+    @classmethod
+    def from_row(cls, row, rng=None):
+        """makes the question from an (id, question, correct_answer, answer_1, answer_2, answer_3) row
+        of the questions table, which may also have the normalized_answer and answer_order at the end.
+        Without a stored order, the answers are shuffled with rng, by default the seeded RNG of the question,
+        so every player (e.g. in a room) sees the answers in the same order"""
+        normalized_answer = row[6] if len(row) > 6 else None
+        stored_order = row[7] if len(row) > 7 else None
+        if stored_order is not None:
+            answer_order = [int(index) for index in stored_order]
+        else:
+            answer_order = rng.sample(range(4), 4) if rng else answer_order_for(None, row[0])
+        return cls(row[0], row[1], row[2], row[3:6], answer_order, normalized_answer)
+
+    @property
+    def correct_option(self):
+        """the option id (position in answers) of the correct answer"""
+        return self.answer_order.index(0)
+
+    def is_correct(self, user_answer):
+        """compares the player's answer with the correct answer, ignoring case, accents, punctuation,
+        a leading article and, in longer answers, a typo. One of the incorrect answers is never right"""
+        incorrect_answers = [answer for index, answer in zip(self.answer_order, self.answers) if index != 0]
+        return answers_match(user_answer, self.normalized_answer, incorrect_answers=incorrect_answers,
+                             correct_answer=self.correct_answer)
+
+    def is_correct_option(self, option_id):
+        """checks the option id the player chose, no text has to be compared"""
+        return option_id == self.correct_option
+
+    def to_dict(self, **owner):
+        """returns the question as it is shown to the player, `owner` is the game_id or room_id of it"""
+        return {
+            "question_id": self.question_id,
+            **owner,
+            "question_text": self.text,
+            "answers": list(self.answers)
+        }
+
+
+class GameSession:
+    """State of a game that is being played, kept in memory for as long as the player is connected"""
+
+    __slots__ = ("game_id", "player_id", "question_id", "score", "finished")
+
+    def __init__(self, game_id, player_id):
+        self.game_id = game_id
+        self.player_id = player_id
+        self.question_id = None  # the question the player is answering now
+        self.score = 0
+        self.finished = False
+
+
+class LeaderboardEntry(tuple):
+    """One line of a leaderboard, a (username, score) tuple with names for its fields, so it is sent as
+    [username, score] like the db rows and takes no more memory than them"""
+
+    __slots__ = ()
+
+    def __new__(cls, username, score):
+        return super().__new__(cls, (username, score))
+
+    @property
+    def username(self):
+        return self[0]
+
+    @property
+    def score(self):
+        return self[1]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """turns the (username, score) rows of a leaderboard query into entries"""
+        return [cls(username, score) for username, score in rows]
+
+
+def deep_sizeof(obj, seen=None):
+    """returns the memory (bytes) used by the object and everything it refers to through its slots or items,
+    objects shared with something else (e.g. interned strings) are counted too, so it is an upper bound"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    if isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
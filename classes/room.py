@@ -0,0 +1,100 @@
+import hmac
+import secrets
+
+from answer_time_utils import question_served
+from cache_utils import TTLCache
+from config import GAME_LENGTH, ROOM_CACHE_TTL, API_BATCH_SIZE
+
+from db_utils import add_new_room, add_new_questions, add_new_game, get_room, advance_room_question, \
+    get_room_question, get_room_leaderboard
+from .game import Game, score_ranking
+from .models import Question, LeaderboardEntry
+
+# every player in a room asks for the same current question and leaderboard,
+# so they are served from memory for a short time instead of each request going to the db
+_room_questions = TTLCache(max_size=10000, ttl=ROOM_CACHE_TTL)
+_room_leaderboards = TTLCache(max_size=10000, ttl=ROOM_CACHE_TTL)
+
+
+def _room_question(row):
+    """turns a question row into the question shown to the players, the answers are in the order stored
+    when the room moved on to it, so every player sees the answers in the same order"""
+    return Question.from_row(row)
+
+
+class Room:
+    """Multiplayer game, one set of questions is shared by all the players in the room"""
+
+    def __init__(self, category=None, difficulty=None, num_questions=GAME_LENGTH):
+        self.category = category
+        self.difficulty = difficulty
+        self.num_questions = num_questions
+        self.host_token = None
+
+    def create_room(self):
+        """method sets the new room and its questions to the db, returns the room_id. The room gets a new
+        host_token, which only the creator of the room is given, to move the room on with.
+        Questions are fetched from the API once per room, not once per player, API_BATCH_SIZE at a time,
+        as the API gives at most that many per call"""
+        # all the questions are fetched before the room is written, so the request's transaction isn't kept open
+        # while the API is waited for
+        questions = []
+        for start in range(0, self.num_questions, API_BATCH_SIZE):
+            amount = min(API_BATCH_SIZE, self.num_questions - start)
+            questions += Game.fetch_questions(self.category, self.difficulty, start, amount, self.num_questions)
+
+        self.host_token = secrets.token_hex(16)
+        room_id = add_new_room(self.num_questions, self.category, self.difficulty, self.host_token)
+        for question in questions:
+            add_new_questions(None, question["question"], question["correct_answer"], question["incorrect_answers"],
+                              question.get("category"), question.get("difficulty"), room_id)
+        return room_id
+
+    @staticmethod
+    def is_host(room_id, host_token):
+        """method checks that host_token is the token the room was created with"""
+        room = get_room(room_id)
+        if room is None or room[3] is None or not isinstance(host_token, str):
+            return False
+        return hmac.compare_digest(room[3], host_token)
+
+    @staticmethod
+    def join(room_id, user_id):
+        """method adds a game for the player in the room and returns its game_id,
+        the player's score is kept on their own game, returns None if there is no such room"""
+        room = get_room(room_id)
+        if room is None:
+            return None
+        num_questions, category, difficulty, _ = room
+        game_id = add_new_game(user_id, num_questions, category, difficulty, room_id)
+        score_ranking.game_added()
+        return game_id
+
+    @staticmethod
+    def next_question(room_id):
+        """method moves the room on to its next question, which every player in the room gets,
+        returns None when the room has no more questions"""
+        question = advance_room_question(room_id)
+        if question is None:
+            return None
+        question = _room_question(question)
+        # every player in the room gets the question now, so answer times are counted from here
+        question_served(None, question.question_id)
+        _room_questions.set(room_id, question)
+        return question.to_dict(room_id=room_id)
+
+    @staticmethod
+    def current_question(room_id):
+        """method returns the question the room is on, or None if the room hasn't started yet"""
+
+        def load():
+            question = get_room_question(room_id)
+            return None if question is None else _room_question(question)
+
+        question = _room_questions.get_or_set(room_id, load)
+        return None if question is None else question.to_dict(room_id=room_id)
+
+    @staticmethod
+    def show_leaderboard(room_id):
+        """method returns the usernames and scores of all the players in the room, best score first"""
+        return _room_leaderboards.get_or_set(room_id, lambda: LeaderboardEntry.from_rows(get_room_leaderboard(room_id)))
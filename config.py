@@ -1,3 +1,88 @@
+import os
+import secrets
+
 HOST = "localhost"  # this should ALWAYS BE localhost
 USER = "root"  # change to your MySQL user
 PASSWORD = "private"  # change to your MYSQL password
+# "mysql", or "sqlite" to keep the data in embedded SQLite database files in SQLITE_DIR, without a MySQL server
+DB_BACKEND = "mysql"
+SQLITE_DIR = "."
+# read replicas of the database on HOST as "host" or "host:port", pure reads are spread over them,
+# e.g. ["localhost:3307"] for a second local MySQL instance. Empty means every query goes to HOST
+REPLICA_HOSTS = []
+# databases games and questions are spread over, each created with trivia_game.sql.
+# Players, rooms and the best per player leaderboard are on the first one
+SHARDS = ["trivia_game"]
+# the MySQL server of each shard as "host" or "host:port", so the shards spread the load over several servers,
+# e.g. {"trivia_game_2": "10.0.0.2"}. Shards that aren't listed are on HOST, and only they use REPLICA_HOSTS
+SHARD_HOSTS = {}
+DB_POOL_SIZE = 10  # idle connections kept open per database for the unit of work of the next requests
+
+# Open Trivia DB client settings
+API_CONNECT_TIMEOUT = 3.05  # seconds to wait for the TCP connection to the API
+API_READ_TIMEOUT = 10  # seconds to wait for the API to send the response
+API_MAX_RETRIES = 3  # how many times a failed API request is retried
+API_BACKOFF_FACTOR = 0.5  # retries wait 0.5s, 1s, 2s, ...
+API_POOL_SIZE = 10  # keep-alive connections kept open to the API
+API_RATE_LIMIT = 0.2  # requests per second allowed by the API (one request every 5 seconds)
+API_RATE_LIMIT_MAX_WAIT = 6  # longest time (seconds) a request waits for the rate limiter
+API_BREAKER_FAILURE_THRESHOLD = 5  # failures in a row before the API is treated as down
+API_BREAKER_RESET_TIMEOUT = 30  # seconds before trying the API again after it was treated as down
+API_FALLBACK_CACHE_SIZE = 500  # questions kept in memory to use when the API is unavailable
+API_BATCH_SIZE = 50  # questions fetched per API call, the ones left over are used by the next games
+API_POOL_LOW_WATER = 15  # a question pool is refilled in the background when it has fewer questions than this
+# (category, difficulty) question pools filled when the app starts, None means any category/difficulty
+PREFILL_BUCKETS = [(None, None), (None, "easy"), (None, "medium"), (None, "hard")]
+
+# Game settings
+GAME_LENGTH = 15  # number of questions in a game when the player doesn't choose
+MAX_GAME_LENGTH = 500  # longest marathon game allowed
+QUESTION_CHUNK_SIZE = 15  # questions of a game added to the db at a time, the next chunk is added when they run out
+CORRECT_ANSWER_CACHE_SIZE = 100000  # correct answers kept in memory, so answers are checked without a db request
+# answer shuffles and lifeline results are worked out from this seed and the game, so they can be reproduced.
+# Anyone who knows it can work out where the correct answers are shown, so it is never kept in the code: it comes
+# from the TRIVIA_RNG_SEED environment variable, or is made up when the app starts. The order the answers were
+# shown in is stored, so games still check fine with a new seed, but apps running in more than one process should
+# share one TRIVIA_RNG_SEED, so a lifeline gives the same result whichever process serves it
+RNG_SEED = os.environ.get("TRIVIA_RNG_SEED") or secrets.token_hex(32)
+ANSWER_MAX_TYPOS = 1  # typos allowed in a correct answer, 0 means the normalized answers have to be equal
+ANSWER_TYPO_MIN_LENGTH = 5  # shorter answers have to be exact, otherwise e.g. "cat" would match "car"
+ROOM_CACHE_TTL = 1  # seconds a room's current question and leaderboard are served from memory
+SPEED_BONUS_MAX = 10  # speed points for a correct answer given straight away
+SPEED_BONUS_WINDOW = 30  # seconds after which a correct answer gets no speed points
+ANSWER_TIME_TTL = 3600  # seconds the time a question was served is remembered
+ANSWER_TIME_BATCH_SIZE = 500  # answer times written to the db in one request at most
+ANSWER_TIME_FLUSH_INTERVAL = 2  # seconds answer times wait in memory at most before they are written
+RANK_RELOAD_INTERVAL = 60  # seconds between reloads of the score counts ranks are worked out from
+
+# HTTP caching
+LEADERBOARD_MAX_AGE = 5  # seconds browsers and CDNs may use a cached leaderboard before revalidating it
+FIFTY_FIFTY_MAX_AGE = 3600  # seconds a fifty-fifty result may be cached, it never changes for a question
+LIFELINE_CACHE_SIZE = 100000  # lifeline results kept in memory, so repeat calls don't go to the db
+LIFELINE_CACHE_TTL = 3600  # seconds lifeline results and the lifelines games have left are kept in memory
+COMPRESS_MIN_SIZE = 1024  # responses smaller than this many bytes are not worth compressing
+COMPRESS_LEVEL = 5  # gzip (1-9) and brotli (0-11) compression level, higher is smaller but slower
+IDEMPOTENCY_KEY_TTL = 600  # seconds the response to a request with an Idempotency-Key is kept for retries
+IDEMPOTENCY_CACHE_SIZE = 100000  # responses kept for retries at most
+
+# Rate limits per endpoint: (requests per second, burst size), counted per client IP address
+RATE_LIMIT_ENABLED = True
+RATE_LIMITS = {
+    "add_game": (0.1, 5),  # every new game costs db writes and maybe an API call, so one every 10 seconds
+    "add_room": (0.1, 5),
+    "join_room": (0.5, 10),
+    "game_socket": (0.1, 5),  # a WebSocket connection starts a game too
+    "check_answer": (2, 10),
+    "next_question": (2, 10),
+    "end_game": (0.1, 5),
+    "fifty_fifty": (1, 5),  # the lifeline routes are named after the lifeline
+    "ask_audience": (1, 5),
+    "phone_a_friend": (1, 5),
+    "switch_question": (0.2, 5),  # a switch adds a question to the db
+    "next_room_question": (1, 5),
+    "room_question": (10, 20),
+    "room_leaderboard": (5, 20),
+    "show_leaderboard": (5, 20),
+    "show_rank": (1, 10)
+}
+RATE_LIMIT_REDIS_URL = None  # e.g. "redis://localhost:6379/0" to share the limits between app processes
@@ -1,24 +1,316 @@
+import contextvars
+import heapq
 import html
-import mysql.connector  # module that allows to establish database connection
+import itertools
 import random
-from config import USER, PASSWORD, HOST
+import threading
+import time
+from collections import Counter
+from config import HOST, REPLICA_HOSTS, SHARDS, SHARD_HOSTS, DB_BACKEND, SQLITE_DIR, DB_POOL_SIZE
+from storage_utils import get_storage
+from answer_utils import normalize_answer
+from rng_utils import rng_for, answer_order_for
 
 
 class DbConnectionError(Exception):
     pass
 
 
+# The leaderboard version goes up every time a score changes, so HTTP responses of the leaderboard can be
+# cached until it does. It is kept in the leaderboard_version row of the main database, so every app process
+# (and every server) gives the same version
+
+
+def _bump_leaderboard_version():
+    """DB function that adds 1 to the leaderboard version. It is called once the score change is committed,
+    if it fails the score is still saved, and the version goes up with the next score change"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        db_connection = _connect_to_db(MAIN_DB)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {MAIN_DB}")
+        query = """
+            UPDATE leaderboard_version
+            SET version = version + 1, modified_at = %s
+            WHERE id = 1
+        """
+        cur.execute(query, (time.time(),))
+        db_connection.commit()
+
+    except Exception as e:
+        print(f"Failed to update leaderboard version in DB. Error: {e}")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def get_leaderboard_version(window=None):
+    """DB function that returns the current leaderboard version string, the time (unix timestamp) it last changed
+    and, for a daily or weekly window, the first day of the current window (None without a window), as
+    (version, modified_at, window_start). The window start is worked out by the database, so it is the same day
+    as the one finish_game adds the games to, whatever the time zone of the app server.
+    It is read from the primary, as a version from a lagging replica would let clients keep a leaderboard
+    that is out of date"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        db_connection = _connect_to_db(MAIN_DB)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {MAIN_DB}")
+        window_start = "NULL" if window is None else _storage.window_starts[window]
+        cur.execute(f"SELECT version, modified_at, {window_start} FROM leaderboard_version WHERE id = 1")
+        version, modified_at, start = cur.fetchone()
+        return str(version), float(modified_at), None if start is None else str(start)
+
+    except Exception as e:
+        print(f"Failed to get leaderboard version from DB. Error: {e}")
+        raise DbConnectionError("Failed to get leaderboard version from DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+# the database the data is kept in, MySQL or an embedded SQLite database,
+# it connects and has the few bits of SQL that are different for each of them
+_storage = get_storage(DB_BACKEND, SQLITE_DIR, SHARDS)
+
+
+# Reads that don't need the latest data can go to a read replica. Once something in the current request
+# (or other context) has used the primary, e.g. to write, the following reads go to the primary too,
+# so the request reads its own writes. A client can also ask for strong consistency for the whole request
+_replicas = itertools.cycle(REPLICA_HOSTS)
+_replicas_lock = threading.Lock()
+_read_from_primary = contextvars.ContextVar("read_from_primary", default=False)
+
+
+def set_read_consistency(strong=False):
+    """starts the read consistency of a new request, with strong=True all its reads go to the primary,
+    otherwise reads go to the replicas until the request uses the primary"""
+    _read_from_primary.set(strong)
+
+
+# Games and questions are spread over the SHARDS databases, the shard of a game or question comes from its id.
+# Players, rooms and the best per player leaderboard are on the first (main) database. With more than one shard,
+# ids are given so that (id - 1) % len(SHARDS) is the index of the shard the row is on.
+# Each shard can be on its own server (SHARD_HOSTS), so a query only ever uses the tables of its own database,
+# what it needs from the main database (e.g. usernames) is read from there and merged in the app
+MAIN_DB = SHARDS[0]
+
+
+def _shard_of(row_id):
+    """returns the database the game or question with this id is on"""
+    if len(SHARDS) == 1:
+        return MAIN_DB
+    return SHARDS[(int(row_id) - 1) % len(SHARDS)]
+
+
+def _use_shard_ids(cur, db_name):
+    """makes the next AUTO_INCREMENT ids of the connection unique across the shards, the shard with index i gives
+    ids i + 1, i + 1 + len(SHARDS), ..., so no two shards give the same id and the id tells the shard"""
+    if len(SHARDS) > 1:
+        _storage.use_shard_ids(cur, len(SHARDS), SHARDS.index(db_name))
+
+
+def _shard_address(db_name):
+    """returns the (host, port) of the server the database is on, port is None for the default one"""
+    host, _, port = SHARD_HOSTS.get(db_name, HOST).partition(":")
+    return host, int(port) if port else None
+
+
+# A unit of work groups the db functions called by one HTTP request into one transaction per database,
+# on a connection taken from a pool, so a request that calls many of them pays for connecting and committing once.
+# Inside it the db functions get the connection wrapped so their own commit, rollback and close do nothing,
+# the unit of work commits (or rolls back) everything when the request ends.
+# Outside a unit of work (main.py, background threads) every db function still has its own connection
+_unit_of_work = contextvars.ContextVar("unit_of_work", default=None)
+_after_commit = contextvars.ContextVar("after_commit", default=None)  # callbacks run once the unit of work commits
+_pool = {}  # db_name -> idle connections of the finished units of work
+_pool_lock = threading.Lock()
+
+
+class _UnitOfWorkConnection:
+    """the connection of a unit of work as the db functions see it. A failed statement (e.g. a duplicate key)
+    is undone by the database itself, so rollback has nothing to do until the unit of work ends either"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def _pooled_connection(db_name):
+    with _pool_lock:
+        idle = _pool.get(db_name)
+        connection = idle.pop() if idle else None
+    if connection is not None and _storage.is_usable(connection):
+        return connection
+    if connection is not None:
+        try:
+            connection.close()
+        except _storage.Error:
+            pass
+    return _storage.connect(db_name, *_shard_address(db_name))
+
+
+def _release_connection(db_name, connection):
+    with _pool_lock:
+        idle = _pool.setdefault(db_name, [])
+        if len(idle) < DB_POOL_SIZE:
+            idle.append(connection)
+            return
+    connection.close()
+
+
+def start_unit_of_work():
+    """starts a unit of work in the current context (request), the following writes
+    are kept in its transactions until end_unit_of_work"""
+    _unit_of_work.set({})
+    _after_commit.set([])
+
+
+def after_commit(callback):
+    """calls callback once the writes made so far are committed, for things other requests can see that have to
+    wait for the commit, e.g. a new leaderboard version or a saved response. Inside a unit of work it is called
+    when the unit of work commits, and not at all if it is rolled back, outside one it is called straight away"""
+    callbacks = _after_commit.get()
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+def end_unit_of_work(commit=True):
+    """commits (or with commit=False rolls back) the transactions of the unit of work and gives its connections
+    back to the pool, does nothing if there is no unit of work. With more than one shard, each shard commits
+    on its own, if a commit fails the shards that weren't committed yet are rolled back and the error is raised.
+    The after_commit callbacks of the unit of work are called only once everything is committed"""
+    connections = _unit_of_work.get()
+    callbacks = _after_commit.get() or []
+    _unit_of_work.set(None)
+    _after_commit.set(None)
+    if connections:
+        _end_transactions(connections, commit)
+    if commit:
+        for callback in callbacks:
+            callback()
+
+
+def _end_transactions(connections, commit):
+    try:
+        for connection in connections.values():
+            if commit:
+                connection.commit()
+            else:
+                connection.rollback()
+    except _storage.Error as err:
+        print(f"Failed to commit the unit of work. Error: {err}")
+        for connection in connections.values():
+            try:
+                connection.rollback()
+            except _storage.Error:
+                pass
+        raise DbConnectionError("Failed to commit the unit of work")
+    finally:
+        for db_name, connection in connections.items():
+            _release_connection(db_name, connection)
+
+
 def _connect_to_db(db_name):
-    connection = mysql.connector.connect(
-        host=HOST,
-        user=USER,
-        password=PASSWORD,
-        auth_plugin="mysql_native_password",
-        database=db_name
-    )
+    connections = _unit_of_work.get()
+    if connections is None:
+        connection = _storage.connect(db_name, *_shard_address(db_name))
+    else:
+        if db_name not in connections:
+            connections[db_name] = _pooled_connection(db_name)
+        connection = _UnitOfWorkConnection(connections[db_name])
+    _read_from_primary.set(True)
     return connection
 
 
+def _connect_to_read_db(db_name):
+    """connects to one of the read replicas (in turn), or to the primary if there are no replicas,
+    if the request has to read its own writes, if the database isn't on HOST or if the replica can't be reached"""
+    if not REPLICA_HOSTS or _read_from_primary.get() or db_name in SHARD_HOSTS:
+        return _connect_to_db(db_name)
+
+    with _replicas_lock:
+        replica = next(_replicas)
+    host, _, port = replica.partition(":")
+    try:
+        return _storage.connect(db_name, host, int(port or 3306))
+    except _storage.Error as err:
+        print(f"Failed to connect to replica {replica}, reading from the primary. Error: {err}")
+        return _connect_to_db(db_name)
+
+
+def _fetch_from_all_shards(query, params=None):
+    """runs the read query on every shard and returns the rows of all of them"""
+    rows = []
+    for db_name in SHARDS:
+        cur = None
+        db_connection = None
+        try:
+            db_connection = _connect_to_read_db(db_name)
+            cur = db_connection.cursor()  # Create a cursor object to interact with the database
+            print(f"Connected to database {db_name}")
+            if params is None:
+                cur.execute(query)
+            else:
+                cur.execute(query, params)
+            rows += cur.fetchall()
+        finally:
+            if cur:
+                cur.close()  # Close the cursor if it exists
+            if db_connection:
+                db_connection.close()
+    return rows
+
+
+def _get_usernames(user_ids):
+    """reads the usernames of the players from the main database, returns {player_id: username}"""
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return {}
+    cur = None
+    db_connection = None
+    try:
+        db_connection = _connect_to_read_db(MAIN_DB)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {MAIN_DB}")
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cur.execute(f"SELECT id, username FROM players WHERE id IN ({placeholders})", tuple(user_ids))
+        return dict(cur.fetchall())
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def _with_usernames(rows):
+    """turns (user_id, score) rows from the shards into (username, score) rows,
+    the games of players that aren't found are left out"""
+    usernames = _get_usernames(user_id for user_id, _ in rows)
+    return [(usernames[user_id], score) for user_id, score in rows if user_id in usernames]
+
+
 def get_or_add_player_id(username):
     """function which checks whether username exists and returns player_id,
     # and if username does not exist, new username is added to players and returns new player_id"""
@@ -37,7 +329,7 @@ def get_or_add_player_id(username):
 
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
+        db_name = MAIN_DB
         db_connection = _connect_to_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
@@ -64,7 +356,7 @@ def get_or_add_player_id(username):
             player_id = cur.lastrowid
             print(f"For new username '{username}', new player_id: {player_id}\n")
 
-    except mysql.connector.Error as err:
+    except _storage.Error as err:
         print(f"MySQL Error: {err}")
 
     except Exception as exc:
@@ -81,8 +373,9 @@ def get_or_add_player_id(username):
         return player_id
 
 
-def add_new_game(user_id):
-    """DB function to add a new game to DB, returns game_id"""
+def add_new_game(user_id, num_questions=15, category=None, difficulty=None, room_id=None):
+    """DB function to add a new game to DB, takes user_id, number of questions in the game, category, difficulty
+    and the room the game is played in (None for a single player game), returns game_id"""
     db_connection = None  # Initialize db_connection to None
     cur = None  # Initialize cur to None
 
@@ -98,15 +391,19 @@ def add_new_game(user_id):
 
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
+        db_name = SHARDS[random.randrange(len(SHARDS))]  # a new game can go to any shard
         db_connection = _connect_to_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
 
         # SQL query for inserting a new row into the 'games' table with score set to 0
-        insert_query = "INSERT INTO games (user_id, score) VALUES (%s, 0)"
-        # value to be inserted
-        data = (user_id,)
+        insert_query = """
+            INSERT INTO games (user_id, score, num_questions, category, difficulty, room_id)
+            VALUES (%s, 0, %s, %s, %s, %s)
+        """
+        # values to be inserted
+        data = (user_id, num_questions, category, difficulty, room_id)
+        _use_shard_ids(cur, db_name)
         # Execute the query with the provided values
         cur.execute(insert_query, data)
         # Commit the changes to the database
@@ -117,7 +414,7 @@ def add_new_game(user_id):
         game_id = cur.lastrowid
         print(f"add_new_game function returns game_id: {game_id}\n")
 
-    except mysql.connector.Error as err:
+    except _storage.Error as err:
         print(f"MySQL Error: {err}\n")
         game_id = None  # Set game_id to None in case of an error
 
@@ -136,12 +433,14 @@ def add_new_game(user_id):
     return game_id
 
 
-def add_new_questions(game_id, question_text, correct_answer, incorrect_answers):
+def add_new_questions(game_id, question_text, correct_answer, incorrect_answers, category=None, difficulty=None,
+                      room_id=None):
     """DB function to add questions data to questions table in DB,
-     takes game_id, question_text, correct_answer, incorrect_answers"""
+     takes game_id, question_text, correct_answer, incorrect_answers, category and difficulty.
+     Questions of a room are shared by all the games in the room, so they have room_id and no game_id"""
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
+        db_name = MAIN_DB if game_id is None else _shard_of(game_id)  # room questions are on the main db
         db_connection = _connect_to_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
@@ -155,20 +454,31 @@ def add_new_questions(game_id, question_text, correct_answer, incorrect_answers)
                     answer_1,
                     answer_2,
                     answer_3,
-                    already_displayed
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    category,
+                    difficulty,
+                    room_id,
+                    already_displayed,
+                    normalized_answer
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
 
         # Tuple containing the values to be inserted
+        correct_answer = html.unescape(correct_answer).strip()
         values = (game_id,
                   html.unescape(question_text).strip(),
-                  html.unescape(correct_answer).strip(),
+                  correct_answer,
                   html.unescape(incorrect_answers[0]).strip(),
                   html.unescape(incorrect_answers[1]).strip(),
                   html.unescape(incorrect_answers[2]).strip(),
-                  False
+                  html.unescape(category).strip() if category else None,
+                  difficulty,
+                  room_id,
+                  False,
+                  # the correct answer as answers are compared, so it isn't normalized again for every answer
+                  normalize_answer(correct_answer)
                   )
 
+        _use_shard_ids(cur, db_name)
         # Execute the query with the provided values
         cur.execute(query, values)
 
@@ -183,7 +493,7 @@ def add_new_questions(game_id, question_text, correct_answer, incorrect_answers)
         # Close the cursor
         cur.close()
 
-    except mysql.connector.Error as err:
+    except _storage.Error as err:
         print(f"MySQL Error: {err}\n")
 
     except Exception as exc:
@@ -196,10 +506,12 @@ def add_new_questions(game_id, question_text, correct_answer, incorrect_answers)
 
 
 def display_question_to_player(game_id):
-    """DB function, that takes game_id and returns question_id, game_id, question_text and answers"""
+    """DB function, that takes game_id and returns question_id, game_id, question_text and answers.
+    The answers are shuffled and the order is stored, so the player can answer with the option id of an answer,
+    which is its position in answers (0 to 3)"""
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
+        db_name = _shard_of(game_id)
         db_connection = _connect_to_db(db_name)
         cur = db_connection.cursor()
 
@@ -221,26 +533,31 @@ def display_question_to_player(game_id):
             game_id = question_displayed[1]
             question_text = question_displayed[2]
             answers = [question_displayed[3], question_displayed[4], question_displayed[5], question_displayed[6]]
+            # randomize the order of answers, answer_order has the index in answers of each option shown,
+            # e.g. "2013", so the correct answer (index 0) is the option with id 1.
+            # The shuffle comes from the game's own seeded RNG, so it can be reproduced
+            order = answer_order_for(game_id, question_id, len(answers))
+            answer_order = "".join(str(index) for index in order)
 
             # SQL query to mark the question as provided using parameterized query
             query2 = """
                 UPDATE questions
-                SET already_displayed = True
+                SET already_displayed = True, answer_order = %s
                 WHERE id = %s
             """
-            cur.execute(query2, (question_id,))
+            cur.execute(query2, (answer_order, question_id))
             db_connection.commit()
 
             return {
                 "question_id": question_id,
                 "game_id": game_id,
                 "question_text": question_text,
-                "answers": random.sample(answers, len(answers))  # randomize the order of answers, so they will be
+                "answers": [answers[index] for index in order]
             }
         else:
             return {"message": "No more questions"}
 
-    except mysql.connector.Error as err:
+    except _storage.Error as err:
         print(f"MySQL Error: {err}\n")
         return {"error": "An error occurred while fetching the question"}
 
@@ -250,19 +567,239 @@ def display_question_to_player(game_id):
             db_connection.close()
 
 
+# the lifelines a game has, with the games column that counts how many of each it has left
+LIFELINE_COLUMNS = {
+    "fifty_fifty": "fifty_fifty_left",
+    "ask_audience": "ask_audience_left",
+    "phone_a_friend": "phone_a_friend_left",
+    "switch_question": "switch_question_left"
+}
+
+
+def use_lifeline(question_id, lifeline, game_id=None, in_rooms=True):
+    """uses one of the game's lifelines of this kind on the question. The question has to be the one the game
+    is answering: shown, of the game or of its room (unless in_rooms is False), not switched and not answered by
+    the game yet. game_id can be left out for questions of a single player game. One lifeline is taken from the
+    game's count with a conditional decrement, in the same transaction that records the use, so two requests at once
+    can't both take the last one.
+    Using the same lifeline again on the same question doesn't take another one.
+    Returns {"game_id": int, "left": int} with the lifelines of this kind the game has left,
+    or {"message": "Lifeline not available"} / {"message": "No lifelines left"}"""
+    column = LIFELINE_COLUMNS[lifeline]
+    question = _fetch_lifeline_question(question_id)
+    if question is None or not question[2] or question[3] is not None:
+        return {"message": "Lifeline not available"}
+    question_game_id, question_room_id = question[0], question[1]
+    if question_game_id is None and not in_rooms:
+        return {"message": "Lifeline not available"}
+    if game_id is None:
+        game_id = question_game_id
+    if game_id is None or (question_game_id is not None and int(question_game_id) != int(game_id)):
+        return {"message": "Lifeline not available"}
+
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # the game, its answers and its lifeline uses are on the game's shard
+        db_name = _shard_of(game_id)
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+        _storage.start_write(cur)
+
+        query = f"""
+            SELECT room_id, {column},
+                   EXISTS (SELECT 1 FROM answers WHERE game_id = games.id AND question_id = %s),
+                   EXISTS (SELECT 1 FROM lifeline_uses WHERE game_id = games.id AND question_id = %s AND lifeline = %s)
+            FROM games
+            WHERE id = %s
+        """
+        cur.execute(query, (question_id, question_id, lifeline, game_id))
+        game = cur.fetchone()
+        if game is None:
+            db_connection.rollback()
+            return {"message": "Lifeline not available"}
+        room_id, left, answered, already_used = game
+        if answered or (question_game_id is None and (room_id is None or int(room_id) != int(question_room_id))):
+            db_connection.rollback()
+            return {"message": "Lifeline not available"}
+        if already_used:
+            db_connection.rollback()
+            return {"game_id": game_id, "left": left}
+
+        # the count only goes down if the game has one left, so it never goes below 0
+        cur.execute(f"UPDATE games SET {column} = {column} - 1 WHERE id = %s AND {column} > 0", (game_id,))
+        if cur.rowcount == 0:
+            db_connection.rollback()
+            return {"message": "No lifelines left"}
+        try:
+            cur.execute("INSERT INTO lifeline_uses (game_id, question_id, lifeline) VALUES (%s, %s, %s)",
+                        (game_id, question_id, lifeline))
+        except _storage.IntegrityError:
+            # another request used it on this question at the same time, so this one doesn't count
+            cur.execute(f"UPDATE games SET {column} = {column} + 1 WHERE id = %s", (game_id,))
+            db_connection.commit()
+            return {"game_id": game_id, "left": left}
+        db_connection.commit()
+        return {"game_id": game_id, "left": left - 1}
+
+    except Exception as e:
+        print(f"Failed to use lifeline. Error: {e}")
+        raise DbConnectionError("Failed to use lifeline")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def _fetch_lifeline_question(question_id):
+    """returns game_id, room_id, already_displayed and switched_to of the question,
+    or None if there is no such question"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # the question has just been shown, so it is read from the primary
+        db_connection = _connect_to_db(_shard_of(question_id))
+        cur = db_connection.cursor()
+        query = """
+            SELECT questions.game_id, questions.room_id, questions.already_displayed, questions.switched_to,
+                   rooms.current_question_id
+            FROM questions
+            LEFT JOIN rooms ON rooms.id = questions.room_id
+            WHERE questions.id = %s
+        """
+        cur.execute(query, (question_id,))
+        return cur.fetchone()
+
+    finally:
+        if cur:
+            cur.close()
+        if db_connection:
+            db_connection.close()
+
+
+def get_question_pool(question_id):
+    """returns the game_id of the question, the category of its game and the difficulty of the question,
+    which is the pool a question to switch it for is taken from, or None if it isn't the question of a game"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # a question and its game are on the same shard
+        db_connection = _connect_to_db(_shard_of(question_id))
+        cur = db_connection.cursor()
+        query = """
+            SELECT questions.game_id, games.category, questions.difficulty
+            FROM questions
+            JOIN games ON games.id = questions.game_id
+            WHERE questions.id = %s
+        """
+        cur.execute(query, (question_id,))
+        return cur.fetchone()
+
+    except Exception:
+        raise DbConnectionError("Failed to fetch the question from DB")
+
+    finally:
+        if cur:
+            cur.close()
+        if db_connection:
+            db_connection.close()
+
+
+def switch_question(question_id, question_text, correct_answer, incorrect_answers, category=None, difficulty=None):
+    """DB function for the switch the question lifeline, adds the new question to the game of question_id, shows it
+    in its place and returns it like display_question_to_player. The old question gets the id of the new one in
+    switched_to, so it no longer counts in the length of the game and can't be switched twice.
+    Returns {"message": "Lifeline not available"} if it was already switched"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        db_name = _shard_of(question_id)
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+        _storage.start_write(cur)
+
+        # the question row stays locked until the commit, so a second switch of the same question waits here and
+        # then finds switched_to set, before it has added a question of its own
+        cur.execute(f"SELECT game_id FROM questions WHERE id = %s AND switched_to IS NULL {_storage.lock_rows}",
+                    (question_id,))
+        question = cur.fetchone()
+        if question is None or question[0] is None:
+            db_connection.rollback()
+            return {"message": "Lifeline not available"}
+        game_id = question[0]
+
+        query = """
+                INSERT INTO questions (
+                    game_id,
+                    question,
+                    correct_answer,
+                    answer_1,
+                    answer_2,
+                    answer_3,
+                    category,
+                    difficulty,
+                    already_displayed,
+                    normalized_answer
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """
+        correct_answer = html.unescape(correct_answer).strip()
+        question_text = html.unescape(question_text).strip()
+        incorrect_answers = [html.unescape(answer).strip() for answer in incorrect_answers[:3]]
+        values = (game_id, question_text, correct_answer, *incorrect_answers,
+                  html.unescape(category).strip() if category else None, difficulty, True,
+                  normalize_answer(correct_answer))
+        _use_shard_ids(cur, db_name)
+        cur.execute(query, values)
+        new_question_id = cur.lastrowid
+
+        # the new question is shown straight away, in the order of the game's RNG
+        answers = [correct_answer, *incorrect_answers]
+        order = answer_order_for(game_id, new_question_id, len(answers))
+        cur.execute("UPDATE questions SET answer_order = %s WHERE id = %s",
+                    ("".join(str(index) for index in order), new_question_id))
+        cur.execute("UPDATE questions SET switched_to = %s WHERE id = %s", (new_question_id, question_id))
+        db_connection.commit()
+
+        return {
+            "question_id": new_question_id,
+            "game_id": game_id,
+            "question_text": question_text,
+            "answers": [answers[index] for index in order]
+        }
+
+    except Exception as e:
+        print(f"Failed to switch question. Error: {e}")
+        raise DbConnectionError("Failed to switch question")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
 def display_question_to_player_fifty_fifty(question_id):
-    """connects to db and returns question_id, game_id, question_text
-     and two options for the question including one correct"""
+    """connects to db and returns question_id, game_id, question_text and two options for the question including
+    one correct, with their option ids, in the order the answers were shown. The wrong answer that is kept
+    is picked from the RNG of the game the first time and stored, so asking again gives the same two answers.
+    Whether the player may use the lifeline is checked by use_lifeline first"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
-        db_connection = _connect_to_db(db_name)
+        db_name = _shard_of(question_id)
+        db_connection = _connect_to_read_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
 
         # SQL query to fetch the question details
         query = """
-                SELECT id, game_id, question, correct_answer, answer_1
+                SELECT id, game_id, question, correct_answer, answer_1, answer_2, answer_3, answer_order,
+                       fifty_fifty_kept
                 FROM questions
                 WHERE id = %s
             """
@@ -270,33 +807,59 @@ def display_question_to_player_fifty_fifty(question_id):
         cur.execute(query, (question_id,))
         question_displayed = cur.fetchone()
 
-        if question_displayed:
-            question_id = question_displayed[0]
-            game_id = question_displayed[1]
-            question_text = question_displayed[2]
-            answers = [question_displayed[3], question_displayed[4]]
-            randomized_answers = random.sample(answers,
-                                               len(answers))  # randomize the order of the two remaining answers to display to player
-
-            return {
-                "question_id": question_id,
-                "game_id": game_id,
-                "question_text": question_text,
-                "answers": randomized_answers
-            }
-        else:
+        if not question_displayed:
             # If question is not found, raise an exception
             raise ValueError(f"Question with ID {question_id} not found.")
 
+        question_id, game_id, question_text = question_displayed[0:3]
+        answers = question_displayed[3:7]
+        stored_order, kept = question_displayed[7:9]
+        if kept is None:
+            # the first fifty-fifty of the question, the wrong answer kept comes from the game's seeded RNG
+            kept = rng_for(game_id, "fifty_fifty", question_id).randint(1, len(answers) - 1)
+            _store_fifty_fifty(question_id, kept)
+
+        # the two answers are shown in the order the question was shown in, with their option ids
+        order = [int(index) for index in stored_order]
+        option_ids = [option_id for option_id, index in enumerate(order) if index in (0, kept)]
+        return {
+            "question_id": question_id,
+            "game_id": game_id,
+            "question_text": question_text,
+            "answers": [answers[order[option_id]] for option_id in option_ids],
+            "option_ids": option_ids
+        }
+
     except Exception as exc:
         return {"error": str(exc)}
 
-
     finally:
         if cur:
             cur.close()  # Close the cursor if it exists
         if db_connection:
-            db_connection.commit()  # Commit the changes
+            db_connection.close()
+
+
+def _store_fifty_fifty(question_id, kept):
+    """stores the wrong answer (1 to 3 for answer_1 to answer_3) the fifty-fifty of the question keeps,
+    unless it was stored already, e.g. by a request that came in at the same time"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        db_connection = _connect_to_db(_shard_of(question_id))
+        cur = db_connection.cursor()
+        query = """
+            UPDATE questions
+            SET fifty_fifty_kept = %s
+            WHERE id = %s AND fifty_fifty_kept IS NULL
+        """
+        cur.execute(query, (kept, question_id))
+        db_connection.commit()
+
+    finally:
+        if cur:
+            cur.close()
+        if db_connection:
             db_connection.close()
 
 
@@ -306,7 +869,7 @@ def get_correct_answer(question_id):
     db_connection = None  # Initialize db_connection outside the try block
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
+        db_name = _shard_of(question_id)
         db_connection = _connect_to_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
@@ -340,6 +903,49 @@ def get_correct_answer(question_id):
             db_connection.close()
 
 
+def get_question(question_id):
+    """takes question_id and returns question_id, question_text, correct answer and the three incorrect answers
+    of the question, in the same order as the room questions, the normalized correct answer, the order the
+    answers were shown in (None if it wasn't stored, e.g. for room questions), its game_id (None for room questions)
+    and whether it has been displayed"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database, the question may have just been added
+        db_name = _shard_of(question_id)
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        query = """
+            SELECT id, question, correct_answer, answer_1, answer_2, answer_3, normalized_answer, answer_order,
+                   game_id, already_displayed
+            FROM questions
+            WHERE id = %s
+        """
+        cur.execute(query, (question_id,))
+        question = cur.fetchone()
+
+        # Check if no question is found
+        if question is None:
+            raise ValueError(f"No question found with ID {question_id}")
+
+        return question
+
+    except ValueError as ve:
+        raise ve  # Reraise the specific ValueError
+
+    except Exception as e:
+        print(f"Failed to fetch question from DB. Error: {e}")
+        raise DbConnectionError("Failed to fetch question from DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
 def update_game_score(game_id):
     """DB function that takes game_id and updates the game score."""
     cur = None  # Initialize cur outside the try block
@@ -350,7 +956,7 @@ def update_game_score(game_id):
 
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
+        db_name = _shard_of(game_id)
         db_connection = _connect_to_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
@@ -363,6 +969,8 @@ def update_game_score(game_id):
         """
         cur.execute(query_to_update_score, (game_id,))
         db_connection.commit()
+        # the leaderboard has changed, so cached copies of it are out of date now
+        after_commit(_bump_leaderboard_version)
 
     except Exception as e:
         print(f"Failed to update game score in DB. Error: {e}")
@@ -375,13 +983,204 @@ def update_game_score(game_id):
             db_connection.close()
 
 
+def record_answer(game_id, question_id, user_answer, is_correct, speed_points=0):
+    """DB function that saves the player's answer to a question and, if it is correct, adds 1 to the game score
+    and speed_points to its speed score, all in one transaction. The question has to be one the game has been shown:
+    of the game, displayed and not switched, or the question its room is on now, so a room question can't be
+    answered once the host has moved on to the next one. A question can be answered only once per game,
+    so a retried answer is not scored again: returns True if this was the first answer, False if the question
+    had already been answered, and None if the game can't answer the question"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = _shard_of(game_id)
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+        _storage.start_write(cur)
+
+        # the question is on the game's shard, or on the main database if it is a room question,
+        # a question on any other shard can't be answered by the game
+        if _shard_of(question_id) == db_name:
+            query = """
+                SELECT games.room_id, questions.game_id, questions.room_id, questions.already_displayed,
+                       questions.switched_to, rooms.current_question_id,
+                       EXISTS (SELECT 1 FROM answers WHERE answers.game_id = games.id AND answers.question_id = %s)
+                FROM games
+                LEFT JOIN questions ON questions.id = %s
+                LEFT JOIN rooms ON rooms.id = questions.room_id
+                WHERE games.id = %s
+            """
+            cur.execute(query, (question_id, question_id, game_id))
+            row = cur.fetchone()
+        else:
+            query = """
+                SELECT games.room_id,
+                       EXISTS (SELECT 1 FROM answers WHERE answers.game_id = games.id AND answers.question_id = %s)
+                FROM games
+                WHERE games.id = %s
+            """
+            cur.execute(query, (question_id, game_id))
+            game = cur.fetchone()
+            # room questions don't change once they are shown, so they are read from the main database on its own
+            question = _get_room_question_state(question_id) if _shard_of(question_id) == MAIN_DB else None
+            row = None if game is None else (game[0], *(question or (None, None, None, None, None)), game[1])
+        if row is None:
+            db_connection.rollback()
+            return None
+        room_id, question_game_id, question_room_id, already_displayed, switched_to, current_question_id, answered = row
+        if question_game_id is not None:
+            owned = int(question_game_id) == int(game_id)
+        else:
+            owned = (question_room_id is not None and room_id is not None and int(question_room_id) == int(room_id)
+                     and current_question_id is not None and int(current_question_id) == int(question_id))
+        if not owned or not already_displayed or switched_to is not None:
+            db_connection.rollback()
+            return None
+        if answered:
+            db_connection.rollback()
+            return False
+
+        # (game_id, question_id) is the primary key of answers, so a second answer sent at the same time fails
+        # instead of being saved
+        query = """
+            INSERT INTO answers (game_id, question_id, submitted_answer, is_correct, speed_points)
+            VALUES (%s, %s, %s, %s, %s)
+        """
+        try:
+            cur.execute(query, (game_id, question_id, user_answer, is_correct, speed_points if is_correct else 0))
+        except _storage.IntegrityError as err:
+            if not _storage.is_duplicate_key(err):
+                raise
+            db_connection.rollback()
+            return False
+
+        if is_correct:
+            query_to_update_score = """
+                UPDATE games
+                SET score = score + 1, speed_score = speed_score + %s
+                WHERE id = %s
+            """
+            cur.execute(query_to_update_score, (speed_points, game_id))
+        db_connection.commit()
+        if is_correct:
+            # the leaderboard has changed, so cached copies of it are out of date now
+            after_commit(_bump_leaderboard_version)
+        return True
+
+    except Exception as e:
+        print(f"Failed to record answer in DB. Error: {e}")
+        raise DbConnectionError("Failed to record answer in DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def _get_room_question_state(question_id):
+    """DB function that returns game_id, room_id, already_displayed, switched_to and the current question of the
+    room of a question on the main database, or None if there is no such question"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        db_connection = _connect_to_db(MAIN_DB)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {MAIN_DB}")
+        query = """
+            SELECT questions.game_id, questions.room_id, questions.already_displayed, questions.switched_to,
+                   rooms.current_question_id
+            FROM questions
+            LEFT JOIN rooms ON rooms.id = questions.room_id
+            WHERE questions.id = %s
+        """
+        cur.execute(query, (question_id,))
+        return cur.fetchone()
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def get_answer(game_id, question_id):
+    """DB function that returns the answer the player gave to a question, whether it was correct and the speed points
+    it got, as (submitted_answer, is_correct, speed_points), or None if the question hasn't been answered in this
+    game"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = _shard_of(game_id)
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        query = """
+            SELECT submitted_answer, is_correct, speed_points
+            FROM answers
+            WHERE game_id = %s AND question_id = %s
+        """
+        cur.execute(query, (game_id, question_id))
+        return cur.fetchone()
+
+    except Exception as e:
+        print(f"Failed to fetch answer from DB. Error: {e}")
+        raise DbConnectionError("Failed to fetch answer from DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def add_answer_times(rows):
+    """DB function that saves a batch of answer times for analytics in one request per shard,
+    rows are (game_id, question_id, served_at, answered_at, is_correct) with the times as unix timestamps,
+    served_at is None when the app didn't know when the question was served"""
+    query = f"""
+        INSERT INTO answer_times (game_id, question_id, served_at, answered_at, time_taken_ms, is_correct)
+        VALUES (%s, %s, {_storage.from_unixtime}, {_storage.from_unixtime}, %s, %s)
+    """
+    # the times of each game go to the shard of the game
+    values_by_shard = {}
+    for game_id, question_id, served_at, answered_at, is_correct in rows:
+        time_taken_ms = None if served_at is None else round((answered_at - served_at) * 1000)
+        values_by_shard.setdefault(_shard_of(game_id), []).append(
+            (game_id, question_id, served_at, answered_at, time_taken_ms, is_correct))
+
+    for db_name, values in values_by_shard.items():
+        cur = None  # Initialize cur outside the try block
+        db_connection = None  # Initialize db_connection outside the try block
+        try:
+            db_connection = _connect_to_db(db_name)
+            cur = db_connection.cursor()  # Create a cursor object to interact with the database
+            print(f"Connected to database {db_name}")
+            cur.executemany(query, values)
+            db_connection.commit()
+
+        except Exception as e:
+            print(f"Failed to add answer times to DB. Error: {e}")
+            raise DbConnectionError("Failed to add answer times to DB")
+
+        finally:
+            if cur:
+                cur.close()  # Close the cursor if it exists
+            if db_connection:
+                db_connection.close()
+
+
 def get_user_score(game_id):
     """DB function, that takes game_id and returns the game score"""
     cur = None  # Initialize cur outside the try block
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
-        db_connection = _connect_to_db(db_name)
+        db_name = _shard_of(game_id)
+        db_connection = _connect_to_read_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
 
@@ -407,29 +1206,191 @@ def get_user_score(game_id):
             db_connection.close()
 
 
-def get_leaderboard():
-    """connects to db and returns ten top scores of the players in a game and their usernames"""
+def get_game_scores(game_id):
+    """DB function that returns the score of the game and its speed score (the speed points of its correct answers),
+    as (score, speed_score), or None if there is no such game"""
     cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = _shard_of(game_id)
+        db_connection = _connect_to_read_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        cur.execute("SELECT score, speed_score FROM games WHERE id = %s", (game_id,))
+        return cur.fetchone()
+
+    except Exception as e:
+        print(f"Failed to fetch scores from DB. Error: {e}")
+        raise DbConnectionError("Failed to fetch scores from DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def get_game_progress(game_id):
+    """DB function, that takes game_id and returns the number of questions in the game, its category and difficulty,
+    how many questions were already added to the db for it and its room_id (None if it isn't in a room),
+    returns None if there is no such game. Questions that were switched for another one don't count"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
+        db_name = _shard_of(game_id)
         db_connection = _connect_to_db(db_name)
         cur = db_connection.cursor()  # Create a cursor object to interact with the database
         print(f"Connected to database {db_name}")
 
-        # SQL query to fetch the score details
+        # SQL query to fetch the game settings and count its questions
         query = """
-            SELECT players.username, games.score
-            FROM players
-            JOIN games ON players.id = games.user_id
-            ORDER BY games.score DESC
+            SELECT games.num_questions, games.category, games.difficulty, COUNT(questions.id), games.room_id
+            FROM games
+            LEFT JOIN questions ON questions.game_id = games.id AND questions.switched_to IS NULL
+            WHERE games.id = %s
+            GROUP BY games.id
         """
+        cur.execute(query, (game_id,))
+        return cur.fetchone()
+
+    except Exception:
+        raise DbConnectionError("Failed to fetch game progress from DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def finish_game(game_id):
+    """DB function that marks the game as finished and adds its score to the current daily and weekly leaderboards
+    and to the player's best score if it beats it, returns False if the game had already finished (or doesn't exist).
+    The best score is on the main database, it is written once the game's shard has committed (or in the same
+    unit of work), a best score that failed to be written is a DbConnectionError like any other"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = _shard_of(game_id)
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        # only the first call finishes the game, so its score goes into the leaderboards once
+        cur.execute("UPDATE games SET finished_at = CURRENT_TIMESTAMP WHERE id = %s AND finished_at IS NULL",
+                    (game_id,))
+        if cur.rowcount != 1:
+            db_connection.rollback()
+            return False
+
+        cur.execute("SELECT user_id, score FROM games WHERE id = %s", (game_id,))
+        user_id, score = cur.fetchone()
+        # the player is on the main database, which can be on another server
+        username = _get_usernames([user_id]).get(user_id)
+        if username is not None:
+            for window, window_start in _storage.window_starts.items():
+                query = f"""
+                    INSERT INTO leaderboard_windows (window_name, window_start, game_id, username, score)
+                    VALUES (%s, {window_start}, %s, %s, %s)
+                """
+                cur.execute(query, (window, game_id, username, score))
+        db_connection.commit()
+
+        if username is not None:
+            _update_player_best(user_id, username, score, game_id)
+        # the daily, weekly and best per player leaderboards have changed
+        after_commit(_bump_leaderboard_version)
+        return True
+
+    except Exception as e:
+        print(f"Failed to finish game in DB. Error: {e}")
+        raise DbConnectionError("Failed to finish game in DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
 
-        cur.execute(query)
-        leaderboard = cur.fetchall()
 
-        # Return the top 10 entries if available
-        return leaderboard[:10]
+def _update_player_best(user_id, username, score, game_id):
+    """DB function that sets the player's best score on the main database, it is replaced only if this game beat it"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        db_connection = _connect_to_db(MAIN_DB)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {MAIN_DB}")
+        query = f"""
+            INSERT INTO player_best (user_id, username, best_score, game_id)
+            VALUES (%s, %s, %s, %s)
+            {_storage.upsert_player_best}
+        """
+        cur.execute(query, (user_id, username, score, game_id))
+        db_connection.commit()
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def get_window_leaderboard(window):
+    """connects to db and returns the ten top scores of the games finished in the current daily or weekly window
+    and the usernames of their players"""
+    try:
+        # reads only the top of the current window of each shard, using the (window_name, window_start, score) index
+        query = f"""
+            SELECT username, score
+            FROM leaderboard_windows
+            WHERE window_name = %s AND window_start = {_storage.window_starts[window]}
+            ORDER BY score DESC
+            LIMIT 10
+        """
+        return heapq.nlargest(10, _fetch_from_all_shards(query, (window,)), key=lambda row: row[1])
+
+    except Exception:
+        raise DbConnectionError("Failed to retrieve leaderboard from DB")
+
+
+def get_score_counts():
+    """DB function that returns how many games there are with each score, as (score, number of games) rows"""
+    try:
+        query = "SELECT score, COUNT(*) FROM games WHERE score IS NOT NULL GROUP BY score"
+        counts = Counter()
+        for score, count in _fetch_from_all_shards(query):
+            counts[score] += count
+        return sorted(counts.items())
+
+    except Exception:
+        raise DbConnectionError("Failed to fetch score counts from DB")
+
+
+def get_best_leaderboard():
+    """connects to db and returns the ten players with the best scores, each player once with their best score"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = MAIN_DB
+        db_connection = _connect_to_read_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        # player_best has one row per player, so the top 10 is read straight from the best_score index
+        query = """
+            SELECT username, best_score
+            FROM player_best
+            ORDER BY best_score DESC
+            LIMIT 10
+        """
+        cur.execute(query)
+        return cur.fetchall()
 
     except Exception:
         raise DbConnectionError("Failed to retrieve leaderboard from DB")
@@ -441,12 +1402,52 @@ def get_leaderboard():
             db_connection.close()
 
 
+def get_leaderboard():
+    """connects to db and returns ten top scores of the players in a game and their usernames"""
+    try:
+        # SQL query to fetch the score details, the top 10 of each shard
+        query = """
+            SELECT user_id, score
+            FROM games
+            WHERE user_id IS NOT NULL
+            ORDER BY score DESC
+            LIMIT 10
+        """
+        leaderboard = _fetch_from_all_shards(query)
+
+        # Return the top 10 entries of all the shards, with the usernames from the main database
+        return _with_usernames(heapq.nlargest(10, leaderboard, key=lambda row: row[1]))
+
+    except Exception:
+        raise DbConnectionError("Failed to retrieve leaderboard from DB")
+
+
+def get_speed_leaderboard():
+    """connects to db and returns ten top speed scores of the players in a game and their usernames"""
+    try:
+        # SQL query to fetch the speed scores, the top 10 of each shard
+        query = """
+            SELECT user_id, speed_score
+            FROM games
+            WHERE user_id IS NOT NULL
+            ORDER BY speed_score DESC
+            LIMIT 10
+        """
+        leaderboard = _fetch_from_all_shards(query)
+
+        # Return the top 10 entries of all the shards, with the usernames from the main database
+        return _with_usernames(heapq.nlargest(10, leaderboard, key=lambda row: row[1]))
+
+    except Exception:
+        raise DbConnectionError("Failed to retrieve speed leaderboard from DB")
+
+
 def get_all_answers(question_id):
     """DB function, that takes question_id and returns four answers"""
     try:
         # Establish a connection to the MySQL database
-        db_name = "trivia_game"
-        db_connection = _connect_to_db(db_name)
+        db_name = _shard_of(question_id)
+        db_connection = _connect_to_read_db(db_name)
         cur = db_connection.cursor()
 
         print(f"Connected to database {db_name}")
@@ -469,3 +1470,171 @@ def get_all_answers(question_id):
         if db_connection:
             cur.close()
             db_connection.close()
+
+
+def add_new_room(num_questions=15, category=None, difficulty=None, host_token=None):
+    """DB function to add a new multiplayer room to DB, takes the number of questions, category, difficulty
+    and the token of the room's host, returns room_id"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = MAIN_DB
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        # SQL query for inserting a new row into the 'rooms' table
+        insert_query = """
+            INSERT INTO rooms (num_questions, category, difficulty, host_token)
+            VALUES (%s, %s, %s, %s)
+        """
+        cur.execute(insert_query, (num_questions, category, difficulty, host_token))
+        db_connection.commit()
+        print("Room successfully added to DB!")
+
+        # Get the ID of the last inserted row (room_id)
+        room_id = cur.lastrowid
+        print(f"add_new_room function returns room_id: {room_id}\n")
+        return room_id
+
+    except Exception as e:
+        print(f"Failed to add room to DB. Error: {e}")
+        raise DbConnectionError("Failed to add room to DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def get_room(room_id):
+    """DB function, that takes room_id and returns the number of questions, category, difficulty and host token
+    of the room, returns None if there is no such room"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = MAIN_DB
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        query = """
+            SELECT num_questions, category, difficulty, host_token
+            FROM rooms
+            WHERE id = %s
+        """
+        cur.execute(query, (room_id,))
+        return cur.fetchone()
+
+    except Exception:
+        raise DbConnectionError("Failed to fetch room from DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def advance_room_question(room_id):
+    """DB function, that takes room_id, moves the room on to its next question and returns
+    question_id, question_text, answers, normalized_answer and answer_order of it, returns None when the room
+    has no more questions. The order the answers are shown in is stored like display_question_to_player does,
+    so every player and every app process checks option ids against the order the room was shown"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = MAIN_DB
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        # SQL query to fetch the next question of the room, locking it so two hosts can't both move the room on
+        _storage.start_write(cur)
+        query = f"""
+            SELECT id, question, correct_answer, answer_1, answer_2, answer_3, normalized_answer
+            FROM questions
+            WHERE room_id = %s
+            AND already_displayed = False
+            ORDER BY id
+            LIMIT 1
+            {_storage.lock_rows}
+        """
+        cur.execute(query, (room_id,))
+        question = cur.fetchone()
+
+        if question is None:
+            db_connection.commit()
+            return None
+
+        # mark the question as provided, with the order of its answers, and make it the current question of the room
+        answer_order = "".join(str(index) for index in answer_order_for(None, question[0]))
+        cur.execute("UPDATE questions SET already_displayed = True, answer_order = %s WHERE id = %s",
+                    (answer_order, question[0]))
+        cur.execute("UPDATE rooms SET current_question_id = %s WHERE id = %s", (question[0], room_id))
+        db_connection.commit()
+        return (*question, answer_order)
+
+    except Exception as e:
+        print(f"Failed to move room to the next question. Error: {e}")
+        raise DbConnectionError("Failed to move room to the next question")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def get_room_question(room_id):
+    """DB function, that takes room_id and returns question_id, question_text, answers, normalized_answer and
+    answer_order of the current question of the room, returns None if the room hasn't started yet"""
+    cur = None  # Initialize cur outside the try block
+    db_connection = None  # Initialize db_connection outside the try block
+    try:
+        # Establish a connection to the MySQL database
+        db_name = MAIN_DB
+        db_connection = _connect_to_db(db_name)
+        cur = db_connection.cursor()  # Create a cursor object to interact with the database
+        print(f"Connected to database {db_name}")
+
+        query = """
+            SELECT questions.id, questions.question, questions.correct_answer,
+                   questions.answer_1, questions.answer_2, questions.answer_3, questions.normalized_answer,
+                   questions.answer_order
+            FROM rooms
+            JOIN questions ON questions.id = rooms.current_question_id
+            WHERE rooms.id = %s
+        """
+        cur.execute(query, (room_id,))
+        return cur.fetchone()
+
+    except Exception:
+        raise DbConnectionError("Failed to fetch room question from DB")
+
+    finally:
+        if cur:
+            cur.close()  # Close the cursor if it exists
+        if db_connection:
+            db_connection.close()
+
+
+def get_room_leaderboard(room_id):
+    """connects to db and returns the usernames and scores of all the players in a room, best score first"""
+    try:
+        # the games of the room can be on any shard
+        query = """
+            SELECT user_id, score
+            FROM games
+            WHERE room_id = %s
+        """
+        rows = sorted(_fetch_from_all_shards(query, (room_id,)), key=lambda row: row[1], reverse=True)
+        return _with_usernames(rows)
+
+    except Exception:
+        raise DbConnectionError("Failed to retrieve room leaderboard from DB")
+
@@ -0,0 +1,123 @@
+import functools
+import json
+
+from classes.game import Game
+from classes.lifeline import Lifeline
+from classes.models import GameSession
+from classes.user import User
+from config import GAME_LENGTH
+
+
+class GameSocketSession:
+    """Game loop of one player over a WebSocket connection.
+
+    The client sends JSON messages with a "type" field and gets JSON messages back, following the same rules
+    as the HTTP endpoints in app.py:
+    - {"type": "start", "user_name": str, "category", "difficulty", "num_questions" optional}
+        -> {"type": "started", "player_id", "game_id"} and the first {"type": "question", ...}
+    - {"type": "answer", "option_id": int} (position of the answer in the question's answers) or
+      {"type": "answer", "answer": str}
+        -> {"type": "result", "score", "correct_answer", "correct_option", "result", "speed_points", "speed_score"}
+           and straight away the next {"type": "question"}
+           or {"type": "end", "score"} after the last question
+    - {"type": "<lifeline>"} for each lifeline in Lifeline.registry (fifty_fifty, ask_audience, phone_a_friend,
+      switch_question) -> {"type": "lifeline", "lifeline": "<lifeline>", "data": ...}, the data of switch_question
+      is the question the player answers instead
+    - {"type": "score"} -> {"type": "score", "score"}
+    Anything invalid gets {"type": "error", "message": str} back."""
+
+    def __init__(self):
+        self.game = None  # GameSession of the game once it has started
+
+    def handle(self, raw_message):
+        """takes one message from the client and returns the list of messages to send back"""
+        try:
+            message = json.loads(raw_message)
+        except (TypeError, ValueError):
+            return [self._error("Invalid message. Expected JSON")]
+        if not isinstance(message, dict):
+            return [self._error("Invalid message. Expected JSON")]
+
+        handlers = {
+            "start": self._start,
+            "answer": self._answer,
+            "score": self._send_score
+        }
+        lifeline = Lifeline.registry.get(message.get("type"))
+        handler = handlers.get(message.get("type"))
+        if lifeline is not None:
+            handler = functools.partial(self._lifeline, lifeline)
+        if handler is None:
+            return [self._error("Unknown message type")]
+        if message["type"] != "start" and self.game is None:
+            return [self._error("Game has not started")]
+
+        try:
+            return handler(message)
+        except Exception as e:
+            # Log the exception details for debugging
+            print(f"An error occurred: {str(e)}")
+            return [self._error("Internal server error")]
+
+    @staticmethod
+    def _error(message):
+        return {"type": "error", "message": message}
+
+    def _question_message(self):
+        """gets the next question of the game, or ends the game if there are no more questions"""
+        question = Game.provide_question(self.game.game_id)
+        if question is None or "question_id" not in question:
+            self.game.finished = True
+            return {"type": "end", "score": self.game.score}
+        self.game.question_id = question["question_id"]
+        return {"type": "question", **question}
+
+    def _start(self, message):
+        if self.game is not None:
+            return [self._error("Game has already started")]
+        user_name = message.get("user_name")
+        if not isinstance(user_name, str) or not (1 <= len(user_name) <= 40):
+            return [self._error("User name must be between 1 and 40 characters")]
+        error = Game.settings_error(message)
+        if error:
+            return [self._error(error)]
+
+        category, difficulty = message.get("category"), message.get("difficulty")
+        num_questions = message.get("num_questions", GAME_LENGTH)
+        # the questions are fetched before the player and the game are written, like in /add_new_game
+        questions = Game.first_questions(category, difficulty, num_questions)
+        player_id = User(user_name).get_or_create()
+        game = Game(player_id, category, difficulty, num_questions)
+        self.game = GameSession(game.start_game(questions), player_id)
+        started = {"type": "started", "player_id": player_id, "game_id": self.game.game_id}
+        return [started, self._question_message()]
+
+    def _answer(self, message):
+        if self.game.finished:
+            return [self._error("End of game")]
+        if "answer" not in message and "option_id" not in message:
+            return [self._error("Missing required fields")]
+        if "option_id" in message:
+            if not Game.is_valid_option(message["option_id"]):
+                return [self._error("Invalid option")]
+            result = Game.check_answer(self.game.game_id, self.game.question_id, option_id=message["option_id"])
+        else:
+            result = Game.check_answer(self.game.game_id, self.game.question_id, message["answer"])
+        if "message" in result:
+            return [self._error(result["message"])]
+        self.game.score = result["score"]
+        # the next question is pushed straight away, the client doesn't have to ask for it
+        return [{"type": "result", **result}, self._question_message()]
+
+    def _lifeline(self, lifeline, message):
+        """uses one of the game's lifelines on the current question, the server counts what is left"""
+        data = lifeline.use(self.game.question_id, self.game.game_id)
+        if isinstance(data, dict) and "message" in data:
+            return [self._error(data["message"])]
+        if lifeline.replaces_question:
+            # the player answers the new question instead
+            self.game.question_id = data["question_id"]
+        return [{"type": "lifeline", "lifeline": lifeline.name, "data": data}]
+
+    def _send_score(self, message):
+        return [{"type": "score", "score": self.game.score}]
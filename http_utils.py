@@ -0,0 +1,222 @@
+import functools
+import gzip
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+from cache_utils import TTLCache
+from config import COMPRESS_MIN_SIZE, COMPRESS_LEVEL, IDEMPOTENCY_KEY_TTL, IDEMPOTENCY_CACHE_SIZE
+from db_utils import after_commit
+
+# orjson, msgpack and brotli are optional, without them responses use the standard json module,
+# MessagePack is not offered and gzip is used for compression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPES = ("application/x-msgpack", "application/msgpack")
+COMPRESSIBLE_MIMETYPES = (JSON_MIMETYPE,) + MSGPACK_MIMETYPES
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider for Flask that uses orjson when it is installed, and sends MessagePack instead of JSON
+    to clients that ask for it in their Accept header"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    @staticmethod
+    def default(obj):
+        """orjson only serializes plain tuples and lists, so tuple-backed types like LeaderboardEntry
+        and deques are sent as lists"""
+        if isinstance(obj, (tuple, deque)):
+            return list(obj)
+        return DefaultJSONProvider.default(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+
+        mimetype = _preferred_mimetype()
+        if mimetype in MSGPACK_MIMETYPES:
+            body = msgpack.packb(obj, default=self._msgpack_default)
+        elif orjson is not None:
+            # orjson gives bytes, which go into the response without being decoded first
+            body = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            body = super().dumps(obj) + "\n"
+        response = self._app.response_class(body, mimetype=mimetype)
+        if msgpack is not None:
+            response.vary.add("Accept")
+        return response
+
+    def _msgpack_default(self, obj):
+        """msgpack can't pack everything json can, e.g. deques and dates, they are packed as lists
+        or through the json default"""
+        if hasattr(obj, "__iter__") and not isinstance(obj, (str, bytes, dict)):
+            return list(obj)
+        return self.default(obj)
+
+
+def _preferred_mimetype():
+    """returns the response mimetype the client prefers, MessagePack if it asks for it and msgpack is installed"""
+    if msgpack is None:
+        return JSON_MIMETYPE
+    return request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, default=JSON_MIMETYPE)
+
+
+def compress_response(response):
+    """after_request hook that compresses bigger JSON and MessagePack responses with brotli or gzip,
+    depending on what the client accepts"""
+    if (response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        response.set_data(brotli.compress(body, quality=COMPRESS_LEVEL))
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+
+    # the compressed body is a different representation of the same data, so the ETag becomes weak
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def use_fast_responses(app):
+    """sets up the fast JSON/MessagePack provider and response compression for the app"""
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+
+
+def _is_not_modified(etag, last_modified):
+    """checks the conditional headers of the request against the current etag and last modified time,
+    If-None-Match is used when the client sends it, otherwise If-Modified-Since"""
+    if request.if_none_match:
+        # weak comparison, compressed responses have weak ETags
+        return etag is not None and request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        # HTTP dates have whole seconds only
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def cache_response(max_age=0, public=False, no_store=False, etag=None):
+    """decorator for GET routes that adds a Cache-Control header, an ETag and Last-Modified,
+    and answers conditional requests with 304 Not Modified.
+
+    etag, if given, is a function called with the route's arguments that returns (etag, last_modified) without
+    building the response, so a 304 can be sent without running the route at all. last_modified is a unix timestamp
+    or None. Without it, the ETag is a hash of the response body."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if no_store:
+                response = current_app.make_response(view(*args, **kwargs))
+                response.headers["Cache-Control"] = "no-store"
+                return response
+
+            tag = last_modified = None
+            if etag is not None:
+                tag, timestamp = etag(*args, **kwargs)
+                if timestamp is not None:
+                    last_modified = datetime.fromtimestamp(timestamp, timezone.utc)
+                if _is_not_modified(tag, last_modified):
+                    response = current_app.response_class(status=304)
+                else:
+                    response = current_app.make_response(view(*args, **kwargs))
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+
+            # errors are never cached
+            if response.status_code not in (200, 304):
+                return response
+
+            response.cache_control.max_age = max_age
+            if public:
+                response.cache_control.public = True
+            else:
+                response.cache_control.private = True
+            if tag is not None:
+                response.set_etag(tag)
+            elif response.status_code == 200:
+                response.add_etag()
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
+
+
+def _idempotency_scope():
+    """returns what an Idempotency-Key is kept under besides the key itself: the route, the client's IP address
+    and the game_id of the request, so a client that reuses or guesses another client's key doesn't get the other
+    client's response"""
+    data = request.get_json(silent=True)
+    game_id = data.get("game_id") if isinstance(data, dict) else None
+    return request.endpoint, request.remote_addr, str(game_id)
+
+
+def idempotent(view):
+    """decorator for routes that change something, a request sent again with the same Idempotency-Key header
+    (from the same client, for the same game) gets the response of the first request back, without the route
+    running again. Server errors are not kept, so a request that failed can be retried with the same key,
+    and a response is only kept once the writes of the request are committed. Requests without the header
+    run as usual"""
+    responses = TTLCache(max_size=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_KEY_TTL)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get("Idempotency-Key")
+        if not header:
+            return view(*args, **kwargs)
+        key = (*_idempotency_scope(), header)
+
+        saved = responses.get(key)
+        if saved is not None:
+            body, status, mimetype = saved
+            response = current_app.response_class(body, status=status, mimetype=mimetype)
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code < 500:
+            saved = (response.get_data(), response.status_code, response.mimetype)
+            after_commit(lambda: responses.set(key, saved))
+        return response
+
+    return wrapper
@@ -12,13 +12,24 @@ COLORS = {
 }
 
 
-def print_colored_answers(answers):
+def print_colored_answers(answers, all_answers=None):
+    """prints the answers with their numbers, the number of an answer is its position in all the answers
+    of the question (e.g. when the 50/50 hint leaves two of them)"""
     color_cycle = itertools.cycle(COLORS.keys())
+    all_answers = all_answers or answers
 
     for answer in answers:
         color_name = next(color_cycle)
         color = COLORS.get(color_name)
-        print(f"{color}{answer}{COLORS['end']}")
+        print(f"{color}{all_answers.index(answer) + 1}. {answer}{COLORS['end']}")
+
+
+def choose_option(answers):
+    """asks the player for the number of their answer and returns its option id (position in answers)"""
+    choice = input(f"To answer, type the number of your chosen answer (1-{len(answers)}): ")
+    while not (choice.isdigit() and 1 <= int(choice) <= len(answers)):
+        choice = input(f"Invalid input. Please type a number between 1 and {len(answers)}: ")
+    return int(choice) - 1
 
 
 def next_question(game_id):
@@ -29,25 +40,28 @@ def next_question(game_id):
     return result.json()
 
 
-def fifty_fifty(question_id):
+def fifty_fifty(question_id, game_id=None):
     result = requests.get(
         "http://127.0.0.1:5000/fifty_fifty/{}".format(question_id),
+        params={"game_id": game_id},
         headers={"content-type": "application/json"}
     )
     return result.json()
 
 
-def ask_audience(question_id):
+def ask_audience(question_id, game_id=None):
     result = requests.get(
         "http://127.0.0.1:5000/ask_audience/{}".format(question_id),
+        params={"game_id": game_id},
         headers={"content-type": "application/json"}
     )
     return result.json()
 
 
-def add_game(user_name):
+def add_game(user_name, num_questions):
     info = {
-        "user_name": user_name
+        "user_name": user_name,
+        "num_questions": num_questions
     }
 
     result = requests.post(
@@ -58,10 +72,10 @@ def add_game(user_name):
     return result.json()
 
 
-def check_question(game_id, answer, question_id):
+def check_question(game_id, option_id, question_id):
     info = {
         "game_id": game_id,
-        "answer": answer,
+        "option_id": option_id,
         "question_id": question_id
     }
 
@@ -73,9 +87,26 @@ def check_question(game_id, answer, question_id):
     return result.json()
 
 
-def show_leaderboard():
+def finish_game(game_id):
+    result = requests.put(
+        "http://127.0.0.1:5000/finish_game/{}".format(game_id),
+        headers={"content-type": "application/json"}
+    )
+    return result.json()
+
+
+def show_rank(game_id):
+    result = requests.get(
+        "http://127.0.0.1:5000/rank/{}".format(game_id),
+        headers={"content-type": "application/json"}
+    )
+    return result.json()
+
+
+def show_leaderboard(window="all", mode="games"):
     result = requests.get(
         "http://127.0.0.1:5000/leaderboard/",
+        params={"window": window, "mode": mode},
         headers={"content-type": "application/json"}
     )
     return result.json()
@@ -83,12 +114,15 @@ def show_leaderboard():
 
 def handle_user_choice_end_of_game(choice):
     if choice == "1":
-        print("\nLEADERBOARD TOP 10:\n")
-        leaderboard = show_leaderboard()
-        for line in leaderboard:
-            for element in line:
-                print(element, end=' ')
-            print()
+        leaderboards = (("daily", "games", "TODAY"), ("weekly", "games", "THIS WEEK"), ("all", "games", "ALL TIME"),
+                        ("all", "best", "BEST PLAYERS"))
+        for window, mode, title in leaderboards:
+            print(f"\nLEADERBOARD TOP 10 {title}:\n")
+            leaderboard = show_leaderboard(window, mode)
+            for line in leaderboard:
+                for element in line:
+                    print(element, end=' ')
+                print()
 
         # Ask if the user wants to play again or exit after viewing the leaderboard
         sub_options = input("\nNow, please choose one of the following options:\n1. Play Again\n2. Exit\n\nEnter "
@@ -115,12 +149,32 @@ BEFORE RUNNING THIS FILE DON'T FORGET TO:
 """
 
 
+# game lengths the player can choose from
+GAME_MODES = {
+    "1": ("Quick play", 5),
+    "2": ("Classic", 15),
+    "3": ("Marathon", 100)
+}
+
+
+def choose_game_length():
+    """asks the player to choose the game mode and returns its number of questions, classic by default"""
+    print("Please choose the game mode:")
+    for key, (mode_name, num_questions) in GAME_MODES.items():
+        print(f"{key}. {mode_name} ({num_questions} questions)")
+    choice = input("\nEnter the number of your choice: ")
+    mode_name, num_questions = GAME_MODES.get(choice, GAME_MODES["2"])
+    print(f"\n{mode_name} it is!\n")
+    return num_questions
+
+
 def run():
     fifty_fifty_hints = 2
     ask_audience_hints = 2
 
-    def display_hints(fifty_fifty_hints, ask_audience_hints, question_id):
+    def display_hints(fifty_fifty_hints, ask_audience_hints, question):
         """Function to run all hints logic"""
+        question_id = question["question_id"]
         need_hint = ""
         if fifty_fifty_hints > 0 and ask_audience_hints > 0:
             need_hint = input(
@@ -140,12 +194,18 @@ def run():
                 return fifty_fifty_hints, ask_audience_hints
 
         if need_hint == "1":
-            fifty_fifty_info = fifty_fifty(question_id)
+            fifty_fifty_info = fifty_fifty(question_id, question.get("game_id"))
+            if 'answers' not in fifty_fifty_info:
+                print(fifty_fifty_info.get('message', 'The 50/50 hint is not available'))
+                return fifty_fifty_hints, ask_audience_hints
             print("Please choose one answer: ")
-            print_colored_answers(fifty_fifty_info['answers'])
+            print_colored_answers(fifty_fifty_info['answers'], question['answers'])
             fifty_fifty_hints -= 1
         elif need_hint == "2":
-            audience_response = ask_audience(question_id)
+            audience_response = ask_audience(question_id, question.get("game_id"))
+            if 'message' in audience_response:
+                print(audience_response['message'])
+                return fifty_fifty_hints, ask_audience_hints
             for option in audience_response:
                 print(f"{option[0]} % of the audience thinks the correct answer is {option[1]}")
             ask_audience_hints -= 1
@@ -161,7 +221,8 @@ def run():
 
     player = input("\nYour name is ... ")
     print(f"\n{player.capitalize()}, welcome to the Quiz!\n")
-    print("You will be presented with 15 questions to test your knowledge.\n")
+    num_questions = choose_game_length()
+    print(f"You will be presented with {num_questions} questions to test your knowledge.\n")
     print(
         f"You have {fifty_fifty_hints} 50/50 hints available, as well as {ask_audience_hints} chances to ask the "
         f"audience what they think the"
@@ -169,7 +230,7 @@ def run():
     print("Feel free to use your hints at any moment during the quiz.")
     print("Good luck and enjoy the challenge!")
 
-    info = add_game(player)
+    info = add_game(player, num_questions)
     error_message = info.get('message', '')
     if error_message:
         print(info["message"], ". Try again\n")
@@ -177,21 +238,20 @@ def run():
     else:
         game_id = info["game_id"]
         question = info["question"]
-        question_id = question["question_id"]
         print("\nQUESTION: ", question['question_text'])
         print("Please choose one answer: ")
         print_colored_answers(question['answers'])
         print(f"Hints left: 50/50: {fifty_fifty_hints}, Ask audience: {ask_audience_hints}")
         if fifty_fifty_hints > 0 or ask_audience_hints > 0:
-            fifty_fifty_hints, ask_audience_hints = display_hints(fifty_fifty_hints, ask_audience_hints, question_id)
-        answer = input(f"To answer, either copy & paste your chosen answer, or type it (case-insensitive): ")
-        result = check_question(game_id, answer, question['question_id'])
+            fifty_fifty_hints, ask_audience_hints = display_hints(fifty_fifty_hints, ask_audience_hints, question)
+        option_id = choose_option(question['answers'])
+        result = check_question(game_id, option_id, question['question_id'])
         correct_answer = result['correct_answer']
         is_player_answer_correct = result['result']
         score = result['score']
         print(f"Correct Answer: {correct_answer}, Result: {is_player_answer_correct}, Score: {score}\n")
 
-        for n in range(14):
+        for n in range(num_questions - 1):
             continue_agreement = input("To go the next question, press y: ").lower()
             while continue_agreement != "y":
                 print("Invalid input. Please enter 'y' to continue to the next question.")
@@ -199,24 +259,28 @@ def run():
 
             if continue_agreement == "y":
                 question = next_question(game_id)
-                question_id = question["question_id"]
                 print("\nQUESTION: ", question['question_text'])
                 print("Please choose one answer: ")
                 print_colored_answers(question['answers'])
                 print(f"Hints left: 50/50: {fifty_fifty_hints}, Ask audience: {ask_audience_hints}")
                 if fifty_fifty_hints > 0 or ask_audience_hints > 0:
                     fifty_fifty_hints, ask_audience_hints = display_hints(fifty_fifty_hints, ask_audience_hints,
-                                                                          question_id)
-                answer = input(
-                    f"To answer, either copy & paste your chosen answer, or type it (case-insensitive): ")
-                result = check_question(game_id, answer, question['question_id'])
+                                                                          question)
+                option_id = choose_option(question['answers'])
+                result = check_question(game_id, option_id, question['question_id'])
                 correct_answer = result['correct_answer']
                 is_player_answer_correct = result['result']
                 score = result['score']
                 print(f"Correct Answer: {correct_answer}, Result: {is_player_answer_correct}, Score: {score}\n")
 
-        # At the end of the game, show final score:
-        print(f"\nCongratulations! Your total score is: {score}\n\n")
+        # At the end of the game, the game goes into today's and this week's leaderboards
+        finish_game(game_id)
+        # and the final score is shown:
+        print(f"\nCongratulations! Your total score is: {score}\n")
+        rank = show_rank(game_id)
+        if "rank" in rank:
+            print(f"You are #{rank['rank']:,} of {rank['total']:,}, "
+                  f"better than {rank['percentile']}% of all games!\n\n")
 
         # Then present player with options to see Leaderboard, Play Again, or Exit:
         options = input(
@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+class FenwickTree:
+    """Counts per index with prefix sums in O(log n), index goes from 0 to size - 1"""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """returns the sum of the counts from 0 up to and including index"""
+        index = min(index, self.size - 1) + 1
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+
+class ScoreRanking:
+    """Number of games with each score, kept in a Fenwick tree, so the rank of a score among all the games
+    is found in O(log max_score) instead of counting the games with a higher score in the db.
+
+    The counts are loaded from the db with `load_counts` (which returns (score, number of games) rows) the first time
+    they are needed, and loaded again every `reload_interval` seconds to pick up games of other app processes.
+    In between, this process keeps them up to date as its games start and score"""
+
+    def __init__(self, max_score, load_counts, reload_interval=60):
+        self.max_score = max_score
+        self.load_counts = load_counts
+        self.reload_interval = reload_interval
+        self.tree = None
+        self.total = 0
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def _index(self, score):
+        return max(0, min(score, self.max_score))
+
+    def _reload_if_needed(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.reload_interval:
+            return
+        tree = FenwickTree(self.max_score + 1)
+        total = 0
+        for score, count in self.load_counts():
+            tree.add(self._index(score), count)
+            total += count
+        with self.lock:
+            self.tree, self.total, self.loaded_at = tree, total, time.monotonic()
+
+    def game_added(self, score=0):
+        with self.lock:
+            if self.tree is not None:
+                self.tree.add(self._index(score), 1)
+                self.total += 1
+
+    def score_changed(self, old_score, new_score):
+        with self.lock:
+            if self.tree is not None and self._index(old_score) != self._index(new_score):
+                self.tree.add(self._index(old_score), -1)
+                self.tree.add(self._index(new_score), 1)
+
+    def rank(self, score):
+        """returns (rank, total, percentile) of a game with this score: its position among all the games
+        (games with the same score share it), the number of games and the percentage of games with a lower score"""
+        self._reload_if_needed()
+        with self.lock:
+            not_higher = self.tree.prefix_sum(self._index(score))
+            lower = self.tree.prefix_sum(self._index(score) - 1) if self._index(score) > 0 else 0
+            total = self.total
+        rank = total - not_higher + 1
+        percentile = round(100 * lower / total, 1) if total else 0.0
+        return rank, total, percentile
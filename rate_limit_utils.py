@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+
+from flask import request
+
+from cache_utils import TTLCache
+
+# redis is optional, it is only needed when several app processes should share the same rate limits
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class TokenBucket:
+    """Rate limiter, the bucket refills with `rate` tokens per second up to `capacity` tokens"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def take(self):
+        """takes one token if there is one without waiting,
+        returns 0 if a token was taken, otherwise the number of seconds until there is one"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=0):
+        """takes one token, waiting up to `timeout` seconds for it, returns True if a token was taken"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            wait = (1 - self.tokens) / self.rate
+            if wait > timeout:
+                return False
+            # reserve the token now, so that other threads queue up behind this one
+            self.tokens -= 1
+        time.sleep(wait)
+        return True
+
+
+class MemoryBucketStore:
+    """Keeps one token bucket per key in the memory of this process.
+    A bucket that hasn't been used for capacity / rate seconds is full again, so it is dropped after that"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = {}  # (rate, capacity) -> TTLCache of key -> TokenBucket
+
+    def take(self, key, rate, capacity):
+        cache = self.buckets.get((rate, capacity))
+        if cache is None:
+            cache = self.buckets.setdefault((rate, capacity), TTLCache(self.max_keys, ttl=capacity / rate))
+        bucket = cache.get_or_set(key, lambda: TokenBucket(rate, capacity))
+        # using the bucket keeps it in the cache for another capacity / rate seconds
+        cache.set(key, bucket)
+        return bucket.take()
+
+
+# token bucket in redis, so that all app processes share the same limits, returns the seconds to wait (0 if allowed)
+_REDIS_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """Keeps the token buckets in redis, so several app processes share the same rate limits"""
+
+    def __init__(self, url):
+        if redis is None:
+            raise ImportError("redis is not installed, run pip install redis to share rate limits")
+        self.client = redis.Redis.from_url(url)
+        self.take_script = self.client.register_script(_REDIS_TAKE_SCRIPT)
+
+    def take(self, key, rate, capacity):
+        return float(self.take_script(keys=[f"rate_limit:{key}"], args=[rate, capacity, time.time()]))
+
+
+class RateLimiter:
+    """Limits how often each client can call each endpoint.
+
+    limits maps an endpoint name to (rate, capacity): the client can make `capacity` requests in a burst,
+    and then `rate` requests per second. Clients are told by their IP address.
+    Requests over the limit get 429 Too Many Requests with a Retry-After header."""
+
+    def __init__(self, limits, store=None, enabled=True):
+        self.limits = limits
+        self.store = store or MemoryBucketStore()
+        self.enabled = enabled
+
+    def init_app(self, app):
+        app.before_request(self.check_request)
+
+    def check_request(self):
+        """before_request hook, returns the 429 response if the client is over the limit of the endpoint"""
+        if not self.enabled or request.endpoint not in self.limits:
+            return None
+
+        rate, capacity = self.limits[request.endpoint]
+        try:
+            wait = self.store.take(f"{request.endpoint}:{request.remote_addr}", rate, capacity)
+        except Exception as e:
+            # if the shared store is down, the request is let through rather than failing every request
+            print(f"Failed to check rate limit. Error: {e}")
+            return None
+
+        if wait > 0:
+            retry_after = max(1, math.ceil(wait))
+            return {"message": "Too many requests"}, 429, {"Retry-After": str(retry_after)}
+        return None
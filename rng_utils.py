@@ -0,0 +1,21 @@
+import hashlib
+import random
+
+from config import RNG_SEED
+
+
+def rng_for(game_id, *key, seed=RNG_SEED):
+    """returns a random.Random of its own for the game and key (e.g. "answer_order", question_id), seeded from
+    (seed, game_id, *key) with SHA-256. The same arguments always give the same numbers, so a shuffle or lifeline
+    result can be worked out again instead of being stored, and request threads don't share the global random
+    state. game_id is None for the questions of a room, which are the same for every player in it.
+    The parts are compared as strings, so the id 3 from the db and "3" from a URL give the same numbers"""
+    material = "\x1f".join(str(part) for part in (seed, game_id, *key))
+    digest = hashlib.sha256(material.encode()).digest()
+    return random.Random(int.from_bytes(digest[:16], "big"))
+
+
+def answer_order_for(game_id, question_id, size=4):
+    """returns the order the answers of a question are shown in, the index in (correct_answer, answer_1, ...)
+    of each option, from the RNG of the question"""
+    return rng_for(game_id, "answer_order", question_id).sample(range(size), size)
@@ -0,0 +1,162 @@
+import os
+import sqlite3
+
+import mysql.connector  # module that allows to establish database connection
+from mysql.connector import errorcode
+
+from config import USER, PASSWORD, HOST
+
+SQLITE_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trivia_game_sqlite.sql")
+
+
+class MySQLStorage:
+    """Storage backend for a MySQL server, the queries in db_utils are written for it,
+    the attributes below are the few bits of SQL that differ between backends"""
+
+    name = "mysql"
+    Error = mysql.connector.Error
+    IntegrityError = mysql.connector.IntegrityError
+
+    # first day of the current window of each time-windowed leaderboard, weeks start on Monday
+    window_starts = {
+        "daily": "CURRENT_DATE",
+        "weekly": "CURRENT_DATE - INTERVAL WEEKDAY(CURRENT_DATE) DAY"
+    }
+    # turns a unix timestamp parameter into a timestamp
+    from_unixtime = "FROM_UNIXTIME(%s)"
+    # added to a SELECT to lock the rows it reads until the transaction ends
+    lock_rows = "FOR UPDATE"
+    # the player's best score is replaced only if the game beat it,
+    # game_id is set before best_score, so it still compares with the old best
+    upsert_player_best = """
+        ON DUPLICATE KEY UPDATE
+            game_id = IF(VALUES(best_score) > best_score, VALUES(game_id), game_id),
+            best_score = GREATEST(best_score, VALUES(best_score))
+    """
+
+    def connect(self, db_name, host=None, port=None):
+        connection = mysql.connector.connect(
+            host=host or HOST,
+            port=port or 3306,
+            user=USER,
+            password=PASSWORD,
+            auth_plugin="mysql_native_password",
+            database=db_name
+        )
+        return connection
+
+    def is_usable(self, connection):
+        """checks that a pooled connection is still open, MySQL closes connections that were idle for too long"""
+        return connection.is_connected()
+
+    def start_write(self, cur):
+        """starts a transaction that is going to write, MySQL starts one with the first query anyway"""
+        pass
+
+    @staticmethod
+    def is_duplicate_key(err):
+        """checks if the IntegrityError is a duplicate primary or unique key, not e.g. a foreign key failure"""
+        return err.errno == errorcode.ER_DUP_ENTRY
+
+    def use_shard_ids(self, cur, shard_count, shard_index):
+        """makes the next AUTO_INCREMENT ids of the connection i + 1, i + 1 + shard_count, ..."""
+        cur.execute("SET SESSION auto_increment_increment = %s, auto_increment_offset = %s",
+                    (shard_count, shard_index + 1))
+
+
+class _SQLiteCursor:
+    """sqlite3 cursor that takes the %s placeholders of the MySQL queries"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace("%s", "?"), params)
+
+    def executemany(self, query, seq_of_params):
+        return self._cursor.executemany(query.replace("%s", "?"), seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _SQLiteConnection:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return _SQLiteCursor(self._connection.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class SQLiteStorage:
+    """Storage backend for embedded SQLite databases, one file per database in `directory`,
+    so a small single server deployment runs without a MySQL server.
+    The tables are created from trivia_game_sqlite.sql the first time a database is used.
+    Databases are in WAL mode, so reads don't wait for writes"""
+
+    name = "sqlite"
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+
+    window_starts = {
+        "daily": "date('now')",
+        "weekly": "date('now', '-6 days', 'weekday 1')"
+    }
+    # answer times are kept as unix timestamps
+    from_unixtime = "%s"
+    # SQLite locks the whole database for writes instead, see start_write
+    lock_rows = ""
+    upsert_player_best = """
+        ON CONFLICT (user_id) DO UPDATE SET
+            game_id = CASE WHEN excluded.best_score > best_score THEN excluded.game_id ELSE game_id END,
+            best_score = MAX(best_score, excluded.best_score)
+    """
+
+    def __init__(self, directory=".", timeout=10):
+        self.directory = directory
+        self.timeout = timeout
+
+    def connect(self, db_name, host=None, port=None):
+        path = os.path.join(self.directory, f"{db_name}.db")
+        connection = sqlite3.connect(path, timeout=self.timeout, check_same_thread=False)
+        if connection.execute("SELECT name FROM sqlite_master WHERE name = 'games'").fetchone() is None:
+            # a new database, WAL mode is kept in the database file, so it is set once
+            connection.execute("PRAGMA journal_mode = WAL")
+            with open(SQLITE_SCHEMA_FILE) as schema:
+                connection.executescript(schema.read())
+        connection.execute("PRAGMA foreign_keys = ON")
+        # in WAL mode the database can't be corrupted by a crash with synchronous NORMAL,
+        # only the last transactions may be lost, and commits don't wait for the disk
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return _SQLiteConnection(connection)
+
+    def is_usable(self, connection):
+        return True
+
+    def start_write(self, cur):
+        """takes the write lock of the database now, so the rows read before writing can't change.
+        A transaction that is already open has written, so it has the lock already"""
+        if not cur.connection.in_transaction:
+            cur.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def is_duplicate_key(err):
+        return err.sqlite_errorcode in (sqlite3.SQLITE_CONSTRAINT_PRIMARYKEY, sqlite3.SQLITE_CONSTRAINT_UNIQUE)
+
+    def use_shard_ids(self, cur, shard_count, shard_index):
+        """does nothing, get_storage allows SQLite with a single shard only, whose ids need no offset"""
+
+
+def get_storage(backend, sqlite_dir=".", shards=("trivia_game",)):
+    """returns the storage backend for the DB_BACKEND setting, mysql or sqlite. The settings are checked here,
+    when the app starts, SQLite keeps everything in one database, so it can't be used with more than one shard"""
+    if backend == "mysql":
+        return MySQLStorage()
+    if backend == "sqlite":
+        if len(shards) > 1:
+            raise ValueError("SQLite storage supports a single database only, set SHARDS to one database")
+        return SQLiteStorage(sqlite_dir)
+    raise ValueError(f"Unknown storage backend {backend}")
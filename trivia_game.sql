@@ -17,6 +17,12 @@ FLOW OF GAME:
         - AT SAME TIME: if answer is correct score of the player is increased by 1, and his new score is returned
 */
 
+-- With several SHARDS in config.py, every shard database is created from this file with its own name,
+-- and without the sample data, on its own server (SHARD_HOSTS) or next to the others. players, rooms, player_best,
+-- leaderboard_version and the questions of rooms are only used on the first (main) database, while a game can be
+-- on any shard, so there are no foreign keys between them: games.user_id, games.room_id, answers.question_id (a room question) and
+-- player_best.game_id can point to another database. No query reads the tables of another database either,
+-- the app reads what it needs from the main database and merges it.
 DROP DATABASE IF EXISTS trivia_game;
 
 CREATE DATABASE trivia_game;
@@ -27,11 +33,36 @@ CREATE TABLE players (
   username varchar(40) NOT NULL
 );
 
+-- a room is a multiplayer game, all the players in it answer the same questions at the same time
+CREATE TABLE rooms (
+  id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  num_questions int NOT NULL DEFAULT 15,
+  category int DEFAULT NULL,
+  difficulty varchar(10) DEFAULT NULL,
+  current_question_id int DEFAULT NULL,
+  -- given to whoever created the room, only they can move the room on to its next question
+  host_token char(32) DEFAULT NULL
+);
+
 CREATE TABLE games (
   id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
   user_id int DEFAULT NULL,
   score int DEFAULT NULL,
-  FOREIGN KEY (user_id) REFERENCES players (id)
+  num_questions int NOT NULL DEFAULT 15,
+  category int DEFAULT NULL,
+  difficulty varchar(10) DEFAULT NULL,
+  room_id int DEFAULT NULL,
+  -- extra points for answering correctly quickly, on top of score
+  speed_score int NOT NULL DEFAULT 0,
+  created_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  finished_at timestamp NULL DEFAULT NULL,
+  -- lifelines the game has left, the game starts with 2 fifty-fifties and ask the audiences and 1 of the others
+  fifty_fifty_left int NOT NULL DEFAULT 2,
+  ask_audience_left int NOT NULL DEFAULT 2,
+  phone_a_friend_left int NOT NULL DEFAULT 1,
+  switch_question_left int NOT NULL DEFAULT 1,
+  -- the room leaderboard and the room answer checks look the games up by room
+  INDEX games_room (room_id)
 );
 CREATE TABLE questions (
   id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
@@ -41,10 +72,102 @@ CREATE TABLE questions (
   answer_1 varchar(200),
   answer_2 varchar(200),
   answer_3 varchar(200),
+  category varchar(100),
+  difficulty varchar(10),
+  room_id int DEFAULT NULL,
   already_displayed boolean,
+  -- the correct answer as it is compared with the players' answers (no case, accents, punctuation or leading article)
+  normalized_answer varchar(200) DEFAULT NULL,
+  -- the order the answers were shown in, the index of each option in (correct_answer, answer_1, answer_2, answer_3),
+  -- e.g. '2013', players answer with the position (option id) of their answer
+  answer_order char(4) DEFAULT NULL,
+  -- the incorrect answer (1 to 3 for answer_1 to answer_3) the fifty-fifty lifeline keeps, once it has been used
+  fifty_fifty_kept tinyint DEFAULT NULL,
+  -- the question that replaced this one when the switch the question lifeline was used on it,
+  -- a switched question doesn't count in the length of the game
+  switched_to int DEFAULT NULL,
+  FOREIGN KEY (game_id) REFERENCES games (id),
+  FOREIGN KEY (room_id) REFERENCES rooms (id)
+);
+
+-- the lifelines each game used on each question, a lifeline used again on the same question
+-- (e.g. by a client that reconnected) doesn't count again
+CREATE TABLE lifeline_uses (
+  game_id int NOT NULL,
+  question_id int NOT NULL,
+  lifeline varchar(20) NOT NULL,
+  used_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (game_id, question_id, lifeline),
   FOREIGN KEY (game_id) REFERENCES games (id)
 );
 
+-- the answer of a player to a question, a question can be answered only once per game,
+-- so an answer that is sent again (e.g. a retry after a timeout) is not scored twice
+CREATE TABLE answers (
+  game_id int NOT NULL,
+  question_id int NOT NULL,
+  submitted_answer varchar(200),
+  is_correct boolean NOT NULL,
+  -- the speed points the answer got, so a retried answer gets the same result as the first one
+  speed_points int NOT NULL DEFAULT 0,
+  answered_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (game_id, question_id),
+  FOREIGN KEY (game_id) REFERENCES games (id)
+);
+
+-- how long players take to answer, for analytics, written in batches in the background.
+-- served_at and time_taken_ms are NULL when the app process that checked the answer didn't serve the question
+CREATE TABLE answer_times (
+  id bigint NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  game_id int NOT NULL,
+  question_id int NOT NULL,
+  served_at timestamp(3) NULL DEFAULT NULL,
+  answered_at timestamp(3) NOT NULL,
+  time_taken_ms int DEFAULT NULL,
+  is_correct boolean NOT NULL,
+  INDEX (question_id)
+);
+
+-- scores of the games finished in each day and week, so the daily and weekly leaderboards read only the top
+-- of the current window instead of scanning games. window_start is the first day of the window
+CREATE TABLE leaderboard_windows (
+  window_name varchar(10) NOT NULL,
+  window_start date NOT NULL,
+  game_id int NOT NULL,
+  username varchar(40) NOT NULL,
+  score int NOT NULL,
+  PRIMARY KEY (window_name, window_start, game_id),
+  INDEX window_top (window_name, window_start, score)
+);
+
+-- the best finished game of each player, updated only when a game beats it, for the best per player leaderboard
+CREATE TABLE player_best (
+  user_id int NOT NULL PRIMARY KEY,
+  username varchar(40) NOT NULL,
+  best_score int NOT NULL,
+  game_id int NOT NULL,
+  INDEX (best_score),
+  FOREIGN KEY (user_id) REFERENCES players (id)
+);
+
+-- the leaderboard version, which goes up with every score change, so the leaderboard ETag is the same
+-- whichever app process answers, it has one row. modified_at is a unix timestamp
+CREATE TABLE leaderboard_version (
+  id int NOT NULL PRIMARY KEY,
+  version bigint NOT NULL DEFAULT 0,
+  modified_at double NOT NULL DEFAULT 0
+);
+INSERT INTO leaderboard_version (id, version, modified_at) VALUES (1, 0, UNIX_TIMESTAMP());
+
+-- old windows are deleted every hour, a window is kept for a while after it ends.
+-- Needs the event scheduler to be on: SET GLOBAL event_scheduler = ON;
+CREATE EVENT expire_leaderboard_windows
+ON SCHEDULE EVERY 1 HOUR
+DO
+  DELETE FROM leaderboard_windows
+  WHERE (window_name = 'daily' AND window_start < CURRENT_DATE - INTERVAL 2 DAY)
+     OR (window_name = 'weekly' AND window_start < CURRENT_DATE - INTERVAL 14 DAY);
+
 
 INSERT INTO players (username)
 VALUES
@@ -65,6 +188,13 @@ VALUES
     (5, 13),
     (6, 9);
 
+-- the sample games are finished, so they are in the best per player leaderboard too
+UPDATE games SET finished_at = created_at;
+INSERT INTO player_best (user_id, username, best_score, game_id)
+SELECT games.user_id, players.username, games.score, games.id
+FROM games
+JOIN players ON players.id = games.user_id;
+
 -- View tables:
 SELECT * FROM players;
 SELECT * FROM games;
@@ -0,0 +1,150 @@
+/*
+Same tables as trivia_game.sql, for the embedded SQLite storage (DB_BACKEND = "sqlite" in config.py).
+The app creates them from this file the first time it uses a database file, there is no need to run it by hand.
+Like there, a game can be on another database than its player, its room, the room's questions and player_best,
+so there are no foreign keys between them.
+*/
+
+CREATE TABLE IF NOT EXISTS players (
+  id integer PRIMARY KEY AUTOINCREMENT,
+  username varchar(40) NOT NULL
+);
+
+-- a room is a multiplayer game, all the players in it answer the same questions at the same time
+CREATE TABLE IF NOT EXISTS rooms (
+  id integer PRIMARY KEY AUTOINCREMENT,
+  num_questions int NOT NULL DEFAULT 15,
+  category int DEFAULT NULL,
+  difficulty varchar(10) DEFAULT NULL,
+  current_question_id int DEFAULT NULL,
+  -- given to whoever created the room, only they can move the room on to its next question
+  host_token char(32) DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS games (
+  id integer PRIMARY KEY AUTOINCREMENT,
+  user_id int DEFAULT NULL,
+  score int DEFAULT NULL,
+  num_questions int NOT NULL DEFAULT 15,
+  category int DEFAULT NULL,
+  difficulty varchar(10) DEFAULT NULL,
+  room_id int DEFAULT NULL,
+  -- extra points for answering correctly quickly, on top of score
+  speed_score int NOT NULL DEFAULT 0,
+  created_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  finished_at timestamp NULL DEFAULT NULL,
+  -- lifelines the game has left, the game starts with 2 fifty-fifties and ask the audiences and 1 of the others
+  fifty_fifty_left int NOT NULL DEFAULT 2,
+  ask_audience_left int NOT NULL DEFAULT 2,
+  phone_a_friend_left int NOT NULL DEFAULT 1,
+  switch_question_left int NOT NULL DEFAULT 1
+);
+-- the room leaderboard and the room answer checks look the games up by room
+CREATE INDEX IF NOT EXISTS games_room ON games (room_id);
+
+CREATE TABLE IF NOT EXISTS questions (
+  id integer PRIMARY KEY AUTOINCREMENT,
+  game_id int REFERENCES games (id),
+  question varchar(400),
+  correct_answer varchar(200),
+  answer_1 varchar(200),
+  answer_2 varchar(200),
+  answer_3 varchar(200),
+  category varchar(100),
+  difficulty varchar(10),
+  room_id int DEFAULT NULL REFERENCES rooms (id),
+  already_displayed boolean,
+  -- the correct answer as it is compared with the players' answers (no case, accents, punctuation or leading article)
+  normalized_answer varchar(200) DEFAULT NULL,
+  -- the order the answers were shown in, the index of each option in (correct_answer, answer_1, answer_2, answer_3),
+  -- e.g. '2013', players answer with the position (option id) of their answer
+  answer_order char(4) DEFAULT NULL,
+  -- the incorrect answer (1 to 3 for answer_1 to answer_3) the fifty-fifty lifeline keeps, once it has been used
+  fifty_fifty_kept tinyint DEFAULT NULL,
+  -- the question that replaced this one when the switch the question lifeline was used on it,
+  -- a switched question doesn't count in the length of the game
+  switched_to int DEFAULT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_game ON questions (game_id, already_displayed);
+CREATE INDEX IF NOT EXISTS questions_room ON questions (room_id, already_displayed);
+
+-- the lifelines each game used on each question, a lifeline used again on the same question
+-- (e.g. by a client that reconnected) doesn't count again
+CREATE TABLE IF NOT EXISTS lifeline_uses (
+  game_id int NOT NULL REFERENCES games (id),
+  question_id int NOT NULL,
+  lifeline varchar(20) NOT NULL,
+  used_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (game_id, question_id, lifeline)
+);
+
+-- the answer of a player to a question, a question can be answered only once per game,
+-- so an answer that is sent again (e.g. a retry after a timeout) is not scored twice
+CREATE TABLE IF NOT EXISTS answers (
+  game_id int NOT NULL REFERENCES games (id),
+  question_id int NOT NULL,
+  submitted_answer varchar(200),
+  is_correct boolean NOT NULL,
+  -- the speed points the answer got, so a retried answer gets the same result as the first one
+  speed_points int NOT NULL DEFAULT 0,
+  answered_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (game_id, question_id)
+);
+
+-- how long players take to answer, for analytics, written in batches in the background.
+-- the times are unix timestamps, served_at and time_taken_ms are NULL when the app process
+-- that checked the answer didn't serve the question
+CREATE TABLE IF NOT EXISTS answer_times (
+  id integer PRIMARY KEY AUTOINCREMENT,
+  game_id int NOT NULL,
+  question_id int NOT NULL,
+  served_at real DEFAULT NULL,
+  answered_at real NOT NULL,
+  time_taken_ms int DEFAULT NULL,
+  is_correct boolean NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answer_times_question ON answer_times (question_id);
+
+-- scores of the games finished in each day and week, so the daily and weekly leaderboards read only the top
+-- of the current window instead of scanning games. window_start is the first day of the window
+CREATE TABLE IF NOT EXISTS leaderboard_windows (
+  window_name varchar(10) NOT NULL,
+  window_start date NOT NULL,
+  game_id int NOT NULL,
+  username varchar(40) NOT NULL,
+  score int NOT NULL,
+  PRIMARY KEY (window_name, window_start, game_id)
+);
+CREATE INDEX IF NOT EXISTS window_top ON leaderboard_windows (window_name, window_start, score);
+
+-- the best finished game of each player, updated only when a game beats it, for the best per player leaderboard
+CREATE TABLE IF NOT EXISTS player_best (
+  user_id int NOT NULL PRIMARY KEY REFERENCES players (id),
+  username varchar(40) NOT NULL,
+  best_score int NOT NULL,
+  game_id int NOT NULL
+);
+CREATE INDEX IF NOT EXISTS player_best_score ON player_best (best_score);
+
+-- the leaderboard version, which goes up with every score change, so the leaderboard ETag is the same
+-- whichever app process answers, it has one row. modified_at is a unix timestamp
+CREATE TABLE IF NOT EXISTS leaderboard_version (
+  id int NOT NULL PRIMARY KEY,
+  version bigint NOT NULL DEFAULT 0,
+  modified_at double NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO leaderboard_version (id, version, modified_at) VALUES (1, 0, strftime('%s', 'now'));
+
+-- SQLite has no scheduled events, so old windows are deleted when a new window starts instead,
+-- a window is kept for a while after it ends
+CREATE TRIGGER IF NOT EXISTS expire_leaderboard_windows
+AFTER INSERT ON leaderboard_windows
+WHEN NOT EXISTS (
+  SELECT 1 FROM leaderboard_windows
+  WHERE window_name = NEW.window_name AND window_start = NEW.window_start AND game_id != NEW.game_id
+)
+BEGIN
+  DELETE FROM leaderboard_windows
+  WHERE (window_name = 'daily' AND window_start < date('now', '-2 days'))
+     OR (window_name = 'weekly' AND window_start < date('now', '-14 days'));
+END;
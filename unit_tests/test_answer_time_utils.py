@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+
+from answer_time_utils import AnswerTimeWriter, question_served, time_taken, speed_points
+
+
+class TestAnswerTimes(unittest.TestCase):
+
+    @patch('answer_time_utils.time.time')
+    def test_time_taken(self, mock_time):
+        mock_time.return_value = 100.0
+        question_served(3, 46)
+        mock_time.return_value = 104.5
+
+        self.assertEqual(time_taken(3, 46), (100.0, 4.5))
+
+    @patch('answer_time_utils.time.time')
+    def test_room_question_time_taken(self, mock_time):
+        mock_time.return_value = 200.0
+        # room questions are served to every player at once
+        question_served(None, 47)
+        mock_time.return_value = 201.0
+
+        self.assertEqual(time_taken(5, 47), (200.0, 1.0))
+
+    def test_question_not_served(self):
+        self.assertEqual(time_taken(3, 999), (None, None))
+
+    def test_speed_points(self):
+        self.assertEqual(speed_points(0), 10)
+        self.assertEqual(speed_points(15), 5)
+        self.assertEqual(speed_points(30), 0)
+        self.assertEqual(speed_points(None), 0)
+
+
+class TestAnswerTimeWriter(unittest.TestCase):
+
+    @patch('answer_time_utils.add_answer_times')
+    def test_flush_writes_in_batches(self, mock_add_answer_times):
+        writer = AnswerTimeWriter(batch_size=2)
+        for question_id in range(5):
+            writer.rows.put((3, question_id, 100.0, 101.0, True))
+
+        writer.flush()
+
+        self.assertEqual([len(call[0][0]) for call in mock_add_answer_times.call_args_list], [2, 2, 1])
+
+    @patch('answer_time_utils.add_answer_times')
+    def test_failed_batch_is_dropped(self, mock_add_answer_times):
+        mock_add_answer_times.side_effect = Exception("Simulated DB error")
+        writer = AnswerTimeWriter()
+        writer.rows.put((3, 46, 100.0, 101.0, True))
+
+        writer.flush()
+
+        mock_add_answer_times.assert_called_once()
+        self.assertTrue(writer.rows.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from answer_utils import normalize_answer, within_edit_distance, answers_match
+
+
+class TestNormalizeAnswer(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize_answer("  The   Beatles "), "beatles")
+        self.assertEqual(normalize_answer("Beyoncé"), "beyonce")
+        self.assertEqual(normalize_answer("Guns N&#039; Roses"), "guns n roses")
+        self.assertEqual(normalize_answer("STRASSE"), normalize_answer("straße"))
+        self.assertEqual(normalize_answer("Dr. Who?"), "dr who")
+
+    def test_article_alone_is_kept(self):
+        self.assertEqual(normalize_answer("The"), "the")
+        self.assertEqual(normalize_answer("A"), "a")
+
+
+class TestEditDistance(unittest.TestCase):
+
+    def test_within_edit_distance(self):
+        self.assertTrue(within_edit_distance("kitten", "kitten", 0))
+        self.assertTrue(within_edit_distance("mississipi", "mississippi", 1))
+        self.assertTrue(within_edit_distance("kitten", "sitting", 3))
+        self.assertFalse(within_edit_distance("kitten", "sitting", 2))
+        self.assertFalse(within_edit_distance("a", "abcd", 2))
+        self.assertTrue(within_edit_distance("", "ab", 2))
+
+
+class TestAnswersMatch(unittest.TestCase):
+
+    def test_exact_after_normalizing(self):
+        self.assertTrue(answers_match("the beatles!", "beatles"))
+        self.assertFalse(answers_match("The Rolling Stones", "beatles"))
+
+    def test_typo_in_long_answer(self):
+        self.assertTrue(answers_match("Mississipi", "mississippi"))
+        self.assertFalse(answers_match("Mississipi", "mississippi", max_typos=0))
+
+    def test_incorrect_answer_is_not_a_typo(self):
+        self.assertTrue(answers_match("Russia", "prussia"))
+        self.assertFalse(answers_match("Russia", "prussia", incorrect_answers=["Russia", "Austria", "Spain"]))
+        self.assertTrue(answers_match("Prusia", "prussia", incorrect_answers=["Russia", "Austria", "Spain"]))
+
+    def test_options_that_differ_in_punctuation(self):
+        options = ["C#", "C", "Java"]
+        self.assertFalse(answers_match("C#", "c", incorrect_answers=options, correct_answer="C++"))
+        self.assertFalse(answers_match("c", "c", incorrect_answers=options, correct_answer="C++"))
+        self.assertTrue(answers_match(" c++ ", "c", incorrect_answers=options, correct_answer="C++"))
+        self.assertFalse(answers_match("1", "1", incorrect_answers=["1", "0", "2"], correct_answer="-1"))
+        self.assertTrue(answers_match("-1", "1", incorrect_answers=["1", "0", "2"], correct_answer="-1"))
+        # an answer that is an incorrect option once normalized is wrong, even without a typo
+        self.assertFalse(answers_match("austria!", "prussia", incorrect_answers=["Russia", "Austria", "Spain"]))
+
+    def test_short_and_numeric_answers_are_exact(self):
+        self.assertFalse(answers_match("car", "cat"))
+        self.assertFalse(answers_match("1946", "1945"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+import api_utils
+from api_utils import get_questions_from_api, get_questions, TokenBucket, CircuitBreaker, ApiError
+
+URL = "https://opentdb.com/api.php?amount=2&type=multiple"
+
+
+def make_response(data, status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    return response
+
+
+def make_question(text):
+    return {"question": text, "correct_answer": "Paris", "incorrect_answers": ["Berlin", "Madrid", "Rome"]}
+
+
+class TestGetQuestionsFromApi(unittest.TestCase):
+
+    def setUp(self):
+        # fresh limiter, breaker and cache for every test, so tests don't affect each other
+        patchers = [
+            patch('api_utils._rate_limiter', TokenBucket(rate=1000, capacity=1000)),
+            patch('api_utils._circuit_breaker', CircuitBreaker(failure_threshold=2, reset_timeout=60)),
+            patch('api_utils._fallback_questions', api_utils.deque(maxlen=10)),
+            patch('api_utils._question_pools', {}),
+            patch('api_utils._pool_locks', {}),
+            patch('api_utils._session_token', "test_token"),
+            patch('api_utils._session')
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mock_get = api_utils._session.get
+
+    def test_successful_request(self):
+        data = {"response_code": 0, "results": [make_question("Q1"), make_question("Q2")]}
+        self.mock_get.return_value = make_response(data)
+
+        result = get_questions_from_api(URL)
+
+        self.assertEqual(result, data)
+        # Check that the request was sent with connect/read timeouts
+        self.mock_get.assert_called_once_with(URL, params={"token": "test_token"},
+                                              timeout=(api_utils.API_CONNECT_TIMEOUT, api_utils.API_READ_TIMEOUT))
+        # Check that the questions were kept for the fallback cache
+        self.assertEqual(len(api_utils._fallback_questions), 2)
+
+    def test_rate_limit_response_code_is_retried(self):
+        data = {"response_code": 0, "results": [make_question("Q1"), make_question("Q2")]}
+        self.mock_get.side_effect = [make_response({"response_code": 5, "results": []}), make_response(data)]
+
+        result = get_questions_from_api(URL)
+
+        self.assertEqual(result, data)
+        self.assertEqual(self.mock_get.call_count, 2)
+
+    def test_token_not_found_gets_new_token(self):
+        data = {"response_code": 0, "results": [make_question("Q1"), make_question("Q2")]}
+        self.mock_get.side_effect = [
+            make_response({"response_code": 3, "results": []}),
+            make_response({"response_code": 0, "token": "new_token"}),
+            make_response(data)
+        ]
+
+        result = get_questions_from_api(URL)
+
+        self.assertEqual(result, data)
+        self.assertEqual(api_utils._session_token, "new_token")
+        self.mock_get.assert_called_with(URL, params={"token": "new_token"},
+                                         timeout=(api_utils.API_CONNECT_TIMEOUT, api_utils.API_READ_TIMEOUT))
+
+    def test_token_empty_resets_token(self):
+        data = {"response_code": 0, "results": [make_question("Q1"), make_question("Q2")]}
+        self.mock_get.side_effect = [
+            make_response({"response_code": 4, "results": []}),
+            make_response({"response_code": 0, "token": "test_token"}),
+            make_response(data)
+        ]
+
+        result = get_questions_from_api(URL)
+
+        self.assertEqual(result, data)
+        self.mock_get.assert_any_call(api_utils.API_TOKEN_URL, params={"command": "reset", "token": "test_token"},
+                                      timeout=(api_utils.API_CONNECT_TIMEOUT, api_utils.API_READ_TIMEOUT))
+
+    def test_get_questions_spreads_batch_over_games(self):
+        batch = [make_question(f"Q{n}") for n in range(50)]
+        self.mock_get.return_value = make_response({"response_code": 0, "results": batch})
+
+        first_game = get_questions(15)
+        second_game = get_questions(15)
+
+        # Only one API call for both games, and no question is given twice
+        self.mock_get.assert_called_once()
+        self.assertEqual(first_game + second_game, batch[:30])
+        self.assertEqual(len(api_utils._question_pools[(None, None)]), 20)
+
+    def test_get_questions_uses_pool_per_bucket(self):
+        batch = [make_question(f"Q{n}") for n in range(50)]
+        self.mock_get.return_value = make_response({"response_code": 0, "results": batch})
+
+        get_questions(5, category=18, difficulty="hard")
+
+        self.mock_get.assert_called_once_with(
+            "https://opentdb.com/api.php?amount=50&type=multiple&category=18&difficulty=hard",
+            params={"token": "test_token"},
+            timeout=(api_utils.API_CONNECT_TIMEOUT, api_utils.API_READ_TIMEOUT))
+        self.assertEqual(len(api_utils._question_pools[(18, "hard")]), 45)
+        self.assertNotIn((None, None), api_utils._question_pools)
+
+    def test_small_category_asks_only_for_what_is_needed(self):
+        batch = [make_question(f"Q{n}") for n in range(5)]
+        self.mock_get.side_effect = [make_response({"response_code": 1, "results": []}),
+                                     make_response({"response_code": 0, "results": batch})]
+
+        with patch('api_utils.prefill_question_pools') as mock_prefill:
+            questions = get_questions(5, category=30, difficulty="hard")
+
+        self.assertEqual(questions, batch)
+        self.assertEqual(self.mock_get.call_count, 2)
+        # the pool is empty now, so a background refill is started
+        mock_prefill.assert_called_once_with([(30, "hard")])
+        # "no results" means the API is up, so the circuit stays closed
+        self.assertEqual(api_utils._circuit_breaker.failures, 0)
+
+    @patch('api_utils._prefill_thread', None)
+    def test_prefill_once_per_process(self):
+        with patch('api_utils.prefill_question_pools') as mock_prefill:
+            first = api_utils.prefill_question_pools_once([(None, None)])
+            second = api_utils.prefill_question_pools_once([(None, None)])
+
+        # later requests don't start another thread
+        mock_prefill.assert_called_once_with([(None, None)])
+        self.assertIs(first, second)
+
+    def test_fallback_to_cached_questions_on_timeout(self):
+        api_utils._fallback_questions.extend([(None, make_question("Q1")), (None, make_question("Q2")),
+                                              (None, make_question("Q3"))])
+        self.mock_get.side_effect = requests.Timeout("Read timed out")
+
+        result = get_questions_from_api(URL)
+
+        self.assertEqual(result["response_code"], 0)
+        self.assertEqual(len(result["results"]), 2)
+
+    def test_cached_questions_of_the_category(self):
+        api_utils._fallback_questions.extend([(None, make_question("Q1")), (18, make_question("Q2")),
+                                              (21, make_question("Q3"))])
+        self.mock_get.side_effect = requests.Timeout("Read timed out")
+
+        result = get_questions_from_api(f"{URL}&category=18")
+
+        # only the questions that were fetched for the category are given, not any cached question
+        self.assertEqual(result["results"], [make_question("Q2")])
+        with self.assertRaises(ApiError):
+            get_questions_from_api(f"{URL}&category=9")
+
+    def test_cached_questions_keep_their_category(self):
+        self.mock_get.return_value = make_response({"response_code": 0, "results": [make_question("Q1")]})
+
+        get_questions_from_api(f"{URL}&category=18")
+
+        self.assertEqual(list(api_utils._fallback_questions), [(18, make_question("Q1"))])
+
+    def test_no_cached_questions_raises(self):
+        self.mock_get.side_effect = requests.ConnectionError("Connection refused")
+
+        with self.assertRaises(ApiError):
+            get_questions_from_api(URL)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        api_utils._fallback_questions.extend([(None, make_question("Q1")), (None, make_question("Q2"))])
+        self.mock_get.side_effect = requests.ConnectionError("Connection refused")
+
+        get_questions_from_api(URL)
+        get_questions_from_api(URL)
+        # The circuit is open now, so the API is not called again
+        get_questions_from_api(URL)
+
+        self.assertEqual(self.mock_get.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
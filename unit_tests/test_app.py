@@ -1,6 +1,16 @@
+import gzip
 import unittest
 from unittest.mock import MagicMock, patch
-from app import app
+from app import app, rate_limiter
+import db_utils
+import http_utils
+from rate_limit_utils import RateLimiter
+from config import PREFILL_BUCKETS
+
+# rate limits are tested on their own in TestRateLimiting
+rate_limiter.enabled = False
+# the question pools aren't filled from the trivia API in the tests, see TestQuestionPrefill
+patch('app.prefill_question_pools_once').start()
 
 
 class TestAddGameRoute(unittest.TestCase):
@@ -9,10 +19,16 @@ class TestAddGameRoute(unittest.TestCase):
         self.app = app.test_client()
 
     @patch('app.User.get_or_create')
+    @patch('app.Game.first_questions')
     @patch('app.Game.start_game')
     @patch('app.Game.provide_question')
-    def test_successful_game_creation(self, mock_provide_question, mock_start_game, mock_get_or_create):
+    def test_successful_game_creation(self, mock_provide_question, mock_start_game, mock_first_questions,
+                                      mock_get_or_create):
         # Mocking specific methods of User and Game classes
+        calls = MagicMock()
+        calls.attach_mock(mock_first_questions, "first_questions")
+        calls.attach_mock(mock_get_or_create, "get_or_create")
+        mock_first_questions.return_value = ["question"]
         mock_get_or_create.return_value = 1  # Assuming user_id is 1
         mock_start_game.return_value = 1  # Assuming game_id is 1
         mock_provide_question.return_value = "test_question"  # Assuming a test question
@@ -36,8 +52,44 @@ class TestAddGameRoute(unittest.TestCase):
 
         # Check that User and Game classes were called with the correct arguments
         mock_get_or_create.assert_called_once_with()
-        mock_start_game.assert_called_once_with()
+        mock_start_game.assert_called_once_with(["question"])
         mock_provide_question.assert_called_once_with(1)  # Assuming game_id is 1
+        # the questions were fetched before the player was written
+        self.assertEqual([name for name, _, _ in calls.mock_calls], ["first_questions", "get_or_create"])
+
+    @patch('app.User')
+    @patch('app.Game')
+    def test_game_creation_with_category_and_difficulty(self, mock_game, mock_user):
+        mock_user.return_value.get_or_create.return_value = 1
+        mock_game.return_value.start_game.return_value = 2
+        mock_game.provide_question.return_value = "test_question"
+        mock_game.settings_error.return_value = None
+
+        user_data = {"user_name": "helen", "category": 18, "difficulty": "ramp", "num_questions": 5}
+        response = self.app.post('/add_new_game', json=user_data)
+
+        self.assertEqual(response.status_code, 200)
+        # Check that the game was created with the chosen category, difficulty and length
+        mock_game.assert_called_once_with(1, 18, "ramp", 5)
+
+    def test_failure_invalid_game_length(self):
+        for num_questions in (0, 501, "15"):
+            response = self.app.post('/add_new_game', json={"user_name": "helen", "num_questions": num_questions})
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json(), {"message": "Invalid number of questions"})
+
+    def test_failure_invalid_category(self):
+        response = self.app.post('/add_new_game', json={"user_name": "helen", "category": 5})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {"message": "Invalid category"})
+
+    def test_failure_invalid_difficulty(self):
+        response = self.app.post('/add_new_game', json={"user_name": "helen", "difficulty": "impossible"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {"message": "Invalid difficulty"})
 
     def test_failure_missing_user_name(self):
         response = self.app.post('/add_new_game', json={})
@@ -63,8 +115,9 @@ class TestAddGameRoute(unittest.TestCase):
         self.assertIn('message', data_long)
         self.assertEqual(data_long['message'], 'User name must be between 1 and 40 characters')
 
+    @patch('app.Game.first_questions', return_value=[])
     @patch('app.User')
-    def test_failure_internal_server_error(self, mock_user):
+    def test_failure_internal_server_error(self, mock_user, mock_first_questions):
         # Mocking only the User class
         mock_user_instance = MagicMock()
         mock_user_instance.get_or_create.side_effect = Exception("Simulated internal server error")
@@ -108,6 +161,26 @@ class CheckAnswerTestCase(unittest.TestCase):
         # Optionally, assert that Game.check_answer was called with the expected parameters
         mock_check_answer.assert_called_once_with(1, 46, "The Bahamas Archipelago")
 
+    @patch('app.Game.check_answer')
+    def test_check_answer_option_id(self, mock_check_answer):
+        mock_check_answer.return_value = {"score": 1, "correct_answer": "Paris", "correct_option": 2,
+                                          "result": "correct"}
+
+        response = self.app.put('/check_answer', json={"game_id": 1, "option_id": 2, "question_id": 46})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["correct_option"], 2)
+        mock_check_answer.assert_called_once_with(1, 46, option_id=2)
+
+    @patch('app.Game.check_answer')
+    def test_check_answer_invalid_option_id(self, mock_check_answer):
+        for option_id in (4, -1, "2", True):
+            response = self.app.put('/check_answer', json={"game_id": 1, "option_id": option_id, "question_id": 46})
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json, {"message": "Invalid option"})
+        mock_check_answer.assert_not_called()
+
     def test_check_answer_missing_fields(self):
         # Make a request with missing fields
         response = self.app.put('/check_answer', json={
@@ -148,6 +221,73 @@ class CheckAnswerTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 500)
         self.assertEqual(response.json, {"message": "Internal server error"})
 
+    @patch('app.Game.check_answer')
+    def test_check_answer_idempotency_key(self, mock_check_answer):
+        mock_check_answer.return_value = {"score": 1, "correct_answer": "Paris", "result": "correct"}
+        answer_data = {"game_id": 1, "answer": "Paris", "question_id": 47}
+        headers = {"Idempotency-Key": "answer-1-47"}
+
+        first = self.app.put('/check_answer', json=answer_data, headers=headers)
+        retry = self.app.put('/check_answer', json=answer_data, headers=headers)
+
+        # the retry gets the first response back without the answer being checked again
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json, first.json)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        mock_check_answer.assert_called_once_with(1, 47, "Paris")
+
+    @patch('app.Game.check_answer')
+    def test_idempotency_key_of_another_client(self, mock_check_answer):
+        mock_check_answer.return_value = {"score": 1, "correct_answer": "Paris", "result": "correct"}
+        headers = {"Idempotency-Key": "answer-49"}
+
+        self.app.put('/check_answer', json={"game_id": 1, "answer": "Paris", "question_id": 49}, headers=headers)
+        other_game = self.app.put('/check_answer', json={"game_id": 2, "answer": "Paris", "question_id": 49},
+                                  headers=headers)
+        other_client = self.app.put('/check_answer', json={"game_id": 1, "answer": "Paris", "question_id": 49},
+                                    headers=headers, environ_base={"REMOTE_ADDR": "10.0.0.2"})
+
+        # the same key from another game or another client is not a retry
+        self.assertNotIn("Idempotent-Replayed", other_game.headers)
+        self.assertNotIn("Idempotent-Replayed", other_client.headers)
+        self.assertEqual(mock_check_answer.call_count, 3)
+
+    @patch('app.Game.check_answer')
+    def test_check_answer_idempotency_key_after_error(self, mock_check_answer):
+        mock_check_answer.side_effect = [Exception("Simulated internal server error"),
+                                         {"score": 1, "correct_answer": "Paris", "result": "correct"}]
+        answer_data = {"game_id": 1, "answer": "Paris", "question_id": 48}
+        headers = {"Idempotency-Key": "answer-1-48"}
+
+        first = self.app.put('/check_answer', json=answer_data, headers=headers)
+        retry = self.app.put('/check_answer', json=answer_data, headers=headers)
+
+        # server errors are not kept, so the retry runs again
+        self.assertEqual(first.status_code, 500)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(mock_check_answer.call_count, 2)
+
+
+    @patch('db_utils._pooled_connection')
+    @patch('app.Game.check_answer')
+    def test_idempotency_key_when_commit_fails(self, mock_check_answer, mock_pooled_connection):
+        def check_answer(game_id, question_id, answer):
+            db_utils._connect_to_db("trivia_game")  # the answer is written in the request's unit of work
+            return {"score": 1, "correct_answer": "Paris", "result": "correct"}
+
+        mock_check_answer.side_effect = check_answer
+        mock_pooled_connection.return_value.commit.side_effect = [db_utils._storage.Error("Lost connection"), None]
+        answer_data = {"game_id": 1, "answer": "Paris", "question_id": 50}
+        headers = {"Idempotency-Key": "answer-1-50"}
+
+        first = self.app.put('/check_answer', json=answer_data, headers=headers)
+        retry = self.app.put('/check_answer', json=answer_data, headers=headers)
+
+        # the answer was never committed, so its response wasn't kept and the retry runs again
+        self.assertEqual(first.status_code, 500)
+        self.assertEqual(retry.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", retry.headers)
+        self.assertEqual(mock_check_answer.call_count, 2)
 
 class TestNextQuestionRoute(unittest.TestCase):
 
@@ -185,6 +325,15 @@ class TestNextQuestionRoute(unittest.TestCase):
         # Ensure that Game.provide_question was called with the correct arguments
         mock_provide_question.assert_called_once_with(game_id)
 
+    @patch('app.Game.provide_question')
+    def test_next_question_of_room_game(self, mock_provide_question):
+        mock_provide_question.return_value = {"message": "Game is in a room"}
+
+        response = self.app.get('/next_question/3')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json(), {"message": "Game is in a room"})
+
     @patch('app.Game.provide_question', side_effect=Exception("Test exception"))
     def test_next_question_internal_server_error(self, mock_provide_question):
         game_id = "test_game_id"
@@ -204,10 +353,10 @@ class TestUpdatedQuestionRoute(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
 
-    @patch('app.FiftyFifty.provide_lifeline')
-    def test_updated_question_success(self, mock_provide_lifeline):
-        # Mocking the successful behavior of FiftyFifty.provide_lifeline
-        mock_provide_lifeline.return_value = "test_updated_question"
+    @patch('classes.lifeline.FiftyFifty.use')
+    def test_updated_question_success(self, mock_use):
+        # Mocking the successful behavior of FiftyFifty.use
+        mock_use.return_value = "test_updated_question"
 
         question_id = "test_question_id"
         response = self.app.get(f'/fifty_fifty/{question_id}')
@@ -216,11 +365,29 @@ class TestUpdatedQuestionRoute(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.get_data(as_text=True), "test_updated_question")
 
-        # Ensure that FiftyFifty.provide_lifeline was called with the correct arguments
-        mock_provide_lifeline.assert_called_once_with(question_id)
+        # Ensure that FiftyFifty.use was called with the correct arguments
+        mock_use.assert_called_once_with(question_id, None)
+
+    @patch('classes.lifeline.FiftyFifty.use')
+    def test_updated_question_not_modified(self, mock_use):
+        response = self.app.get('/fifty_fifty/12?game_id=3', headers={"If-None-Match": '"fifty_fifty-3-12"'})
+
+        self.assertEqual(response.status_code, 304)
+        mock_use.assert_not_called()
+
+    @patch('classes.lifeline.FiftyFifty.use')
+    def test_fifty_fifty_not_available(self, mock_use):
+        mock_use.return_value = {"message": "Lifeline not available"}
+
+        response = self.app.get('/fifty_fifty/12')
 
-    @patch('app.FiftyFifty.provide_lifeline', side_effect=Exception("Test exception"))
-    def test_updated_question_internal_server_error(self, mock_provide_lifeline):
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json, {"message": "Lifeline not available"})
+        # errors are not cached
+        self.assertNotIn("ETag", response.headers)
+
+    @patch('classes.lifeline.FiftyFifty.use', side_effect=Exception("Test exception"))
+    def test_updated_question_internal_server_error(self, mock_use):
         question_id = "test_question_id"
         response = self.app.get(f'/fifty_fifty/{question_id}')
 
@@ -229,8 +396,8 @@ class TestUpdatedQuestionRoute(unittest.TestCase):
         expected_response = {"message": "Internal server error"}
         self.assertEqual(response.get_json(), expected_response)
 
-        # Ensure that FiftyFifty.provide_lifeline was called with the correct arguments
-        mock_provide_lifeline.assert_called_once_with(question_id)
+        # Ensure that FiftyFifty.use was called with the correct arguments
+        mock_use.assert_called_once_with(question_id, None)
 
 
 class TestGetAudienceChoiceRoute(unittest.TestCase):
@@ -238,10 +405,10 @@ class TestGetAudienceChoiceRoute(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
 
-    @patch('app.AskAudience.provide_lifeline')
-    def test_get_audience_choice_success(self, mock_provide_lifeline):
-        # Mocking the successful behavior of AskAudience.provide_lifeline
-        mock_provide_lifeline.return_value = "test_audience_choice"
+    @patch('classes.lifeline.AskAudience.use')
+    def test_get_audience_choice_success(self, mock_use):
+        # Mocking the successful behavior of AskAudience.use
+        mock_use.return_value = "test_audience_choice"
 
         question_id = "test_question_id"
         response = self.app.get(f'/ask_audience/{question_id}')
@@ -250,11 +417,21 @@ class TestGetAudienceChoiceRoute(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.get_data(as_text=True), "test_audience_choice")
 
-        # Ensure that AskAudience.provide_lifeline was called with the correct arguments
-        mock_provide_lifeline.assert_called_once_with(question_id)
+        # Ensure that AskAudience.use was called with the correct arguments
+        mock_use.assert_called_once_with(question_id, None)
+
+    @patch('classes.lifeline.AskAudience.use')
+    def test_no_lifelines_left(self, mock_use):
+        mock_use.return_value = {"message": "No lifelines left"}
+
+        response = self.app.get('/ask_audience/12?game_id=3')
 
-    @patch('app.AskAudience.provide_lifeline', side_effect=Exception("Test exception"))
-    def test_get_audience_choice_internal_server_error(self, mock_provide_lifeline):
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json, {"message": "No lifelines left"})
+        mock_use.assert_called_once_with('12', 3)
+
+    @patch('classes.lifeline.AskAudience.use', side_effect=Exception("Test exception"))
+    def test_get_audience_choice_internal_server_error(self, mock_use):
         question_id = "test_question_id"
         response = self.app.get(f'/ask_audience/{question_id}')
 
@@ -263,14 +440,39 @@ class TestGetAudienceChoiceRoute(unittest.TestCase):
         expected_response = {"message": "Internal server error"}
         self.assertEqual(response.get_json(), expected_response)
 
-        # Ensure that AskAudience.provide_lifeline was called with the correct arguments
-        mock_provide_lifeline.assert_called_once_with(question_id)
+        # Ensure that AskAudience.use was called with the correct arguments
+        mock_use.assert_called_once_with(question_id, None)
+
+
+class TestLifelineRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    def test_every_lifeline_has_a_route(self):
+        for name in ("fifty_fifty", "ask_audience", "phone_a_friend", "switch_question"):
+            self.assertIn(f"/{name}/<question_id>", [rule.rule for rule in app.url_map.iter_rules(name)])
+
+    @patch('classes.lifeline.PhoneAFriend.use')
+    def test_phone_a_friend(self, mock_use):
+        mock_use.return_value = {"question_id": 12, "option_id": 1, "answer": "Paris", "confidence": 80}
+
+        response = self.app.get('/phone_a_friend/12?game_id=3')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["answer"], "Paris")
+        self.assertEqual(response.headers["ETag"], '"phone_a_friend-3-12"')
+        mock_use.assert_called_once_with('12', 3)
 
 
 class TestShowLeaderboardRoute(unittest.TestCase):
 
     def setUp(self):
         self.app = app.test_client()
+        # the leaderboard version is read from the db
+        patcher = patch('app.Game.leaderboard_version', return_value=("3", 1700000000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     @patch('app.Game.show_leaderboard')
     def test_show_leaderboard_success(self, mock_show_leaderboard):
@@ -287,6 +489,54 @@ class TestShowLeaderboardRoute(unittest.TestCase):
         # Ensure that Game.show_leaderboard was called with the correct arguments
         mock_show_leaderboard.assert_called_once()
 
+    @patch('app.Game.leaderboard_version')
+    @patch('app.Game.show_leaderboard')
+    def test_show_leaderboard_cache_headers(self, mock_show_leaderboard, mock_leaderboard_version):
+        mock_show_leaderboard.return_value = [["Kate L", 12]]
+        mock_leaderboard_version.return_value = ("abc-3", 1700000000)
+
+        response = self.app.get('/leaderboard/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], '"abc-3"')
+        self.assertIn("public", response.headers["Cache-Control"])
+        self.assertIn("max-age=", response.headers["Cache-Control"])
+        self.assertIn("Last-Modified", response.headers)
+
+    @patch('app.Game.leaderboard_version')
+    @patch('app.Game.show_leaderboard')
+    def test_show_leaderboard_not_modified(self, mock_show_leaderboard, mock_leaderboard_version):
+        mock_leaderboard_version.return_value = ("abc-3", 1700000000)
+
+        response = self.app.get('/leaderboard/', headers={"If-None-Match": '"abc-3"'})
+
+        # The leaderboard hasn't changed, so it is not read from the db at all
+        self.assertEqual(response.status_code, 304)
+        mock_show_leaderboard.assert_not_called()
+
+    @patch('app.Game.leaderboard_version')
+    @patch('app.Game.show_leaderboard')
+    def test_show_leaderboard_changed(self, mock_show_leaderboard, mock_leaderboard_version):
+        mock_show_leaderboard.return_value = [["Kate L", 13]]
+        mock_leaderboard_version.return_value = ("abc-4", 1700000010)
+
+        response = self.app.get('/leaderboard/', headers={"If-None-Match": '"abc-3"'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [["Kate L", 13]])
+
+    @patch('app.Game.leaderboard_version', side_effect=Exception("Test exception"))
+    @patch('app.Game.show_leaderboard')
+    def test_leaderboard_version_not_available(self, mock_show_leaderboard, mock_leaderboard_version):
+        mock_show_leaderboard.return_value = [["Kate L", 13]]
+
+        response = self.app.get('/leaderboard/')
+
+        # The leaderboard is still sent, with an ETag made from its content
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [["Kate L", 13]])
+        self.assertIn("ETag", response.headers)
+
     @patch('app.Game.show_leaderboard', side_effect=Exception("Test exception"))
     def test_show_leaderboard_internal_server_error(self, mock_show_leaderboard):
         response = self.app.get('/leaderboard/')
@@ -299,6 +549,264 @@ class TestShowLeaderboardRoute(unittest.TestCase):
         # Ensure that Game.show_leaderboard was called with the correct arguments
         mock_show_leaderboard.assert_called_once()
 
+    @patch('app.Game.show_leaderboard')
+    def test_show_daily_leaderboard(self, mock_show_leaderboard):
+        mock_show_leaderboard.return_value = [["Kate L", 12]]
+
+        response = self.app.get('/leaderboard/?window=daily')
+
+        self.assertEqual(response.status_code, 200)
+        mock_show_leaderboard.assert_called_once_with("daily", False, False)
+
+    @patch('app.Game.show_leaderboard')
+    def test_show_best_per_player_leaderboard(self, mock_show_leaderboard):
+        mock_show_leaderboard.return_value = [["Kate L", 15]]
+
+        response = self.app.get('/leaderboard/?mode=best')
+
+        self.assertEqual(response.status_code, 200)
+        mock_show_leaderboard.assert_called_once_with(None, True, False)
+
+    @patch('app.Game.show_leaderboard')
+    def test_show_speed_leaderboard(self, mock_show_leaderboard):
+        mock_show_leaderboard.return_value = [["Kate L", 87]]
+
+        response = self.app.get('/leaderboard/?mode=speed')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [["Kate L", 87]])
+        mock_show_leaderboard.assert_called_once_with(None, False, True)
+
+    @patch('app.Game.show_leaderboard')
+    def test_speed_leaderboard_with_window(self, mock_show_leaderboard):
+        response = self.app.get('/leaderboard/?mode=speed&window=weekly')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {"message": "Invalid mode"})
+        mock_show_leaderboard.assert_not_called()
+
+    @patch('app.Game.show_leaderboard')
+    def test_best_per_player_leaderboard_with_window(self, mock_show_leaderboard):
+        response = self.app.get('/leaderboard/?mode=best&window=daily')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {"message": "Invalid mode"})
+        mock_show_leaderboard.assert_not_called()
+
+    @patch('app.Game.show_leaderboard')
+    def test_show_leaderboard_invalid_window(self, mock_show_leaderboard):
+        response = self.app.get('/leaderboard/?window=monthly')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {"message": "Invalid window"})
+        mock_show_leaderboard.assert_not_called()
+
+    @patch('app.Game.end_game')
+    def test_finish_game(self, mock_end_game):
+        mock_end_game.return_value = True
+
+        response = self.app.put('/finish_game/3')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"finished": True})
+        mock_end_game.assert_called_once_with(3)
+
+    @patch('app.Game.rank')
+    def test_show_rank(self, mock_rank):
+        mock_rank.return_value = {"game_id": 3, "score": 12, "rank": 4213, "total": 1200000, "percentile": 99.6}
+
+        response = self.app.get('/rank/3')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["rank"], 4213)
+        mock_rank.assert_called_once_with(3)
+
+
+class TestRoomRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    @patch('app.Room')
+    def test_add_room(self, mock_room):
+        mock_room.return_value.create_room.return_value = 4
+        mock_room.return_value.host_token = "5f2b"
+
+        response = self.app.post('/rooms', json={"difficulty": "easy", "num_questions": 5})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"room_id": 4, "host_token": "5f2b"})
+        mock_room.assert_called_once_with(None, "easy", 5)
+
+    def test_add_room_invalid_difficulty(self):
+        response = self.app.post('/rooms', json={"difficulty": "impossible"})
+
+        self.assertEqual(response.status_code, 400)
+
+    @patch('app.Room')
+    @patch('app.User.get_or_create')
+    def test_join_room(self, mock_get_or_create, mock_room):
+        mock_get_or_create.return_value = 1
+        mock_room.join.return_value = 9
+        mock_room.current_question.return_value = None
+
+        response = self.app.post('/rooms/4/join', json={"user_name": "helen"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"player_id": 1, "game_id": 9, "room_id": 4, "question": None})
+        mock_room.join.assert_called_once_with(4, 1)
+
+    @patch('app.Room')
+    @patch('app.User.get_or_create')
+    def test_join_missing_room(self, mock_get_or_create, mock_room):
+        mock_get_or_create.return_value = 1
+        mock_room.join.return_value = None
+
+        response = self.app.post('/rooms/4/join', json={"user_name": "helen"})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json(), {"error": "Room not found"})
+
+    @patch('app.Room.is_host', return_value=True)
+    @patch('app.Room.next_question')
+    def test_next_room_question_end_of_game(self, mock_next_question, mock_is_host):
+        mock_next_question.return_value = None
+
+        response = self.app.put('/rooms/4/next_question', headers={"X-Host-Token": "5f2b"})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json(), {"error": "End of game"})
+        mock_is_host.assert_called_once_with(4, "5f2b")
+
+    @patch('app.Room.is_host', return_value=False)
+    @patch('app.Room.next_question')
+    def test_next_room_question_not_host(self, mock_next_question, mock_is_host):
+        response = self.app.put('/rooms/4/next_question')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.get_json(), {"message": "Only the host can move the room on"})
+        mock_is_host.assert_called_once_with(4, None)
+        mock_next_question.assert_not_called()
+
+    @patch('app.Room.current_question')
+    def test_room_question(self, mock_current_question):
+        mock_current_question.return_value = {"question_id": 7, "room_id": 4, "question_text": "Q", "answers": []}
+
+        response = self.app.get('/rooms/4/question')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["question_id"], 7)
+        mock_current_question.assert_called_once_with(4)
+
+    @patch('app.Room.show_leaderboard')
+    def test_room_leaderboard(self, mock_show_leaderboard):
+        mock_show_leaderboard.return_value = [["Kate L", 3], ["Helen V", 1]]
+
+        response = self.app.get('/rooms/4/leaderboard')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [["Kate L", 3], ["Helen V", 1]])
+
+
+class TestFastResponses(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.leaderboard = [[f"player{n}", n] for n in range(100)]
+        patcher = patch('app.Game.leaderboard_version', return_value=("3", 1700000000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('app.Game.leaderboard_version', return_value=("abc-3", 1700000000))
+    @patch('app.Game.show_leaderboard')
+    def test_large_response_is_gzipped(self, mock_show_leaderboard, mock_leaderboard_version):
+        mock_show_leaderboard.return_value = self.leaderboard
+
+        response = self.app.get('/leaderboard/', headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(response.headers["ETag"], 'W/"abc-3"')
+        self.assertEqual(http_utils.FastJSONProvider(app).loads(gzip.decompress(response.data)), self.leaderboard)
+
+    @patch('app.Game.show_leaderboard')
+    def test_small_response_is_not_compressed(self, mock_show_leaderboard):
+        mock_show_leaderboard.return_value = [["Kate L", 12]]
+
+        response = self.app.get('/leaderboard/', headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_json(), [["Kate L", 12]])
+
+    @unittest.skipUnless(http_utils.msgpack, "msgpack is not installed")
+    @patch('app.Game.show_leaderboard')
+    def test_msgpack_when_accepted(self, mock_show_leaderboard):
+        mock_show_leaderboard.return_value = [("Kate L", 12)]
+
+        response = self.app.get('/leaderboard/', headers={"Accept": "application/x-msgpack"})
+
+        self.assertEqual(response.mimetype, "application/x-msgpack")
+        self.assertEqual(http_utils.msgpack.unpackb(response.data), [["Kate L", 12]])
+
+
+class TestQuestionPrefill(unittest.TestCase):
+
+    @patch('app.Game.show_leaderboard', return_value=[])
+    @patch('app.Game.leaderboard_version', return_value=("3", 1700000000))
+    @patch('app.prefill_question_pools_once')
+    def test_prefill_on_request(self, mock_prefill, mock_leaderboard_version, mock_show_leaderboard):
+        app.test_client().get('/leaderboard/')
+
+        # the pools are filled however the app is run, not only with python app.py
+        mock_prefill.assert_called_once_with(PREFILL_BUCKETS)
+
+
+class TestRateLimiting(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        # fresh limiter with small budgets, so the tests don't depend on config.py
+        patcher = patch.object(rate_limiter, 'store', RateLimiter({}).store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(rate_limiter, 'limits', {"add_game": (0.01, 2)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rate_limiter.enabled = True
+        self.addCleanup(setattr, rate_limiter, 'enabled', False)
+
+    @patch('app.User.get_or_create')
+    def test_too_many_new_games(self, mock_get_or_create):
+        for _ in range(2):
+            response = self.app.post('/add_new_game', json={"user_name": ""})
+            self.assertEqual(response.status_code, 400)
+
+        response = self.app.post('/add_new_game', json={"user_name": "helen"})
+
+        # The third request in a row is over the burst size
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.get_json(), {"message": "Too many requests"})
+        self.assertEqual(response.headers["Retry-After"], "100")
+        mock_get_or_create.assert_not_called()
+
+    def test_limits_are_per_client(self):
+        for _ in range(2):
+            self.app.post('/add_new_game', json={"user_name": ""})
+
+        response = self.app.post('/add_new_game', json={"user_name": ""},
+                                 environ_base={"REMOTE_ADDR": "10.0.0.2"})
+
+        self.assertEqual(response.status_code, 400)
+
+    @patch('app.Game.leaderboard_version', return_value=("3", 1700000000))
+    @patch('app.Game.show_leaderboard')
+    def test_endpoints_without_limit(self, mock_show_leaderboard, mock_leaderboard_version):
+        mock_show_leaderboard.return_value = []
+
+        for _ in range(5):
+            response = self.app.get('/leaderboard/')
+            self.assertEqual(response.status_code, 200)
+
 
 if __name__ == '__main__':
     unittest.main()
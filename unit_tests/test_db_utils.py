@@ -1,5 +1,11 @@
+import itertools
 import unittest
-from unittest.mock import MagicMock, patch
+from datetime import date
+from unittest.mock import MagicMock, patch, ANY
+
+import mysql.connector
+
+import db_utils
 
 from db_utils import (
     get_or_add_player_id,
@@ -7,10 +13,28 @@ from db_utils import (
     add_new_questions,
     display_question_to_player,
     display_question_to_player_fifty_fifty,
+    use_lifeline,
     get_correct_answer,
     update_game_score,
+    record_answer,
+    get_answer,
+    add_answer_times,
     get_user_score,
     get_leaderboard,
+    finish_game,
+    get_window_leaderboard,
+    get_score_counts,
+    get_best_leaderboard,
+    set_read_consistency,
+    _connect_to_read_db,
+    _shard_of,
+    get_game_progress,
+    advance_room_question,
+    switch_question,
+    get_room_leaderboard,
+    get_leaderboard_version,
+    get_game_scores,
+    get_speed_leaderboard,
     DbConnectionError
 )
 
@@ -139,8 +163,11 @@ class TestAddNewGame(unittest.TestCase):
         mock_connect.assert_called_with('trivia_game')
 
         # Check that execute() was called on the mock_cursor to insert a new game
-        insert_query = "INSERT INTO games (user_id, score) VALUES (%s, 0)"
-        expected_values = (user_id,)
+        insert_query = """
+            INSERT INTO games (user_id, score, num_questions, category, difficulty, room_id)
+            VALUES (%s, 0, %s, %s, %s, %s)
+        """
+        expected_values = (user_id, 15, None, None, None)
         mock_cursor.execute.assert_called_once_with(insert_query, expected_values)
 
     @patch('db_utils._connect_to_db')  # Mock the database connection
@@ -235,11 +262,15 @@ class TestAddNewQuestions(unittest.TestCase):
                     answer_1,
                     answer_2,
                     answer_3,
-                    already_displayed
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    category,
+                    difficulty,
+                    room_id,
+                    already_displayed,
+                    normalized_answer
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
         expected_values = (game_id, question_text, correct_answer, incorrect_answers[0], incorrect_answers[1],
-                           incorrect_answers[2], False)
+                           incorrect_answers[2], None, None, None, False, "paris")
         mock_cursor.execute.assert_called_once_with(expected_query, expected_values)
 
         mock_connection.commit.assert_called_once()
@@ -281,11 +312,15 @@ class TestAddNewQuestions(unittest.TestCase):
                     answer_1,
                     answer_2,
                     answer_3,
-                    already_displayed
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    category,
+                    difficulty,
+                    room_id,
+                    already_displayed,
+                    normalized_answer
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
         expected_values = (game_id, question_text, correct_answer, incorrect_answers[0], incorrect_answers[1],
-                           incorrect_answers[2], False)
+                           incorrect_answers[2], None, None, None, False, "paris")
         mock_cursor.execute.assert_called_once_with(expected_query, expected_values)
 
 
@@ -310,10 +345,11 @@ class TestDisplayQuestionToPlayer(unittest.TestCase):
         # Input values for the function
         game_id = 1
 
-        # Mocking random.sample to ensure predictable shuffling for testing
-        with patch('random.sample', side_effect=lambda data, k: data[:k]):
+        # Mocking the game's RNG to ensure predictable shuffling for testing
+        with patch('db_utils.answer_order_for', return_value=[0, 1, 2, 3]) as mock_answer_order_for:
             # Call the function
             result = display_question_to_player(game_id)
+        mock_answer_order_for.assert_called_once_with(1, 1, 4)
 
         # Assertions
         mock_connect.assert_called_once_with('trivia_game')  # Assuming 'trivia_game' is the expected database name
@@ -333,10 +369,10 @@ class TestDisplayQuestionToPlayer(unittest.TestCase):
         # Check the second execute call for the UPDATE query
         expected_query_update = """
                 UPDATE questions
-                SET already_displayed = True
+                SET already_displayed = True, answer_order = %s
                 WHERE id = %s
             """
-        expected_values_update = (1,)  # Assuming the question_id is always 1 for this test
+        expected_values_update = ("0123", 1)  # Assuming the question_id is always 1 for this test
         mock_cursor.execute.assert_any_call(expected_query_update, expected_values_update)
 
         # Additional assertions
@@ -442,10 +478,10 @@ class TestDisplayQuestionToPlayer(unittest.TestCase):
         # Check the execute call for the UPDATE query
         expected_query_update = """
                 UPDATE questions
-                SET already_displayed = True
+                SET already_displayed = True, answer_order = %s
                 WHERE id = %s
             """
-        expected_values_update = (1,)  # Assuming the question_id is always 1 for this test
+        expected_values_update = (ANY, 1)  # Assuming the question_id is always 1 for this test
         mock_cursor.execute.assert_any_call(expected_query_update, expected_values_update)
 
         # Additional assertions
@@ -471,151 +507,129 @@ class TestDisplayQuestionToPlayer(unittest.TestCase):
 
 
 class TestDisplayQuestionToPlayerFiftyFifty(unittest.TestCase):
+    expected_query = """
+                SELECT id, game_id, question, correct_answer, answer_1, answer_2, answer_3, answer_order,
+                       fifty_fifty_kept
+                FROM questions
+                WHERE id = %s
+            """
 
-    @patch('db_utils._connect_to_db')  # Mock the database connection
-    def test_display_question_to_player_fifty_fifty(self, mock_connect):
-        # Set up the mock behavior
+    def mock_question(self, mock_connect, row):
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = row
         mock_connection.cursor.return_value = mock_cursor
         mock_connect.return_value = mock_connection
+        return mock_connection, mock_cursor
 
-        # Test with the mocked database connection and a question_id
-        question_id = 42
-        correct_answer = "Paris"
-        incorrect_answer = "Berlin"
-
-        mock_cursor.fetchone.return_value = (1, 1, f"What is the capital of France?", correct_answer, incorrect_answer)
-
-        # Call the function
-        result = display_question_to_player_fifty_fifty(question_id)
-
-        # Assertions:
-        # Check that the result is a dictionary
-        self.assertIsInstance(result, dict)
-
-        # Check that the expected keys are present in the result
-        expected_keys = ["question_id", "game_id", "question_text", "answers"]
-        self.assertCountEqual(result.keys(), expected_keys)
-
-        # Check that the correct keys have the expected values
-        self.assertEqual(result["question_id"], 1)
-        self.assertEqual(result["game_id"], 1)
-        self.assertEqual(result["question_text"], f"What is the capital of France?")
+    @patch('db_utils._connect_to_db')  # Mock the database connection
+    def test_display_question_to_player_fifty_fifty(self, mock_connect):
+        # the answers were shown as Madrid, Paris, Rome, Berlin and the fifty-fifty keeps Rome (answer_3)
+        mock_connection, mock_cursor = self.mock_question(mock_connect, (
+            42, 1, "What is the capital of France?", "Paris", "Berlin", "Madrid", "Rome", "2031", 3))
 
-        # Check that the answers list has two elements
-        self.assertEqual(len(result["answers"]), 2)
+        result = display_question_to_player_fifty_fifty(42)
 
-        # Check that the database connection was closed
+        self.assertEqual(result, {
+            "question_id": 42,
+            "game_id": 1,
+            "question_text": "What is the capital of France?",
+            "answers": ["Paris", "Rome"],
+            "option_ids": [1, 2]
+        })
+        mock_cursor.execute.assert_called_once_with(self.expected_query, (42,))
+        # reading the fifty-fifty doesn't commit anything
+        mock_connection.commit.assert_not_called()
+        mock_cursor.close.assert_called_once()
         mock_connection.close.assert_called_once()
 
     @patch('db_utils._connect_to_db')  # Mock the database connection
-    def test_edge_case_empty_result(self, mock_connect):
-        # Set up the mock behavior for an empty result (edge case)
-        mock_connection = MagicMock()
-        mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = None  # Simulate an empty result
-        mock_connection.cursor.return_value = mock_cursor
-        mock_connect.return_value = mock_connection
+    def test_first_fifty_fifty_is_stored(self, mock_connect):
+        mock_connection, mock_cursor = self.mock_question(mock_connect, (
+            42, 1, "What is the capital of France?", "Paris", "Berlin", "Madrid", "Rome", "2031", None))
+
+        with patch('db_utils.rng_for') as mock_rng_for:
+            mock_rng_for.return_value.randint.return_value = 1
+            result = display_question_to_player_fifty_fifty(42)
+
+        # the wrong answer kept comes from the game's RNG
+        mock_rng_for.assert_called_once_with(1, "fifty_fifty", 42)
+        self.assertEqual(result["answers"], ["Paris", "Berlin"])
+        self.assertEqual(result["option_ids"], [1, 3])
+        mock_cursor.execute.assert_any_call("""
+            UPDATE questions
+            SET fifty_fifty_kept = %s
+            WHERE id = %s AND fifty_fifty_kept IS NULL
+        """, (1, 42))
+        mock_connection.commit.assert_called_once()
 
-        # Test with the mocked database connection and an existing question_id
-        existing_question_id = 42
-        result = display_question_to_player_fifty_fifty(existing_question_id)
+    @patch('db_utils._connect_to_db')  # Mock the database connection
+    def test_non_existent_question_id(self, mock_connect):
+        mock_connection, mock_cursor = self.mock_question(mock_connect, None)  # Simulate non-existent question
+
+        # Test with the mocked database connection and a non-existent question_id
+        question_id = 9999
+        result = display_question_to_player_fifty_fifty(question_id)
 
         # Assertions:
-        # Check if result is a dictionary
-        self.assertIsInstance(result, dict)
-
-        if 'error' in result:
-            # Check that the error message is as expected
-            expected_error_message = f"Question with ID {existing_question_id} not found."
-            self.assertEqual(str(result.get('error', '')), expected_error_message)
-        else:
-            # Check that the keys are present in the result dictionary
-            expected_keys = ["question_id", "game_id", "question_text", "answers"]
-            for key in expected_keys:
-                self.assertIn(key, result)
+        self.assertIn('error', result)
+        expected_error_message = f"Question with ID {question_id} not found."
+        self.assertEqual(result['error'], expected_error_message)
 
         # Check that _connect_to_db was called with the correct arguments
         mock_connect.assert_called_with('trivia_game')
+        mock_cursor.execute.assert_called_once_with(self.expected_query, (question_id,))
+        mock_connection.commit.assert_not_called()
+        mock_connection.close.assert_called_once()
 
-        # Check that execute() was called on the mock_cursor with the correct query
-        expected_query = """
-                SELECT id, game_id, question, correct_answer, answer_1
-                FROM questions
-                WHERE id = %s
-            """
-        mock_cursor.execute.assert_called_once_with(expected_query, (existing_question_id,))
 
-        # Check additional assertions
-        mock_connection.commit.assert_called_once()
-        mock_cursor.close.assert_called_once()  # Add this line
-        mock_connection.close.assert_called_once()
+class TestUseLifeline(unittest.TestCase):
 
+    @patch('db_utils._fetch_lifeline_question')
     @patch('db_utils._connect_to_db')  # Mock the database connection
-    def test_existing_question_id(self, mock_connect):
-        # Set up the mock behavior
+    def test_use_lifeline(self, mock_connect, mock_fetch_question):
+        mock_fetch_question.return_value = (1, None, True, None)
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = (1, 2, 'Sample Question', 'Correct Answer', 'Incorrect Answer')
+        mock_cursor.fetchone.return_value = (None, 2, False, False)
+        mock_cursor.rowcount = 1
         mock_connection.cursor.return_value = mock_cursor
         mock_connect.return_value = mock_connection
 
-        # Test with the mocked database connection and an existing question_id
-        question_id = 1
-        result = display_question_to_player_fifty_fifty(question_id)
-
-        # Assertions:
-        self.assertIsNotNone(result)
-        self.assertIn('question_id', result)
-        self.assertIn('game_id', result)
-        self.assertIn('question_text', result)
-        self.assertIn('answers', result)
-
-        # Check that _connect_to_db was called with the correct arguments
-        mock_connect.assert_called_with('trivia_game')
+        self.assertEqual(use_lifeline(42, "fifty_fifty"), {"game_id": 1, "left": 1})
 
-        # Check that execute() was called on the mock_cursor with the correct query and values
-        expected_query = """
-                SELECT id, game_id, question, correct_answer, answer_1
-                FROM questions
-                WHERE id = %s
-            """
-        expected_values = (question_id,)
-        mock_cursor.execute.assert_called_once_with(expected_query, expected_values)
+        # the count only goes down if the game has one left
+        mock_cursor.execute.assert_any_call(
+            "UPDATE games SET fifty_fifty_left = fifty_fifty_left - 1 WHERE id = %s AND fifty_fifty_left > 0", (1,))
+        mock_cursor.execute.assert_any_call(
+            "INSERT INTO lifeline_uses (game_id, question_id, lifeline) VALUES (%s, %s, %s)", (1, 42, "fifty_fifty"))
+        mock_connection.commit.assert_called_once()
 
+    @patch('db_utils._fetch_lifeline_question')
     @patch('db_utils._connect_to_db')  # Mock the database connection
-    def test_non_existent_question_id(self, mock_connect):
-        # Set up the mock behavior for a non-existent question_id
+    def test_no_lifelines_left(self, mock_connect, mock_fetch_question):
+        mock_fetch_question.return_value = (1, None, True, None)
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
-        mock_cursor.fetchone.return_value = None  # Simulate non-existent question
+        mock_cursor.fetchone.return_value = (None, 0, False, False)
+        mock_cursor.rowcount = 0  # the conditional decrement didn't change the game
         mock_connection.cursor.return_value = mock_cursor
         mock_connect.return_value = mock_connection
 
-        # Test with the mocked database connection and a non-existent question_id
-        question_id = 9999
-        result = display_question_to_player_fifty_fifty(question_id)
-
-        # Assertions:
-        self.assertIsNotNone(result)
-        self.assertIn('error', result)
-        expected_error_message = f"Question with ID {question_id} not found."
-        self.assertEqual(result['error'], expected_error_message)
-
-        # Check that _connect_to_db was called with the correct arguments
-        mock_connect.assert_called_with('trivia_game')
+        self.assertEqual(use_lifeline(42, "ask_audience"), {"message": "No lifelines left"})
+        mock_connection.rollback.assert_called_once()
+        mock_connection.commit.assert_not_called()
 
-        # Check that execute() was called on the mock_cursor with the correct query and values
-        expected_query = (
-            """
-                SELECT id, game_id, question, correct_answer, answer_1
-                FROM questions
-                WHERE id = %s
-            """
-        )
-        expected_values = (question_id,)
-        mock_cursor.execute.assert_called_once_with(expected_query, expected_values)
+    @patch('db_utils._fetch_lifeline_question')
+    @patch('db_utils._connect_to_db')  # Mock the database connection
+    def test_not_available(self, mock_connect, mock_fetch_question):
+        # the question hasn't been shown yet
+        mock_fetch_question.return_value = (1, None, False, None)
+        self.assertEqual(use_lifeline(42, "fifty_fifty"), {"message": "Lifeline not available"})
+        # the question is of another game
+        mock_fetch_question.return_value = (2, None, True, None)
+        self.assertEqual(use_lifeline(42, "fifty_fifty", 1), {"message": "Lifeline not available"})
+        mock_connect.assert_not_called()
 
 
 class TestGetCorrectAnswer(unittest.TestCase):
@@ -734,8 +748,9 @@ class TestGetCorrectAnswer(unittest.TestCase):
 
 class TestUpdateGameScore(unittest.TestCase):
 
+    @patch('db_utils._bump_leaderboard_version')
     @patch('db_utils._connect_to_db')
-    def test_update_game_score_success(self, mock_connect_to_db):
+    def test_update_game_score_success(self, mock_connect_to_db, mock_bump_leaderboard_version):
         # Mock the database connection
         mock_db_connection = mock_connect_to_db.return_value
         mock_cursor = mock_db_connection.cursor.return_value
@@ -754,6 +769,8 @@ class TestUpdateGameScore(unittest.TestCase):
         """
         mock_cursor.execute.assert_called_once_with(expected_query, (game_id,))
         mock_db_connection.commit.assert_called_once()
+        # and that the leaderboard version went up
+        mock_bump_leaderboard_version.assert_called_once()
 
         # Check if the cursor and connection were closed
         mock_cursor.close.assert_called_once()
@@ -796,6 +813,153 @@ class TestUpdateGameScore(unittest.TestCase):
         mock_db_connection.close.assert_called_once()
 
 
+class TestRecordAnswer(unittest.TestCase):
+    # (games.room_id, questions.game_id, questions.room_id, already_displayed, switched_to,
+    #  rooms.current_question_id, answered)
+    SHOWN_QUESTION = (None, 3, None, True, None, None, False)
+
+    def mock_cursor(self, mock_connect_to_db, row=SHOWN_QUESTION):
+        mock_cursor = mock_connect_to_db.return_value.cursor.return_value
+        mock_cursor.fetchone.return_value = row
+        return mock_cursor
+
+    @patch('db_utils._bump_leaderboard_version')
+    @patch('db_utils._connect_to_db')
+    def test_first_correct_answer(self, mock_connect_to_db, mock_bump_leaderboard_version):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = self.mock_cursor(mock_connect_to_db)
+
+        result = record_answer(3, 46, "Paris", True, 7)
+
+        # Check that the question was checked, the answer was saved and the score increased in the same transaction
+        self.assertTrue(result)
+        self.assertEqual(mock_cursor.execute.call_count, 3)
+        self.assertEqual(mock_cursor.execute.call_args_list[0][0][1], (46, 46, 3))
+        self.assertEqual(mock_cursor.execute.call_args_list[1][0][1], (3, 46, "Paris", True, 7))
+        self.assertEqual(mock_cursor.execute.call_args_list[2][0][1], (7, 3))
+        mock_db_connection.commit.assert_called_once()
+        mock_bump_leaderboard_version.assert_called_once()
+        mock_cursor.close.assert_called_once()
+        mock_db_connection.close.assert_called_once()
+
+    @patch('db_utils._bump_leaderboard_version')
+    @patch('db_utils._connect_to_db')
+    def test_current_room_question(self, mock_connect_to_db, mock_bump_leaderboard_version):
+        mock_db_connection = mock_connect_to_db.return_value
+        self.mock_cursor(mock_connect_to_db, (1, None, 1, True, None, 46, False))
+
+        # the question the room is on can be answered by any game of the room
+        self.assertTrue(record_answer(3, 46, "Paris", True))
+        mock_db_connection.commit.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_first_wrong_answer(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = self.mock_cursor(mock_connect_to_db)
+
+        result = record_answer(3, 46, "Berlin", False)
+
+        # Check that the answer was saved without changing the score
+        self.assertTrue(result)
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+        mock_db_connection.commit.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_question_already_answered(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = self.mock_cursor(mock_connect_to_db, (None, 3, None, True, None, None, True))
+
+        result = record_answer(3, 46, "Paris", True)
+
+        # Check that the retried answer was not scored again
+        self.assertFalse(result)
+        mock_cursor.execute.assert_called_once()
+        mock_db_connection.commit.assert_not_called()
+        mock_db_connection.rollback.assert_called_once()
+        mock_db_connection.close.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_answered_at_the_same_time(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = self.mock_cursor(mock_connect_to_db)
+        mock_cursor.execute.side_effect = [None, mysql.connector.IntegrityError("Duplicate entry", errno=1062)]
+
+        # the other answer was saved first, so this one is a retry
+        self.assertFalse(record_answer(3, 46, "Paris", True))
+        mock_db_connection.commit.assert_not_called()
+
+    @patch('db_utils._connect_to_db')
+    def test_other_integrity_error(self, mock_connect_to_db):
+        mock_cursor = self.mock_cursor(mock_connect_to_db)
+        mock_cursor.execute.side_effect = [None, mysql.connector.IntegrityError("Foreign key", errno=1452)]
+
+        # only a duplicate key means the question was answered already
+        with self.assertRaises(DbConnectionError):
+            record_answer(3, 46, "Paris", True)
+
+    @patch('db_utils._connect_to_db')
+    def test_question_not_available(self, mock_connect_to_db):
+        for row in ((None, 4, None, True, None, None, False),  # the question of another game
+                    (None, 3, None, False, None, None, False),  # not shown yet
+                    (None, 3, None, True, 47, None, False),  # switched for another question
+                    (2, None, 1, True, None, 46, False),  # the question of another room
+                    (1, None, 1, True, None, 47, False),  # the room has moved on to the next question
+                    (None, None, None, None, None, None, False),  # no such question
+                    None):  # no such game
+            mock_db_connection = mock_connect_to_db.return_value
+            mock_db_connection.reset_mock()
+            self.mock_cursor(mock_connect_to_db, row)
+
+            self.assertIsNone(record_answer(3, 46, "Paris", True))
+            mock_db_connection.commit.assert_not_called()
+
+    @patch('db_utils._connect_to_db')
+    def test_record_answer_db_error(self, mock_connect_to_db):
+        mock_connect_to_db.side_effect = Exception("Simulated DB error")
+
+        with self.assertRaises(DbConnectionError) as context:
+            record_answer(3, 46, "Paris", True)
+
+        self.assertEqual(str(context.exception), "Failed to record answer in DB")
+
+    @patch('db_utils._connect_to_db')
+    def test_get_answer(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+        mock_cursor.fetchone.return_value = ("Paris", 1)
+
+        result = get_answer(3, 46)
+
+        self.assertEqual(result, ("Paris", 1))
+        self.assertEqual(mock_cursor.execute.call_args[0][1], (3, 46))
+        mock_db_connection.close.assert_called_once()
+
+
+class TestAddAnswerTimes(unittest.TestCase):
+    @patch('db_utils._connect_to_db')
+    def test_add_answer_times(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+
+        add_answer_times([(3, 46, 100.0, 102.5, True), (4, 46, None, 103.0, False)])
+
+        # Check that the whole batch was written in one request, with the time taken in milliseconds
+        mock_cursor.executemany.assert_called_once()
+        self.assertEqual(mock_cursor.executemany.call_args[0][1], [(3, 46, 100.0, 102.5, 2500, True),
+                                                                   (4, 46, None, 103.0, None, False)])
+        mock_db_connection.commit.assert_called_once()
+        mock_db_connection.close.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_add_answer_times_db_error(self, mock_connect_to_db):
+        mock_connect_to_db.side_effect = Exception("Simulated DB error")
+
+        with self.assertRaises(DbConnectionError) as context:
+            add_answer_times([(3, 46, 100.0, 102.5, True)])
+
+        self.assertEqual(str(context.exception), "Failed to add answer times to DB")
+
+
 class TestGetUserScore(unittest.TestCase):
     @patch("db_utils._connect_to_db")
     def test_get_user_score_success(self, mock_connect_to_db):
@@ -870,6 +1034,340 @@ class TestGetUserScore(unittest.TestCase):
         mock_db_connection.close.assert_called_once()
 
 
+class TestGetGameProgress(unittest.TestCase):
+    @patch('db_utils._connect_to_db')
+    def test_get_game_progress_success(self, mock_connect_to_db):
+        mock_db_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect_to_db.return_value = mock_db_connection
+        mock_db_connection.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (100, 9, "ramp", 15, None)
+
+        result = get_game_progress(3)
+
+        # Check that the game settings and the number of added questions are returned
+        self.assertEqual(result, (100, 9, "ramp", 15, None))
+        mock_connect_to_db.assert_called_once_with("trivia_game")
+        mock_cursor.execute.assert_called_once()
+        self.assertEqual(mock_cursor.execute.call_args[0][1], (3,))
+        mock_cursor.close.assert_called_once()
+        mock_db_connection.close.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_get_game_progress_db_error(self, mock_connect_to_db):
+        mock_connect_to_db.side_effect = Exception("Simulated DB error")
+
+        with self.assertRaises(DbConnectionError) as context:
+            get_game_progress(3)
+
+        self.assertEqual(str(context.exception), "Failed to fetch game progress from DB")
+
+
+class TestAdvanceRoomQuestion(unittest.TestCase):
+    @patch('db_utils._connect_to_db')
+    def test_advance_room_question(self, mock_connect_to_db):
+        mock_db_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect_to_db.return_value = mock_db_connection
+        mock_db_connection.cursor.return_value = mock_cursor
+        question = (7, "What is the capital of France?", "Paris", "Berlin", "Madrid", "Rome", "paris")
+        mock_cursor.fetchone.return_value = question
+
+        with patch('db_utils.answer_order_for', return_value=[2, 0, 1, 3]) as mock_answer_order_for:
+            result = advance_room_question(2)
+
+        self.assertEqual(result, question + ("2013",))
+        mock_answer_order_for.assert_called_once_with(None, 7)
+        # Check that the question was marked as provided, with its answer order, and became the current question
+        mock_cursor.execute.assert_any_call(
+            "UPDATE questions SET already_displayed = True, answer_order = %s WHERE id = %s", ("2013", 7))
+        mock_cursor.execute.assert_any_call("UPDATE rooms SET current_question_id = %s WHERE id = %s", (7, 2))
+        mock_db_connection.commit.assert_called_once()
+        mock_cursor.close.assert_called_once()
+        mock_db_connection.close.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_no_more_room_questions(self, mock_connect_to_db):
+        mock_db_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect_to_db.return_value = mock_db_connection
+        mock_db_connection.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = None
+
+        result = advance_room_question(2)
+
+        self.assertIsNone(result)
+        mock_cursor.execute.assert_called_once()
+
+
+class TestSwitchQuestion(unittest.TestCase):
+    @patch('db_utils._storage')
+    @patch('db_utils._connect_to_db')
+    def test_already_switched(self, mock_connect_to_db, mock_storage):
+        mock_db_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect_to_db.return_value = mock_db_connection
+        mock_db_connection.cursor.return_value = mock_cursor
+        mock_storage.lock_rows = "FOR UPDATE"
+        # the other switch got the lock first and set switched_to
+        mock_cursor.fetchone.return_value = None
+
+        result = switch_question(46, "What is the capital of Italy?", "Rome", ["Berlin", "Madrid", "Paris"])
+
+        self.assertEqual(result, {"message": "Lifeline not available"})
+        # the question row was locked before reading it, and no new question was added
+        mock_cursor.execute.assert_called_once_with(
+            "SELECT game_id FROM questions WHERE id = %s AND switched_to IS NULL FOR UPDATE", (46,))
+        mock_db_connection.commit.assert_not_called()
+        mock_db_connection.close.assert_called_once()
+
+
+class TestGetRoomLeaderboard(unittest.TestCase):
+    @patch('db_utils._connect_to_db')
+    def test_get_room_leaderboard(self, mock_connect_to_db):
+        mock_db_connection = MagicMock()
+        mock_cursor = MagicMock()
+        mock_connect_to_db.return_value = mock_db_connection
+        mock_db_connection.cursor.return_value = mock_cursor
+        # the games of the room, then the usernames of their players from the main db
+        mock_cursor.fetchall.side_effect = [[(5, 1), (4, 3)], [(4, "Kate L"), (5, "Helen V")]]
+
+        result = get_room_leaderboard(2)
+
+        self.assertEqual(result, [("Kate L", 3), ("Helen V", 1)])
+        self.assertEqual(mock_cursor.execute.call_args_list[0][0][1], (2,))
+        self.assertEqual(mock_cursor.execute.call_args_list[1][0][1], (4, 5))
+
+    @patch('db_utils._connect_to_db')
+    def test_get_room_leaderboard_db_error(self, mock_connect_to_db):
+        mock_connect_to_db.side_effect = Exception("Simulated DB error")
+
+        with self.assertRaises(DbConnectionError):
+            get_room_leaderboard(2)
+
+
+class TestLeaderboardVersion(unittest.TestCase):
+    @patch('db_utils._connect_to_db')
+    def test_get_leaderboard_version(self, mock_connect_to_db):
+        mock_cursor = mock_connect_to_db.return_value.cursor.return_value
+        mock_cursor.fetchone.return_value = (42, 1700000000.5, None)
+
+        # the version is shared by every app process, so it is read from the main db
+        self.assertEqual(get_leaderboard_version(), ("42", 1700000000.5, None))
+        mock_connect_to_db.assert_called_once_with("trivia_game")
+
+    @patch('db_utils._connect_to_db')
+    def test_leaderboard_version_of_window(self, mock_connect_to_db):
+        mock_cursor = mock_connect_to_db.return_value.cursor.return_value
+        mock_cursor.fetchone.return_value = (42, 1700000000.5, date(2024, 3, 4))
+
+        # the window starts on the day of the db, not of the app server
+        self.assertEqual(get_leaderboard_version("weekly"), ("42", 1700000000.5, "2024-03-04"))
+        self.assertIn("WEEKDAY(CURRENT_DATE)", mock_cursor.execute.call_args[0][0])
+
+    @patch('db_utils._connect_to_db')
+    def test_bump_leaderboard_version(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+
+        db_utils._bump_leaderboard_version()
+
+        self.assertIn("SET version = version + 1", mock_cursor.execute.call_args[0][0])
+        mock_db_connection.commit.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_bump_leaderboard_version_db_error(self, mock_connect_to_db):
+        mock_connect_to_db.side_effect = Exception("Simulated DB error")
+
+        # the score change is already committed, so a failed bump doesn't fail the request
+        db_utils._bump_leaderboard_version()
+
+    @patch('db_utils._connect_to_db')
+    def test_get_leaderboard_version_db_error(self, mock_connect_to_db):
+        mock_connect_to_db.side_effect = Exception("Simulated DB error")
+
+        with self.assertRaises(DbConnectionError):
+            get_leaderboard_version()
+
+
+class TestFinishGame(unittest.TestCase):
+    @patch('db_utils._bump_leaderboard_version')
+    @patch('db_utils._connect_to_db')
+    def test_finish_game(self, mock_connect_to_db, mock_bump_leaderboard_version):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+        mock_cursor.rowcount = 1
+        mock_cursor.fetchone.return_value = (8, 12)  # user_id and score of the game
+        mock_cursor.fetchall.return_value = [(8, "Kate L")]
+
+        result = finish_game(3)
+
+        # Check that the game was added to the leaderboards in the same transaction, with the player's username
+        self.assertTrue(result)
+        self.assertEqual(mock_cursor.execute.call_count, 6)
+        self.assertEqual(mock_cursor.execute.call_args_list[2][0][1], (8,))
+        self.assertEqual(mock_cursor.execute.call_args_list[3][0][1], ("daily", 3, "Kate L", 12))
+        self.assertEqual(mock_cursor.execute.call_args_list[4][0][1], ("weekly", 3, "Kate L", 12))
+        # and to the player's best score if it beats it, in its own statement on the main db
+        query, params = mock_cursor.execute.call_args_list[5][0]
+        self.assertIn("INSERT INTO player_best", query)
+        self.assertEqual(params, (8, "Kate L", 12, 3))
+        self.assertEqual(mock_db_connection.commit.call_count, 2)
+        mock_bump_leaderboard_version.assert_called_once()
+
+    @patch('db_utils._connect_to_db')
+    def test_game_already_finished(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+        mock_cursor.rowcount = 0
+
+        result = finish_game(3)
+
+        # Check that the score was not added to the leaderboards again
+        self.assertFalse(result)
+        mock_cursor.execute.assert_called_once()
+        mock_db_connection.commit.assert_not_called()
+
+    @patch('db_utils._connect_to_db')
+    def test_get_window_leaderboard(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+        mock_cursor.fetchall.return_value = [('user1', 12), ('user2', 9)]
+
+        leaderboard = get_window_leaderboard("weekly")
+
+        self.assertEqual(leaderboard, [('user1', 12), ('user2', 9)])
+        query, params = mock_cursor.execute.call_args[0]
+        self.assertIn("FROM leaderboard_windows", query)
+        self.assertEqual(params, ("weekly",))
+        mock_db_connection.close.assert_called_once()
+
+
+class TestGetScoreCounts(unittest.TestCase):
+    @patch('db_utils._connect_to_db')
+    def test_get_score_counts(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+        mock_cursor.fetchall.return_value = [(0, 4), (5, 3)]
+
+        self.assertEqual(get_score_counts(), [(0, 4), (5, 3)])
+        self.assertIn("GROUP BY score", mock_cursor.execute.call_args[0][0])
+        mock_db_connection.close.assert_called_once()
+
+
+class TestGetBestLeaderboard(unittest.TestCase):
+    @patch('db_utils._connect_to_db')
+    def test_get_best_leaderboard(self, mock_connect_to_db):
+        mock_db_connection = mock_connect_to_db.return_value
+        mock_cursor = mock_db_connection.cursor.return_value
+        mock_cursor.fetchall.return_value = [('user1', 15), ('user2', 12)]
+
+        leaderboard = get_best_leaderboard()
+
+        self.assertEqual(leaderboard, [('user1', 15), ('user2', 12)])
+        self.assertIn("FROM player_best", mock_cursor.execute.call_args[0][0])
+        mock_db_connection.close.assert_called_once()
+
+
+@patch('db_utils.REPLICA_HOSTS', ["replica1:3307", "replica2"])
+@patch('db_utils._replicas', itertools.cycle(["replica1:3307", "replica2"]))
+class TestReadReplicas(unittest.TestCase):
+    def setUp(self):
+        set_read_consistency()
+
+    @patch('storage_utils.mysql.connector.connect')
+    def test_reads_go_to_replicas_in_turn(self, mock_connect):
+        _connect_to_read_db("trivia_game")
+        _connect_to_read_db("trivia_game")
+
+        self.assertEqual(mock_connect.call_args_list[0][1]["host"], "replica1")
+        self.assertEqual(mock_connect.call_args_list[0][1]["port"], 3307)
+        self.assertEqual(mock_connect.call_args_list[1][1]["host"], "replica2")
+        self.assertEqual(mock_connect.call_args_list[1][1]["port"], 3306)
+
+    @patch('storage_utils.mysql.connector.connect')
+    def test_strong_consistency_reads_from_primary(self, mock_connect):
+        set_read_consistency(strong=True)
+
+        _connect_to_read_db("trivia_game")
+
+        self.assertEqual(mock_connect.call_args[1]["host"], "localhost")
+
+    @patch('storage_utils.mysql.connector.connect')
+    def test_reads_after_write_go_to_primary(self, mock_connect):
+        # a write connects to the primary, so the request reads its own writes after it
+        update_game_score(3)
+        _connect_to_read_db("trivia_game")
+
+        self.assertEqual(mock_connect.call_args[1]["host"], "localhost")
+
+    @patch('storage_utils.mysql.connector.connect')
+    def test_replica_down(self, mock_connect):
+        mock_connect.side_effect = [mysql.connector.Error("Can't connect"), MagicMock()]
+
+        _connect_to_read_db("trivia_game")
+
+        # the read falls back to the primary
+        self.assertEqual(mock_connect.call_args[1]["host"], "localhost")
+
+
+@patch('db_utils.SHARDS', ["shard_a", "shard_b"])
+@patch('db_utils.MAIN_DB', "shard_a")
+class TestSharding(unittest.TestCase):
+    def test_shard_of(self):
+        # ids are given so that (id - 1) % number of shards is the shard
+        self.assertEqual(_shard_of(1), "shard_a")
+        self.assertEqual(_shard_of(2), "shard_b")
+        self.assertEqual(_shard_of("5"), "shard_a")
+
+    @patch('db_utils.random.randrange')
+    @patch('db_utils._connect_to_db')
+    def test_new_game_gets_id_of_its_shard(self, mock_connect_to_db, mock_randrange):
+        mock_randrange.return_value = 1
+        mock_cursor = mock_connect_to_db.return_value.cursor.return_value
+        mock_cursor.lastrowid = 4
+
+        game_id = add_new_game(3)
+
+        self.assertEqual(game_id, 4)
+        mock_connect_to_db.assert_called_once_with("shard_b")
+        # the second shard gives ids 2, 4, 6, ...
+        mock_cursor.execute.assert_any_call(
+            "SET SESSION auto_increment_increment = %s, auto_increment_offset = %s", (2, 2))
+
+    @patch('db_utils._connect_to_db')
+    def test_game_functions_go_to_the_game_shard(self, mock_connect_to_db):
+        mock_connect_to_db.return_value.cursor.return_value.fetchone.return_value = (7,)
+
+        self.assertEqual(get_user_score(4), 7)
+        mock_connect_to_db.assert_called_once_with("shard_b")
+
+    @patch('db_utils._connect_to_db')
+    def test_leaderboard_merges_shards(self, mock_connect_to_db):
+        shard_a, shard_b = MagicMock(), MagicMock()
+        shard_a.cursor.return_value.fetchall.side_effect = [
+            [(1, 10), (3, 4)], [(1, 'user1'), (2, 'user2'), (3, 'user3'), (4, 'user4')]]
+        shard_b.cursor.return_value.fetchall.return_value = [(2, 12), (4, 1)]
+        mock_connect_to_db.side_effect = lambda db_name: {"shard_a": shard_a, "shard_b": shard_b}[db_name]
+
+        leaderboard = get_leaderboard()
+
+        self.assertEqual(leaderboard, [('user2', 12), ('user1', 10), ('user3', 4), ('user4', 1)])
+        # players are only on the main db, which can be on another server, so no shard query uses them
+        self.assertNotIn("players", shard_b.cursor.return_value.execute.call_args[0][0])
+        self.assertIn("FROM players", shard_a.cursor.return_value.execute.call_args[0][0])
+
+    @patch('db_utils.SHARD_HOSTS', {"shard_b": "10.0.0.2:3307"})
+    @patch('db_utils._storage')
+    def test_shard_on_its_own_server(self, mock_storage):
+        db_utils._connect_to_db("shard_b")
+        mock_storage.connect.assert_called_once_with("shard_b", "10.0.0.2", 3307)
+
+        mock_storage.connect.reset_mock()
+        db_utils._connect_to_db("shard_a")
+        mock_storage.connect.assert_called_once_with("shard_a", "localhost", None)
+
+
 class TestGetLeaderboard(unittest.TestCase):
 
     @patch('db_utils._connect_to_db')
@@ -887,26 +1385,30 @@ class TestGetLeaderboard(unittest.TestCase):
             ('user5', 60)
         ]
 
-        mock_cursor.fetchall.return_value = mock_leaderboard_data
+        # the scores of the games on the shard, then the usernames of their players from the main db
+        mock_cursor.fetchall.side_effect = [[(index, score) for index, (_, score) in enumerate(mock_leaderboard_data)],
+                                            [(index, username) for index, (username, _) in
+                                             enumerate(mock_leaderboard_data)]]
 
         # Call the function
         leaderboard = get_leaderboard()
 
         # Check if the correct SQL query was executed
         expected_query = """
-            SELECT players.username, games.score
-            FROM players
-            JOIN games ON players.id = games.user_id
-            ORDER BY games.score DESC
+            SELECT user_id, score
+            FROM games
+            WHERE user_id IS NOT NULL
+            ORDER BY score DESC
+            LIMIT 10
         """
-        mock_cursor.execute.assert_called_once_with(expected_query)
+        mock_cursor.execute.assert_any_call(expected_query)
 
         # Check if the result matches the expected leaderboard data
         self.assertEqual(leaderboard, mock_leaderboard_data)
 
-        # Check if the cursor and connection were closed
-        mock_cursor.close.assert_called_once()
-        mock_db_connection.close.assert_called_once()
+        # Check if the cursors and connections were closed
+        self.assertEqual(mock_cursor.close.call_count, 2)
+        self.assertEqual(mock_db_connection.close.call_count, 2)
 
     @patch('db_utils._connect_to_db')
     def test_get_leaderboard_empty_data(self, mock_connect_to_db):
@@ -924,10 +1426,11 @@ class TestGetLeaderboard(unittest.TestCase):
 
         # Check if the correct SQL query was executed
         expected_query = """
-            SELECT players.username, games.score
-            FROM players
-            JOIN games ON players.id = games.user_id
-            ORDER BY games.score DESC
+            SELECT user_id, score
+            FROM games
+            WHERE user_id IS NOT NULL
+            ORDER BY score DESC
+            LIMIT 10
         """
         mock_cursor.execute.assert_called_once_with(expected_query)
 
@@ -938,6 +1441,25 @@ class TestGetLeaderboard(unittest.TestCase):
         mock_cursor.close.assert_called_once()
         mock_db_connection.close.assert_called_once()
 
+    @patch('db_utils._connect_to_db')
+    def test_get_speed_leaderboard(self, mock_connect_to_db):
+        mock_cursor = mock_connect_to_db.return_value.cursor.return_value
+        mock_cursor.fetchall.side_effect = [[(2, 87), (1, 40)], [(1, 'user1'), (2, 'user2')]]
+
+        leaderboard = get_speed_leaderboard()
+
+        # the games are ordered by their speed score instead of their score
+        self.assertIn("ORDER BY speed_score DESC", mock_cursor.execute.call_args_list[0][0][0])
+        self.assertEqual(leaderboard, [('user2', 87), ('user1', 40)])
+
+    @patch('db_utils._connect_to_db')
+    def test_get_game_scores(self, mock_connect_to_db):
+        mock_cursor = mock_connect_to_db.return_value.cursor.return_value
+        mock_cursor.fetchone.return_value = (7, 52)
+
+        self.assertEqual(get_game_scores(3), (7, 52))
+        mock_cursor.execute.assert_called_once_with("SELECT score, speed_score FROM games WHERE id = %s", (3,))
+
     @patch('db_utils._connect_to_db')
     def test_get_leaderboard_db_error(self, mock_connect_to_db):
         # Mock the database connection to raise an exception
@@ -972,7 +1494,9 @@ class TestGetLeaderboard(unittest.TestCase):
             ('user7', 4), ('user8', 3), ('user9', 2), ('user10', 1), ('user11', 0), ('user12', 0)
         ]
 
-        mock_cursor.fetchall.return_value = mock_leaderboard_data
+        mock_cursor.fetchall.side_effect = [[(index, score) for index, (_, score) in enumerate(mock_leaderboard_data)],
+                                            [(index, username) for index, (username, _) in
+                                             enumerate(mock_leaderboard_data)]]
 
         # Call the function
         leaderboard = get_leaderboard()
@@ -984,10 +1508,12 @@ class TestGetLeaderboard(unittest.TestCase):
 
         # Check if the result matches the expected leaderboard data
         self.assertEqual(leaderboard, expected_result)
+        # only the usernames of the top 10 are read
+        self.assertEqual(mock_cursor.execute.call_args[0][1], tuple(range(10)))
 
-        # Check if the cursor and connection were closed
-        mock_cursor.close.assert_called_once()
-        mock_connection.close.assert_called_once()
+        # Check if the cursors and connections were closed
+        self.assertEqual(mock_cursor.close.call_count, 2)
+        self.assertEqual(mock_connection.close.call_count, 2)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,126 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from game_socket import GameSocketSession
+
+QUESTION = {"question_id": 46, "game_id": 1, "question_text": "Test question", "answers": ["a", "b", "c", "d"]}
+
+
+class TestGameSocketSession(unittest.TestCase):
+
+    def setUp(self):
+        self.session = GameSocketSession()
+
+    def send(self, message):
+        return self.session.handle(json.dumps(message))
+
+    @patch('game_socket.Game')
+    @patch('game_socket.User')
+    def start_game(self, mock_user, mock_game):
+        mock_user.return_value.get_or_create.return_value = 3
+        mock_game.return_value.start_game.return_value = 1
+        mock_game.settings_error.return_value = None
+        mock_game.provide_question.return_value = QUESTION
+        return self.send({"type": "start", "user_name": "helen", "num_questions": 5}), mock_game
+
+    def test_start_pushes_first_question(self):
+        replies, mock_game = self.start_game()
+
+        self.assertEqual(replies[0], {"type": "started", "player_id": 3, "game_id": 1})
+        self.assertEqual(replies[1], {"type": "question", **QUESTION})
+        mock_game.assert_called_once_with(3, None, None, 5)
+        self.assertEqual(self.session.game.question_id, 46)
+
+    @patch('game_socket.Game')
+    def test_answer_pushes_next_question(self, mock_game):
+        self.start_game()
+        mock_game.check_answer.return_value = {"score": 1, "correct_answer": "a", "result": "correct"}
+        mock_game.provide_question.return_value = {**QUESTION, "question_id": 47}
+
+        replies = self.send({"type": "answer", "answer": "a"})
+
+        mock_game.check_answer.assert_called_once_with(1, 46, "a")
+        self.assertEqual(replies[0], {"type": "result", "score": 1, "correct_answer": "a", "result": "correct"})
+        self.assertEqual(replies[1]["type"], "question")
+        self.assertEqual(replies[1]["question_id"], 47)
+
+    @patch('game_socket.Game')
+    def test_answer_with_option_id(self, mock_game):
+        self.start_game()
+        mock_game.is_valid_option.return_value = True
+        mock_game.check_answer.return_value = {"score": 0, "correct_answer": "a", "result": "wrong"}
+
+        self.send({"type": "answer", "option_id": 3})
+
+        mock_game.check_answer.assert_called_once_with(1, 46, option_id=3)
+
+    @patch('game_socket.Game')
+    def test_last_answer_ends_game(self, mock_game):
+        self.start_game()
+        mock_game.check_answer.return_value = {"score": 5, "correct_answer": "a", "result": "correct"}
+        mock_game.provide_question.return_value = {"message": "No more questions"}
+
+        replies = self.send({"type": "answer", "answer": "a"})
+
+        self.assertEqual(replies[1], {"type": "end", "score": 5})
+        self.assertTrue(self.session.game.finished)
+
+    @patch('classes.lifeline.FiftyFifty.use')
+    def test_fifty_fifty(self, mock_use):
+        self.start_game()
+        mock_use.return_value = {"answers": ["a", "b"]}
+
+        replies = self.send({"type": "fifty_fifty"})
+
+        mock_use.assert_called_once_with(46, 1)
+        self.assertEqual(replies, [{"type": "lifeline", "lifeline": "fifty_fifty", "data": {"answers": ["a", "b"]}}])
+
+    @patch('classes.lifeline.AskAudience.use')
+    def test_no_lifelines_left(self, mock_use):
+        self.start_game()
+        mock_use.return_value = {"message": "No lifelines left"}
+
+        replies = self.send({"type": "ask_audience"})
+
+        self.assertEqual(replies, [self.session._error("No lifelines left")])
+
+    @patch('classes.lifeline.SwitchQuestion.use')
+    def test_switch_question(self, mock_use):
+        self.start_game()
+        mock_use.return_value = {"question_id": 47, "game_id": 1, "question_text": "q", "answers": ["a", "b", "c", "d"]}
+
+        replies = self.send({"type": "switch_question"})
+
+        mock_use.assert_called_once_with(46, 1)
+        self.assertEqual(replies[0]["lifeline"], "switch_question")
+        # the player answers the new question
+        self.assertEqual(self.session.game.question_id, 47)
+
+    def test_message_before_start(self):
+        replies = self.send({"type": "answer", "answer": "a"})
+
+        self.assertEqual(replies, [{"type": "error", "message": "Game has not started"}])
+
+    def test_invalid_json(self):
+        replies = self.session.handle("not json")
+
+        self.assertEqual(replies, [{"type": "error", "message": "Invalid message. Expected JSON"}])
+
+    def test_invalid_user_name(self):
+        replies = self.send({"type": "start", "user_name": ""})
+
+        self.assertEqual(replies, [{"type": "error", "message": "User name must be between 1 and 40 characters"}])
+
+    @patch('game_socket.Game')
+    def test_internal_server_error(self, mock_game):
+        self.start_game()
+        mock_game.check_answer.side_effect = Exception("Simulated internal server error")
+
+        replies = self.send({"type": "answer", "answer": "a"})
+
+        self.assertEqual(replies, [{"type": "error", "message": "Internal server error"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import random
+import unittest
+
+from flask import Flask
+
+from classes.models import Question, GameSession, LeaderboardEntry, deep_sizeof
+from http_utils import FastJSONProvider
+
+ROW = (46, "What is the capital of France?", "Paris", "Berlin", "Madrid", "Rome")
+
+
+class TestQuestion(unittest.TestCase):
+
+    def test_from_row(self):
+        question = Question.from_row(ROW)
+
+        self.assertEqual(question.question_id, 46)
+        self.assertEqual(question.correct_answer, "Paris")
+        self.assertCountEqual(question.answers, ["Paris", "Berlin", "Madrid", "Rome"])
+        self.assertFalse(hasattr(question, "__dict__"))
+
+    def test_is_correct(self):
+        question = Question.from_row(ROW)
+
+        self.assertTrue(question.is_correct("PARIS"))
+        self.assertFalse(question.is_correct("Rome"))
+
+    def test_incorrect_answer_is_wrong(self):
+        question = Question.from_row((47, "Which kingdom did Bismarck lead?", "Prussia", "Russia", "Austria", "Spain"))
+
+        self.assertTrue(question.is_correct("Prusia"))
+        self.assertFalse(question.is_correct("Russia"))
+
+    def test_options_that_differ_in_punctuation(self):
+        question = Question.from_row((48, "Which language did Bjarne Stroustrup design?", "C++", "C#", "C", "Java"))
+
+        self.assertTrue(question.is_correct("c++"))
+        self.assertFalse(question.is_correct("C#"))
+        self.assertFalse(question.is_correct("C"))
+
+    def test_stored_answer_order(self):
+        # the answers were shown as Madrid, Paris, Rome, Berlin
+        question = Question.from_row(ROW + ("paris", "2031"))
+
+        self.assertEqual(question.answers, ("Madrid", "Paris", "Rome", "Berlin"))
+        self.assertEqual(question.correct_option, 1)
+        self.assertTrue(question.is_correct_option(1))
+        self.assertFalse(question.is_correct_option(0))
+
+    def test_answers_are_shuffled_once(self):
+        # the same seed gives the same order, e.g. for every player in a room
+        first = Question.from_row(ROW, random.Random(46))
+        second = Question.from_row(ROW, random.Random(46))
+
+        self.assertEqual(first.answers, second.answers)
+        self.assertEqual(first.to_dict(room_id=3), {
+            "question_id": 46,
+            "room_id": 3,
+            "question_text": "What is the capital of France?",
+            "answers": list(first.answers)
+        })
+
+
+class TestGameSession(unittest.TestCase):
+
+    def test_memory(self):
+        session = GameSession(12345, 678)
+        session.question_id = 91011
+        session.score = 7
+
+        self.assertFalse(hasattr(session, "__dict__"))
+        # small enough to keep hundreds of thousands of active games in memory
+        self.assertLess(deep_sizeof(session), 300)
+
+
+class TestLeaderboardEntry(unittest.TestCase):
+
+    def test_fields(self):
+        entry = LeaderboardEntry("Kate L", 12)
+
+        self.assertEqual(entry, ("Kate L", 12))
+        self.assertEqual((entry.username, entry.score), ("Kate L", 12))
+        self.assertEqual(LeaderboardEntry.from_rows([("Kate L", 12)]), [entry])
+
+    def test_sent_as_list(self):
+        provider = FastJSONProvider(Flask(__name__))
+
+        self.assertEqual(json.loads(provider.dumps([LeaderboardEntry("Kate L", 12)])), [["Kate L", 12]])
+
+
+if __name__ == '__main__':
+    unittest.main()
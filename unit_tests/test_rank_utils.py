@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import MagicMock
+
+from rank_utils import FenwickTree, ScoreRanking
+
+
+class TestFenwickTree(unittest.TestCase):
+
+    def test_prefix_sum(self):
+        tree = FenwickTree(16)
+        for index, count in [(0, 3), (5, 2), (15, 1)]:
+            tree.add(index, count)
+
+        self.assertEqual(tree.prefix_sum(0), 3)
+        self.assertEqual(tree.prefix_sum(4), 3)
+        self.assertEqual(tree.prefix_sum(5), 5)
+        self.assertEqual(tree.prefix_sum(15), 6)
+
+
+class TestScoreRanking(unittest.TestCase):
+
+    def setUp(self):
+        # 4 games with 0 points, 3 with 5, 2 with 10 and 1 with 15
+        self.load_counts = MagicMock(return_value=[(0, 4), (5, 3), (10, 2), (15, 1)])
+        self.ranking = ScoreRanking(15, self.load_counts)
+
+    def test_rank(self):
+        self.assertEqual(self.ranking.rank(15), (1, 10, 90.0))
+        self.assertEqual(self.ranking.rank(10), (2, 10, 70.0))
+        self.assertEqual(self.ranking.rank(0), (7, 10, 0.0))
+        # the counts are loaded from the db once
+        self.load_counts.assert_called_once()
+
+    def test_updates(self):
+        self.ranking.rank(0)
+
+        self.ranking.game_added()
+        self.ranking.score_changed(10, 11)
+
+        self.assertEqual(self.ranking.rank(11), (2, 11, 81.8))
+        self.assertEqual(self.ranking.rank(10), (3, 11, 72.7))
+
+    def test_updates_before_load_are_ignored(self):
+        # the counts loaded from the db already have the game
+        self.ranking.game_added()
+
+        self.assertEqual(self.ranking.rank(0), (7, 10, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from rate_limit_utils import TokenBucket, MemoryBucketStore, RedisBucketStore
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_acquire_without_waiting(self):
+        bucket = TokenBucket(rate=0.2, capacity=1)
+
+        self.assertTrue(bucket.acquire())
+        # the bucket is empty now and the next token is 5 seconds away
+        self.assertFalse(bucket.acquire(timeout=1))
+
+    @patch('rate_limit_utils.time.sleep')
+    def test_acquire_waits_for_token(self, mock_sleep):
+        bucket = TokenBucket(rate=0.2, capacity=1)
+        bucket.acquire()
+
+        self.assertTrue(bucket.acquire(timeout=10))
+        mock_sleep.assert_called_once()
+
+    def test_take_returns_wait_time(self):
+        bucket = TokenBucket(rate=0.5, capacity=2)
+
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 2, places=1)
+
+
+class TestMemoryBucketStore(unittest.TestCase):
+
+    def test_one_bucket_per_key(self):
+        store = MemoryBucketStore()
+
+        self.assertEqual(store.take("check_answer:1.2.3.4", 1, 1), 0)
+        self.assertGreater(store.take("check_answer:1.2.3.4", 1, 1), 0)
+        self.assertEqual(store.take("check_answer:5.6.7.8", 1, 1), 0)
+
+
+class TestRedisBucketStore(unittest.TestCase):
+
+    @patch('rate_limit_utils.redis')
+    def test_take_runs_script(self, mock_redis):
+        mock_script = MagicMock(return_value=b"1.5")
+        mock_redis.Redis.from_url.return_value.register_script.return_value = mock_script
+
+        store = RedisBucketStore("redis://localhost:6379/0")
+        wait = store.take("add_game:1.2.3.4", 0.1, 5)
+
+        self.assertEqual(wait, 1.5)
+        self.assertEqual(mock_script.call_args[1]["keys"], ["rate_limit:add_game:1.2.3.4"])
+
+    @patch('rate_limit_utils.redis', None)
+    def test_redis_not_installed(self):
+        with self.assertRaises(ImportError):
+            RedisBucketStore("redis://localhost:6379/0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import importlib
+import os
+import unittest
+from unittest.mock import patch
+
+import config
+from classes.lifeline_utils import random_partition, move_answers, friend_suggestion
+from rng_utils import rng_for
+
+
+class TestRngFor(unittest.TestCase):
+
+    def test_reproducible(self):
+        self.assertEqual(rng_for(3, "answer_order", 46).sample(range(4), 4),
+                         rng_for(3, "answer_order", 46).sample(range(4), 4))
+        # ids from a URL are strings
+        self.assertEqual(rng_for(3, "ask_audience", 46).random(), rng_for("3", "ask_audience", "46").random())
+
+    def test_streams_are_separate(self):
+        numbers = {rng_for(3, "answer_order", 46).random(), rng_for(4, "answer_order", 46).random(),
+                   rng_for(3, "answer_order", 47).random(), rng_for(3, "fifty_fifty", 46).random(),
+                   rng_for(3, "answer_order", 46, seed="other").random()}
+
+        self.assertEqual(len(numbers), 5)
+
+    def test_seed_is_not_in_the_code(self):
+        self.addCleanup(importlib.reload, config)
+        with patch.dict(os.environ, {"TRIVIA_RNG_SEED": "s3cret"}):
+            self.assertEqual(importlib.reload(config).RNG_SEED, "s3cret")
+        with patch.dict(os.environ, {"TRIVIA_RNG_SEED": ""}):
+            # without one every start of the app makes up its own
+            first, second = importlib.reload(config).RNG_SEED, importlib.reload(config).RNG_SEED
+        self.assertEqual(len(first), 64)
+        self.assertNotEqual(first, second)
+
+    def test_lifelines_are_reproducible(self):
+        answers = ("Paris", "Berlin", "Madrid", "Rome")
+
+        first = (random_partition(100, rng_for(None, "ask_audience", 46)),
+                 list(move_answers(answers, rng_for(None, "ask_audience", 46))))
+        second = (random_partition(100, rng_for(None, "ask_audience", 46)),
+                  list(move_answers(answers, rng_for(None, "ask_audience", 46))))
+
+        self.assertEqual(first, second)
+        self.assertEqual(sum(first[0]), 100)
+
+    def test_friend_suggestion(self):
+        self.assertEqual(friend_suggestion(4, 2, rng_for(None, "phone_a_friend", 46)),
+                         friend_suggestion(4, 2, rng_for(None, "phone_a_friend", 46)))
+
+        suggestions = [friend_suggestion(4, 2, rng_for(None, "phone_a_friend", question_id))
+                       for question_id in range(2000)]
+        sure = [option_id == 2 for option_id, confidence in suggestions if confidence >= 80]
+        unsure = [option_id == 2 for option_id, confidence in suggestions if confidence < 50]
+
+        self.assertTrue(all(30 <= confidence <= 100 for _, confidence in suggestions))
+        # the surer the friend is, the more often the suggestion is the correct answer
+        self.assertGreater(sum(sure) / len(sure), 0.8)
+        self.assertLess(sum(unsure) / len(unsure), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,517 @@
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import db_utils
+from cache_utils import TTLCache
+from classes.game import Game
+from classes.lifeline import FiftyFifty, Lifeline, PhoneAFriend, SwitchQuestion
+from classes.room import Room
+from config import SPEED_BONUS_MAX
+from storage_utils import SQLiteStorage, get_storage, MySQLStorage
+
+QUESTION = ("What is the capital of France?", "Paris", ["Berlin", "Madrid", "Rome"])
+
+
+class TestGetStorage(unittest.TestCase):
+
+    def test_backends(self):
+        self.assertIsInstance(get_storage("mysql"), MySQLStorage)
+        self.assertIsInstance(get_storage("sqlite"), SQLiteStorage)
+        with self.assertRaises(ValueError):
+            get_storage("oracle")
+
+    def test_sqlite_with_shards(self):
+        self.assertIsInstance(get_storage("mysql", shards=["trivia_game", "trivia_game_2"]), MySQLStorage)
+        # SQLite has one database, the app refuses to start instead of failing at the first insert
+        with self.assertRaises(ValueError):
+            get_storage("sqlite", shards=["trivia_game", "trivia_game_2"])
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    """runs the real SQL of db_utils on an SQLite database"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = SQLiteStorage(self.directory.name)
+        patcher = patch('db_utils._storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def start_game(self, username="helenvu", num_questions=2):
+        player_id = db_utils.get_or_add_player_id(username)
+        game_id = db_utils.add_new_game(player_id, num_questions)
+        for _ in range(num_questions):
+            db_utils.add_new_questions(game_id, *QUESTION)
+        return game_id
+
+    def test_wal_mode(self):
+        connection = self.storage.connect("trivia_game")
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        connection.close()
+
+    def test_game(self):
+        game_id = self.start_game()
+
+        question = db_utils.display_question_to_player(game_id)
+        self.assertEqual(question["question_text"], "What is the capital of France?")
+        self.assertEqual(db_utils.get_correct_answer(question["question_id"]), "Paris")
+        stored = db_utils.get_question(question["question_id"])
+        self.assertEqual(stored[1:7], ("What is the capital of France?", "Paris", "Berlin", "Madrid", "Rome", "paris"))
+        # the order the answers were shown in is stored, so the player can answer with its position
+        self.assertEqual([stored[2:6][int(index)] for index in stored[7]], question["answers"])
+
+        # the second answer to the same question is not scored
+        self.assertTrue(db_utils.record_answer(game_id, question["question_id"], "Paris", True, 5))
+        self.assertFalse(db_utils.record_answer(game_id, question["question_id"], "Paris", True, 5))
+        self.assertEqual(db_utils.get_user_score(game_id), 1)
+        self.assertEqual(db_utils.get_answer(game_id, question["question_id"]), ("Paris", 1, 5))
+        self.assertEqual(db_utils.get_game_scores(game_id), (1, 5))
+        self.assertEqual(db_utils.get_game_progress(game_id), (2, None, None, 2, None))
+
+        db_utils.display_question_to_player(game_id)
+        self.assertEqual(db_utils.display_question_to_player(game_id), {"message": "No more questions"})
+
+    def test_answer_other_questions(self):
+        game_id = self.start_game()
+        other_game = self.start_game("kate")
+        other_question = db_utils.display_question_to_player(other_game)["question_id"]
+        question_id = db_utils.display_question_to_player(game_id)["question_id"]
+
+        # another game's question and a question that hasn't been shown yet can't be answered
+        self.assertIsNone(db_utils.record_answer(game_id, other_question, "Paris", True))
+        self.assertIsNone(db_utils.record_answer(game_id, question_id + 1, "Paris", True))
+        self.assertTrue(db_utils.record_answer(game_id, question_id, "Paris", True))
+        self.assertEqual(db_utils.get_user_score(game_id), 1)
+
+    @patch('classes.game._questions', TTLCache(max_size=10))
+    @patch('classes.game.answer_received')  # the answer times are written in the background
+    @patch('classes.game.score_ranking')
+    def test_answer_before_question_is_shown(self, mock_score_ranking, mock_answer_received):
+        game_id = self.start_game()
+        other_game = self.start_game("kate")
+
+        # a probe on a question that hasn't been shown doesn't get an answer order cached for it
+        self.assertEqual(Game.check_answer(other_game, 1, option_id=0), {"message": "Question not available"})
+        self.assertEqual(Game.check_answer(game_id, 1, option_id=0), {"message": "Question not available"})
+        question = db_utils.display_question_to_player(game_id)
+        correct_option = question["answers"].index("Paris")
+
+        self.assertEqual(Game.check_answer(game_id, question["question_id"], option_id=correct_option)["result"],
+                         "correct")
+
+    @patch('classes.game._questions', TTLCache(max_size=10))
+    @patch('classes.game.answer_received')  # the answer times are written in the background
+    @patch('classes.game.score_ranking')
+    @patch('classes.game.time_taken', return_value=(100.0, 0.0))
+    def test_speed_points(self, mock_time_taken, mock_score_ranking, mock_answer_received):
+        game_id = self.start_game()
+        question = db_utils.display_question_to_player(game_id)
+
+        result = Game.check_answer(game_id, question["question_id"], "Paris")
+
+        # an answer given straight away gets all the speed points, and a retry gets the same result
+        self.assertEqual((result["speed_points"], result["speed_score"]), (SPEED_BONUS_MAX, SPEED_BONUS_MAX))
+        mock_time_taken.return_value = (None, None)
+        self.assertEqual(Game.check_answer(game_id, question["question_id"], "Paris"), result)
+        self.assertEqual(Game.show_leaderboard(by_speed=True), [("helenvu", SPEED_BONUS_MAX)])
+
+    def test_fifty_fifty(self):
+        game_id = self.start_game()
+        question_id = db_utils.display_question_to_player(game_id)["question_id"]
+        # the next question hasn't been shown, so the lifeline can't be used on it
+        self.assertEqual(db_utils.use_lifeline(question_id + 1, "fifty_fifty"), {"message": "Lifeline not available"})
+
+        first = db_utils.display_question_to_player_fifty_fifty(question_id)
+        second = db_utils.display_question_to_player_fifty_fifty(question_id)
+
+        self.assertEqual(first, second)
+        self.assertIn("Paris", first["answers"])
+        self.assertEqual(len(first["option_ids"]), 2)
+        db_utils.record_answer(game_id, question_id, "Paris", True)
+        self.assertEqual(db_utils.use_lifeline(question_id, "fifty_fifty"), {"message": "Lifeline not available"})
+
+    @patch.object(FiftyFifty, '_results', TTLCache(max_size=10))
+    @patch.object(Lifeline, '_lifelines_left', TTLCache(max_size=10))
+    def test_fifty_fifty_is_cached(self):
+        game_id = self.start_game()
+        question_id = db_utils.display_question_to_player(game_id)["question_id"]
+
+        first = FiftyFifty.use(question_id, game_id)
+        with patch.object(self.storage, 'connect') as mock_connect:
+            second = FiftyFifty.use(question_id, game_id)
+
+        self.assertEqual(first, second)
+        mock_connect.assert_not_called()
+
+    def test_use_lifeline(self):
+        game_id = self.start_game(num_questions=3)
+        first = db_utils.display_question_to_player(game_id)["question_id"]
+
+        self.assertEqual(db_utils.use_lifeline(first, "fifty_fifty", game_id), {"game_id": game_id, "left": 1})
+        # using it again on the same question is free
+        self.assertEqual(db_utils.use_lifeline(first, "fifty_fifty"), {"game_id": game_id, "left": 1})
+        # each kind of lifeline has its own count
+        self.assertEqual(db_utils.use_lifeline(first, "ask_audience"), {"game_id": game_id, "left": 1})
+        # another game can't use its lifelines on this game's question
+        self.assertEqual(db_utils.use_lifeline(first, "fifty_fifty", game_id + 1),
+                         {"message": "Lifeline not available"})
+
+        db_utils.record_answer(game_id, first, "Paris", True)
+        second = db_utils.display_question_to_player(game_id)["question_id"]
+        self.assertEqual(db_utils.use_lifeline(second, "fifty_fifty"), {"game_id": game_id, "left": 0})
+        db_utils.record_answer(game_id, second, "Paris", True)
+        third = db_utils.display_question_to_player(game_id)["question_id"]
+        self.assertEqual(db_utils.use_lifeline(third, "fifty_fifty"), {"message": "No lifelines left"})
+
+    def test_use_lifeline_in_room(self):
+        room_id = db_utils.add_new_room(1)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        first_game = db_utils.add_new_game(db_utils.get_or_add_player_id("iryna"), 1, room_id=room_id)
+        second_game = db_utils.add_new_game(db_utils.get_or_add_player_id("kate"), 1, room_id=room_id)
+        question_id = db_utils.advance_room_question(room_id)[0]
+
+        # the questions of a room need the game that uses the lifeline
+        self.assertEqual(db_utils.use_lifeline(question_id, "fifty_fifty"), {"message": "Lifeline not available"})
+        db_utils.record_answer(first_game, question_id, "Paris", True)
+        # the question is answered for the first game only
+        self.assertEqual(db_utils.use_lifeline(question_id, "fifty_fifty", first_game),
+                         {"message": "Lifeline not available"})
+        self.assertEqual(db_utils.use_lifeline(question_id, "fifty_fifty", second_game),
+                         {"game_id": second_game, "left": 1})
+
+    @patch.object(PhoneAFriend, '_results', TTLCache(max_size=10))
+    @patch.object(Lifeline, '_lifelines_left', TTLCache(max_size=10))
+    def test_phone_a_friend(self):
+        game_id = self.start_game()
+        question = db_utils.display_question_to_player(game_id)
+
+        suggestion = PhoneAFriend.use(question["question_id"], game_id)
+
+        self.assertEqual(suggestion["answer"], question["answers"][suggestion["option_id"]])
+        # the game has one phone a friend
+        db_utils.record_answer(game_id, question["question_id"], "Paris", True)
+        next_question = db_utils.display_question_to_player(game_id)
+        self.assertEqual(PhoneAFriend.use(next_question["question_id"], game_id), {"message": "No lifelines left"})
+
+    @patch.object(SwitchQuestion, '_results', TTLCache(max_size=10))
+    @patch.object(FiftyFifty, '_results', TTLCache(max_size=10))
+    @patch.object(Lifeline, '_lifelines_left', TTLCache(max_size=10))
+    @patch('classes.lifeline.get_questions')
+    def test_switch_question(self, mock_get_questions):
+        mock_get_questions.return_value = [{"question": "What is the capital of Italy?", "correct_answer": "Rome",
+                                            "incorrect_answers": ["Berlin", "Madrid", "Paris"], "difficulty": "easy"}]
+        game_id = self.start_game()
+        question_id = db_utils.display_question_to_player(game_id)["question_id"]
+
+        switched = SwitchQuestion.use(question_id, game_id)
+
+        self.assertEqual(switched["question_text"], "What is the capital of Italy?")
+        self.assertEqual(sorted(switched["answers"]), ["Berlin", "Madrid", "Paris", "Rome"])
+        # a retry gets the same question
+        self.assertEqual(SwitchQuestion.use(question_id, game_id), switched)
+        # the switched question can't get other lifelines, the new one can
+        self.assertEqual(db_utils.use_lifeline(question_id, "fifty_fifty"), {"message": "Lifeline not available"})
+        self.assertIn("Rome", FiftyFifty.use(switched["question_id"], game_id)["answers"])
+        # the game still has two questions to answer
+        self.assertEqual(db_utils.get_game_progress(game_id), (2, None, None, 2, None))
+        self.assertEqual(db_utils.get_correct_answer(switched["question_id"]), "Rome")
+        self.assertNotEqual(db_utils.display_question_to_player(game_id)["question_id"], switched["question_id"])
+
+    @patch.object(SwitchQuestion, '_results', TTLCache(max_size=10))
+    @patch.object(Lifeline, '_lifelines_left', TTLCache(max_size=10))
+    @patch('classes.lifeline.use_lifeline', wraps=db_utils.use_lifeline)
+    @patch('classes.lifeline.get_questions')
+    def test_switch_question_fetches_before_writing(self, mock_get_questions, mock_use_lifeline):
+        mock_get_questions.return_value = [{"question": "What is the capital of Italy?", "correct_answer": "Rome",
+                                            "incorrect_answers": ["Berlin", "Madrid", "Paris"], "difficulty": "easy"}]
+        calls = MagicMock()
+        calls.attach_mock(mock_get_questions, "get_questions")
+        calls.attach_mock(mock_use_lifeline, "use_lifeline")
+        game_id = self.start_game()
+        question_id = db_utils.display_question_to_player(game_id)["question_id"]
+
+        SwitchQuestion.use(question_id, game_id)
+
+        # the API is not waited for while the lifeline taken in the db is not committed
+        self.assertEqual([name for name, _, _ in calls.mock_calls], ["get_questions", "use_lifeline"])
+
+    @patch.object(Lifeline, '_lifelines_left', TTLCache(max_size=10))
+    def test_switch_room_question(self):
+        room_id = db_utils.add_new_room(1)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        game_id = db_utils.add_new_game(db_utils.get_or_add_player_id("iryna"), 1, room_id=room_id)
+        question_id = db_utils.advance_room_question(room_id)[0]
+
+        # everybody in the room answers the same question
+        self.assertEqual(SwitchQuestion.use(question_id, game_id), {"message": "Lifeline not available"})
+
+    @patch('classes.room._room_questions', TTLCache(max_size=10))
+    def test_room_answer_order_is_stored(self):
+        room_id = db_utils.add_new_room(1)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        shown = Room.next_question(room_id)
+        correct_option = shown["answers"].index("Paris")
+
+        # another process (or a restart) has another seed, the room is still checked against what players saw
+        with patch('classes.models.answer_order_for', return_value=[3, 2, 1, 0]), \
+                patch('db_utils.answer_order_for', return_value=[3, 2, 1, 0]):
+            with patch('classes.room._room_questions', TTLCache(max_size=10)):
+                self.assertEqual(Room.current_question(room_id)["answers"], shown["answers"])
+            stored = db_utils.get_question(shown["question_id"])
+            self.assertEqual([stored[2:6][int(index)] for index in stored[7]], shown["answers"])
+            fifty_fifty = db_utils.display_question_to_player_fifty_fifty(shown["question_id"])
+            self.assertIn(correct_option, fifty_fifty["option_ids"])
+
+    @patch('classes.game.get_questions')
+    def test_next_question_of_room_game(self, mock_get_questions):
+        room_id = db_utils.add_new_room(5)
+        game_id = db_utils.add_new_game(db_utils.get_or_add_player_id("iryna"), 5, room_id=room_id)
+
+        # the room's host moves the game on, it doesn't get questions of its own
+        self.assertEqual(Game.provide_question(game_id), {"message": "Game is in a room"})
+        self.assertFalse(Game.add_next_chunk(game_id))
+        mock_get_questions.assert_not_called()
+        self.assertEqual(db_utils.get_game_progress(game_id), (5, None, None, 0, room_id))
+        # and it wasn't finished either
+        self.assertTrue(db_utils.finish_game(game_id))
+
+    @patch('classes.game.get_questions')
+    def test_long_room(self, mock_get_questions):
+        question = {"question": QUESTION[0], "correct_answer": QUESTION[1], "incorrect_answers": QUESTION[2]}
+        mock_get_questions.side_effect = lambda amount, category, difficulty: [question] * amount
+        room = Room(num_questions=120)
+
+        room_id = room.create_room()
+
+        # the API gives at most 50 questions per call
+        self.assertEqual([call.args[0] for call in mock_get_questions.call_args_list], [50, 50, 20])
+        self.assertEqual(db_utils.get_room(room_id), (120, None, None, room.host_token))
+        self.assertTrue(Room.is_host(room_id, room.host_token))
+        self.assertFalse(Room.is_host(room_id, "0" * 32))
+        self.assertFalse(Room.is_host(room_id, None))
+        self.assertFalse(Room.is_host(room_id + 1, room.host_token))
+
+    def test_leaderboards(self):
+        first_game = self.start_game("kate")
+        second_game = self.start_game("kate")
+        db_utils.update_game_score(second_game)
+
+        self.assertTrue(db_utils.finish_game(first_game))
+        self.assertTrue(db_utils.finish_game(second_game))
+        self.assertFalse(db_utils.finish_game(second_game))
+
+        self.assertEqual(db_utils.get_leaderboard(), [("kate", 1), ("kate", 0)])
+        self.assertEqual(db_utils.get_window_leaderboard("daily"), [("kate", 1), ("kate", 0)])
+        self.assertEqual(db_utils.get_window_leaderboard("weekly"), [("kate", 1), ("kate", 0)])
+        # the player is listed once, with the best game
+        self.assertEqual(db_utils.get_best_leaderboard(), [("kate", 1)])
+        self.assertEqual(db_utils.get_score_counts(), [(0, 1), (1, 1)])
+
+    def test_answer_times(self):
+        game_id = self.start_game()
+
+        db_utils.add_answer_times([(game_id, 1, 100.0, 102.5, True)])
+
+        connection = self.storage.connect("trivia_game")
+        self.assertEqual(connection.execute("SELECT time_taken_ms FROM answer_times").fetchone()[0], 2500)
+        connection.close()
+
+    def test_room(self):
+        room_id = db_utils.add_new_room(1)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        player_id = db_utils.get_or_add_player_id("iryna")
+        db_utils.add_new_game(player_id, 1, room_id=room_id)
+
+        question = db_utils.advance_room_question(room_id)
+
+        self.assertEqual(question[1], "What is the capital of France?")
+        self.assertEqual(db_utils.get_room_question(room_id), question)
+        self.assertIsNone(db_utils.advance_room_question(room_id))
+        self.assertEqual(db_utils.get_room_leaderboard(room_id), [("iryna", 0)])
+
+    def test_leaderboard_version_of_window(self):
+        game_id = self.start_game()
+        db_utils.finish_game(game_id)
+
+        connection = self.storage.connect("trivia_game")
+        window_start = connection.execute(
+            "SELECT window_start FROM leaderboard_windows WHERE window_name = 'weekly'").fetchone()[0]
+        connection.close()
+        # the version changes on the day the db starts a new window, the one finished games are added to
+        self.assertTrue(Game.leaderboard_version("weekly")[0].endswith(f"-weekly-{window_start}"))
+
+    def test_answer_after_room_moved_on(self):
+        room_id = db_utils.add_new_room(2)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        game_id = db_utils.add_new_game(db_utils.get_or_add_player_id("iryna"), 2, room_id=room_id)
+        first = db_utils.advance_room_question(room_id)[0]
+        second = db_utils.advance_room_question(room_id)[0]
+
+        # the host has shown the next question, so the first one can't be answered any more
+        self.assertIsNone(db_utils.record_answer(game_id, first, "Paris", True))
+        self.assertTrue(db_utils.record_answer(game_id, second, "Paris", True))
+        self.assertEqual(db_utils.get_user_score(game_id), 1)
+
+
+class _ShardedSQLiteStorage(SQLiteStorage):
+    """SQLite storage that gives ids like MySQL does with auto_increment_offset on each shard. Each shard is a file
+    of its own that can't see the others, like shards on different MySQL servers"""
+
+    def use_shard_ids(self, cur, shard_count, shard_index):
+        for table in ("games", "questions"):
+            next_id = (cur.execute(f"SELECT MAX(id) FROM main.{table}").fetchone()[0] or 0) + 1
+            while (next_id - 1) % shard_count != shard_index:
+                next_id += 1
+            cur.execute("DELETE FROM main.sqlite_sequence WHERE name = %s", (table,))
+            cur.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES (%s, %s)", (table, next_id - 1))
+
+
+class TestShards(unittest.TestCase):
+    """a game on the second shard, with its player, room and room questions on the main database"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = _ShardedSQLiteStorage(self.directory.name)
+        for patcher in (patch('db_utils._storage', self.storage),
+                        patch('db_utils.SHARDS', ["trivia_game", "trivia_game_2"]),
+                        patch('db_utils.random.randrange', return_value=1)):  # new games go to the second shard
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_finish_game(self):
+        player_id = db_utils.get_or_add_player_id("helenvu")
+        game_id = db_utils.add_new_game(player_id, 1)
+        db_utils.update_game_score(game_id)
+
+        self.assertEqual(game_id, 2)  # the ids of the second shard are even
+        self.assertTrue(db_utils.finish_game(game_id))
+        self.assertEqual(db_utils.get_best_leaderboard(), [("helenvu", 1)])
+        self.assertEqual(db_utils.get_window_leaderboard("daily"), [("helenvu", 1)])
+        self.assertEqual(db_utils.get_leaderboard(), [("helenvu", 1)])
+
+    def test_room_answer(self):
+        room_id = db_utils.add_new_room(1)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        game_id = db_utils.add_new_game(db_utils.get_or_add_player_id("iryna"), 1, room_id=room_id)
+        question_id = db_utils.advance_room_question(room_id)[0]
+
+        self.assertEqual(db_utils._shard_of(question_id), "trivia_game")
+        self.assertEqual(db_utils._shard_of(game_id), "trivia_game_2")
+        self.assertTrue(db_utils.record_answer(game_id, question_id, "Paris", True))
+        self.assertEqual(db_utils.get_user_score(game_id), 1)
+        self.assertEqual(db_utils.get_room_leaderboard(room_id), [("iryna", 1)])
+
+        # a player that hasn't answered yet can't once the room is on the next question
+        other_game = db_utils.add_new_game(db_utils.get_or_add_player_id("helenvu"), 1, room_id=room_id)
+        db_utils.add_new_questions(None, *QUESTION, room_id=room_id)
+        db_utils.advance_room_question(room_id)
+        self.assertIsNone(db_utils.record_answer(other_game, question_id, "Paris", True))
+
+
+class TestUnitOfWork(unittest.TestCase):
+    """the writes of a request are one transaction on one pooled connection"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = SQLiteStorage(self.directory.name)
+        for patcher in (patch('db_utils._storage', self.storage), patch('db_utils._pool', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(db_utils.end_unit_of_work, False)
+
+    def start_game(self):
+        player_id = db_utils.get_or_add_player_id("helenvu")
+        game_id = db_utils.add_new_game(player_id, 1)
+        db_utils.add_new_questions(game_id, *QUESTION)
+        return game_id
+
+    def count_games(self):
+        connection = self.storage.connect("trivia_game")
+        count = connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+        connection.close()
+        return count
+
+    def test_commit(self):
+        with patch.object(self.storage, 'connect', wraps=self.storage.connect) as mock_connect:
+            db_utils.start_unit_of_work()
+            self.start_game()
+            # nothing is committed until the unit of work ends
+            self.assertEqual(self.count_games(), 0)
+            db_utils.end_unit_of_work()
+
+        self.assertEqual(mock_connect.call_count, 2)  # the unit of work's connection and the count
+        self.assertEqual(self.count_games(), 1)
+
+    def test_rollback(self):
+        db_utils.start_unit_of_work()
+        self.start_game()
+        db_utils.end_unit_of_work(commit=False)
+
+        self.assertEqual(self.count_games(), 0)
+
+    def test_connection_is_pooled(self):
+        db_utils.start_unit_of_work()
+        db_utils.get_or_add_player_id("kate")
+        db_utils.end_unit_of_work()
+
+        with patch.object(self.storage, 'connect') as mock_connect:
+            db_utils.start_unit_of_work()
+            db_utils.get_or_add_player_id("kate")
+            db_utils.end_unit_of_work()
+
+        mock_connect.assert_not_called()
+
+
+    def test_after_commit(self):
+        callback = MagicMock()
+        db_utils.start_unit_of_work()
+        self.start_game()
+        db_utils.after_commit(callback)
+        callback.assert_not_called()
+        db_utils.end_unit_of_work()
+
+        callback.assert_called_once_with()
+
+    def test_after_commit_of_rolled_back_work(self):
+        callback = MagicMock()
+        db_utils.start_unit_of_work()
+        self.start_game()
+        db_utils.after_commit(callback)
+        db_utils.end_unit_of_work(commit=False)
+
+        callback.assert_not_called()
+
+    def test_leaderboard_version_waits_for_the_commit(self):
+        db_utils.start_unit_of_work()
+        game_id = self.start_game()
+        question_id = db_utils.display_question_to_player(game_id)["question_id"]
+        version = db_utils.get_leaderboard_version()
+        db_utils.record_answer(game_id, question_id, "Paris", True)
+        # the new score isn't committed yet, so the cached leaderboards are still up to date
+        self.assertEqual(db_utils.get_leaderboard_version(), version)
+        db_utils.end_unit_of_work()
+
+        self.assertNotEqual(db_utils.get_leaderboard_version(), version)
+
+    @patch.object(FiftyFifty, '_results', TTLCache(max_size=10))
+    @patch.object(Lifeline, '_lifelines_left', TTLCache(max_size=10))
+    def test_lifeline_of_rolled_back_work(self):
+        game_id = self.start_game()
+        question_id = db_utils.display_question_to_player(game_id)["question_id"]
+
+        db_utils.start_unit_of_work()
+        FiftyFifty.use(question_id, game_id)
+        db_utils.end_unit_of_work(commit=False)
+
+        # the lifeline wasn't used after all, so nothing about it was cached
+        self.assertIsNone(Lifeline._lifelines_left.get((str(game_id), "fifty_fifty")))
+        self.assertIsNone(FiftyFifty._results.get((str(game_id), str(question_id))))
+        self.assertEqual(db_utils.use_lifeline(question_id, "fifty_fifty", game_id), {"game_id": game_id, "left": 1})
+
+if __name__ == '__main__':
+    unittest.main()